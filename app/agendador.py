@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.config import settings
+from app.consolidacao import consolidar_dados_serpro
+from app.database import AsyncSessionLocal
+from app.gravador import gravador_clientes
+from app.models import Haylander
+from app.serpro_client import SECAO_API, contar_chamadas, serpro_client
+from app.token_cache import _FileLock
+
+# Idade máxima padrão de cada seção (horas) antes de ser atualizada
+IDADE_MAXIMA_PADRAO = {
+    "pgmei": 24.0,
+    "pgdasd": 72.0,
+    "ccmei": 720.0,
+    "caixa": 12.0,
+    "procuracoes": 168.0,
+}
+
+# Peso do risco do cliente na prioridade
+PESO_SITUACAO = {"PROBLEMAS": 3.0, "PENDENCIAS": 2.0, "OK": 1.0}
+PESO_SITUACAO_DESCONHECIDA = 1.5
+PESO_DIVIDA = 1.0
+PESO_MENSAGENS_NAO_LIDAS = 0.5
+
+# Atraso atribuído a uma seção nunca consultada
+ATRASO_NUNCA_CONSULTADA = 10.0
+
+# Peso da última atualização na média de chamadas cobradas por API
+PESO_CUSTO = 0.2
+
+API_SECAO = {api: secao for secao, api in SECAO_API.items()}
+
+
+def idades_maximas() -> Dict[str, float]:
+    """Idade máxima (horas) por seção, com os ajustes da configuração"""
+    return {**IDADE_MAXIMA_PADRAO, **settings.agendador_idade_maxima_horas}
+
+
+def peso_risco(situacao: Optional[str], tem_divida: Optional[bool], nao_lidas: Optional[int]) -> float:
+    """Peso do cliente: situação geral + dívida ativa + mensagens não lidas"""
+    peso = PESO_SITUACAO.get(situacao or "", PESO_SITUACAO_DESCONHECIDA)
+    if tem_divida:
+        peso += PESO_DIVIDA
+    if nao_lidas:
+        peso += PESO_MENSAGENS_NAO_LIDAS
+    return peso
+
+
+def secoes_vencidas(linha: Dict[str, Any], agora: datetime, maximas: Dict[str, float]) -> Dict[str, float]:
+    """Seções vencidas e seu atraso (idade / idade máxima, >= 1)"""
+    vencidas = {}
+    for secao, horas in maximas.items():
+        ultimo = linha.get(f"{secao}_ultimo_update")
+        if ultimo is None:
+            vencidas[secao] = ATRASO_NUNCA_CONSULTADA
+            continue
+        atraso = (agora - ultimo).total_seconds() / 3600 / horas
+        if atraso >= 1:
+            vencidas[secao] = atraso
+    return vencidas
+
+
+class AgendadorAtualizacao:
+    """Atualiza a carteira pelas seções vencidas, em ordem de prioridade
+    
+    A cada ciclo busca clientes com alguma seção além da idade máxima, monta
+    um heap por prioridade (maior atraso x peso de risco) e consulta só as
+    APIs das seções vencidas, respeitando o orçamento de chamadas por hora
+    (janela deslizante, distribuído entre os ciclos). O orçamento é debitado
+    pelas chamadas realmente cobradas (tentativas, hedges e fallbacks) e cada
+    API é reservada pela média observada delas. Seções que falham esperam um
+    backoff exponencial antes de voltar ao plano. Com vários workers, só
+    quem segura o lock do agendador executa.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[_FileLock] = None
+        self._chamadas: deque = deque()  # (monotonic, chamadas)
+        self._custo_por_api = 1.0
+        self._falhas: Dict[Tuple[str, str], Tuple[int, float]] = {}  # (cnpj, seção) -> (falhas, liberada em)
+        self.ciclos = 0
+        self.clientes_atualizados = 0
+        self.vencidos_ultimo_ciclo = 0
+        self.ultimo_ciclo: Optional[datetime] = None
+    
+    async def start(self):
+        if not settings.agendador_enabled:
+            return
+        self._task = asyncio.ensure_future(self._loop())
+        logger.info(
+            f"🗓️ Agendador de atualização iniciado (orçamento {settings.agendador_orcamento_hora} chamadas/h)"
+        )
+    
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock is not None:
+            self._lock.release()
+            self._lock = None
+    
+    def _lider(self) -> bool:
+        """Tenta (a cada ciclo) ser o único worker do host executando o agendador"""
+        if self._lock is None:
+            lock = _FileLock(Path(settings.agendador_lock_file))
+            if not lock.try_acquire():
+                return False
+            self._lock = lock
+            logger.info("🗓️ Este worker assumiu o agendador de atualização")
+        return True
+    
+    def chamadas_ultima_hora(self) -> int:
+        limite = time.monotonic() - 3600
+        while self._chamadas and self._chamadas[0][0] < limite:
+            self._chamadas.popleft()
+        return sum(chamadas for _, chamadas in self._chamadas)
+    
+    def _orcamento_ciclo(self) -> int:
+        """Chamadas permitidas neste ciclo: fatia do orçamento horário, limitada ao que resta na janela"""
+        fatia = math.ceil(settings.agendador_orcamento_hora * settings.agendador_intervalo_seconds / 3600)
+        restante = settings.agendador_orcamento_hora - self.chamadas_ultima_hora()
+        return max(min(fatia, restante), 0)
+    
+    async def _loop(self):
+        while True:
+            try:
+                if self._lider():
+                    await self.executar_ciclo()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no agendador de atualização: {e}")
+            await asyncio.sleep(settings.agendador_intervalo_seconds)
+    
+    def _candidatos(self, db: Session) -> List[Dict[str, Any]]:
+        """Clientes com ao menos uma seção vencida (mais antigos primeiro)"""
+        agora = datetime.now()
+        vencida = or_(*[
+            or_(getattr(Haylander, f"{secao}_ultimo_update").is_(None),
+                getattr(Haylander, f"{secao}_ultimo_update") < agora - timedelta(hours=horas))
+            for secao, horas in idades_maximas().items()
+        ])
+        colunas = [getattr(Haylander, f"{secao}_ultimo_update") for secao in SECAO_API]
+        stmt = (
+            select(
+                Haylander.cnpj, Haylander.situacao_geral, Haylander.pgmei_tem_divida,
+                Haylander.caixa_mensagens_nao_lidas, *colunas
+            )
+            .where(vencida)
+            .order_by(Haylander.ultima_consulta.asc().nulls_first(), Haylander.id)
+            .limit(settings.agendador_candidatos)
+        )
+        return [dict(linha) for linha in db.execute(stmt).mappings()]
+    
+    def planejar(self, candidatos: List[Dict[str, Any]], orcamento: int) -> List[Tuple[str, List[str]]]:
+        """Escolhe (cnpj, APIs) por prioridade até esgotar o orçamento de chamadas"""
+        agora = datetime.now()
+        maximas = idades_maximas()
+        heap = []
+        for linha in candidatos:
+            vencidas = {
+                secao: atraso for secao, atraso in secoes_vencidas(linha, agora, maximas).items()
+                if not self._em_backoff(linha["cnpj"], secao)
+            }
+            if not vencidas:
+                continue
+            peso = peso_risco(linha["situacao_geral"], linha["pgmei_tem_divida"], linha["caixa_mensagens_nao_lidas"])
+            heapq.heappush(heap, (-max(vencidas.values()) * peso, linha["cnpj"], sorted(vencidas)))
+        self.vencidos_ultimo_ciclo = len(heap)
+        
+        plano = []
+        while heap and orcamento > 0:
+            _, cnpj, secoes = heapq.heappop(heap)
+            apis = [SECAO_API[secao] for secao in secoes if secao in SECAO_API]
+            custo = math.ceil(len(apis) * self._custo_por_api)
+            if custo > orcamento:
+                continue
+            plano.append((cnpj, apis))
+            orcamento -= custo
+        return plano
+    
+    def _em_backoff(self, cnpj: str, secao: str) -> bool:
+        falha = self._falhas.get((cnpj, secao))
+        return falha is not None and time.monotonic() < falha[1]
+    
+    def _registrar_resultado(self, cnpj: str, secoes: List[str], falhas: List[str]):
+        """Backoff exponencial por (cnpj, seção): dobra a cada falha seguida, zera no sucesso"""
+        agora = time.monotonic()
+        for secao in secoes:
+            chave = (cnpj, secao)
+            if secao not in falhas:
+                self._falhas.pop(chave, None)
+                continue
+            seguidas = self._falhas.get(chave, (0, 0.0))[0] + 1
+            espera = min(
+                settings.agendador_backoff_seconds * 2 ** (seguidas - 1), settings.agendador_backoff_max_seconds
+            )
+            self._falhas[chave] = (seguidas, agora + espera)
+    
+    async def executar_ciclo(self):
+        """Um ciclo: seleciona, prioriza e atualiza dentro do orçamento"""
+        self.ciclos += 1
+        self.ultimo_ciclo = datetime.now()
+        orcamento = self._orcamento_ciclo()
+        if orcamento <= 0:
+            return
+        
+        async with AsyncSessionLocal() as db:
+            candidatos = await db.run_sync(self._candidatos)
+        plano = self.planejar(candidatos, orcamento)
+        if not plano:
+            return
+        
+        logger.info(
+            f"🗓️ Agendador: atualizando {len(plano)} de {self.vencidos_ultimo_ciclo} clientes vencidos "
+            f"(~{math.ceil(sum(len(apis) for _, apis in plano) * self._custo_por_api)} chamadas previstas)"
+        )
+        semaforo = asyncio.Semaphore(settings.agendador_concorrencia)
+        
+        async def atualizar(cnpj: str, apis: List[str]):
+            async with semaforo:
+                await self._atualizar(cnpj, apis)
+        
+        await asyncio.gather(*[atualizar(cnpj, apis) for cnpj, apis in plano])
+    
+    async def _atualizar(self, cnpj: str, apis: List[str]):
+        secoes = [API_SECAO[api] for api in apis]
+        with contar_chamadas() as contador:
+            try:
+                dados_apis = await serpro_client.consultar_todas_apis(cnpj, apis=apis)
+                falhas = [API_SECAO[api] for api in dados_apis["_meta"]["falhas"] if api in API_SECAO]
+                self._registrar_resultado(cnpj, secoes, falhas)
+                await gravador_clientes.salvar(cnpj, consolidar_dados_serpro(cnpj, dados_apis))
+                self.clientes_atualizados += 1
+            except Exception as e:
+                self._registrar_resultado(cnpj, secoes, secoes)
+                logger.error(f"🗓️ Agendador: erro ao atualizar CNPJ {cnpj}: {e}")
+            finally:
+                # Debita o que o SERPRO cobrou (respostas do cache são de graça), mesmo se falhou
+                self._chamadas.append((time.monotonic(), contador.total))
+                self._custo_por_api += PESO_CUSTO * (max(contador.total / len(apis), 1.0) - self._custo_por_api)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estado do agendador para o /health"""
+        return {
+            "habilitado": settings.agendador_enabled,
+            "lider": self._lock is not None,
+            "ciclos": self.ciclos,
+            "ultimo_ciclo": self.ultimo_ciclo,
+            "vencidos_ultimo_ciclo": self.vencidos_ultimo_ciclo,
+            "clientes_atualizados": self.clientes_atualizados,
+            "chamadas_ultima_hora": self.chamadas_ultima_hora(),
+            "chamadas_por_api": round(self._custo_por_api, 2),
+            "secoes_em_backoff": sum(1 for _, liberada_em in self._falhas.values() if liberada_em > time.monotonic()),
+            "orcamento_hora": settings.agendador_orcamento_hora
+        }
+
+
+# Instância global do agendador
+agendador = AgendadorAtualizacao()
@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.config import settings
+from app.perfil import tarefa_sem_perfil
+from app.database import AsyncSessionLocal, insert_upsert
+from app.models import PayloadConsulta, PayloadSerpro
+
+try:
+    import zstandard
+except ImportError:  # Opcional: sem zstandard o arquivo usa gzip
+    zstandard = None
+
+
+def codec_arquivo() -> str:
+    """Codec das novas gravações: zstd se configurado e instalado, senão gzip"""
+    if settings.arquivo_compressao == "zstd" and zstandard is not None:
+        return "zstd"
+    return "gzip"
+
+
+def serializar(payload: Any) -> bytes:
+    """JSON canônico (chaves ordenadas): o mesmo conteúdo sempre gera o mesmo hash"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+def compactar(dados: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(dados)
+    return gzip.compress(dados, compresslevel=6, mtime=0)
+
+
+def carregar_payload(codec: str, conteudo: bytes) -> Any:
+    """Descomprime e decodifica um payload arquivado"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Payload arquivado em zstd: instale o pacote 'zstandard'")
+        dados = zstandard.ZstdDecompressor().decompress(conteudo)
+    elif codec == "gzip":
+        dados = gzip.decompress(conteudo)
+    else:
+        dados = conteudo
+    return json.loads(dados)
+
+
+def preparar_lote(
+    lote: List[Tuple[str, str, datetime, Any]], codec: str
+) -> Tuple[Dict[str, dict], List[dict]]:
+    """Serializa, calcula o hash e comprime cada conteúdo distinto do lote"""
+    conteudos: Dict[str, dict] = {}
+    registros = []
+    agora = datetime.now()
+    for cnpj, api, obtido_em, payload in lote:
+        dados = serializar(payload)
+        chave = hashlib.sha256(dados).hexdigest()
+        if chave not in conteudos:
+            conteudo, codec_usado = compactar(dados, codec), codec
+            if len(conteudo) >= len(dados):
+                # Respostas pequenas (ex.: {"status": "not_found"}) crescem com o cabeçalho do codec
+                conteudo, codec_usado = dados, "json"
+            conteudos[chave] = {
+                "hash": chave,
+                "codec": codec_usado,
+                "conteudo": conteudo,
+                "tamanho": len(dados),
+                "created_at": agora
+            }
+        registros.append({"cnpj": cnpj, "api": api, "hash": chave, "obtido_em": obtido_em})
+    return conteudos, registros
+
+
+def gravar_payloads(db: Session, conteudos: Dict[str, dict], registros: List[dict]) -> List[str]:
+    """Grava os conteúdos ainda não arquivados e um registro por resposta; retorna os hashes novos"""
+    existentes = set(db.scalars(select(PayloadSerpro.hash).where(PayloadSerpro.hash.in_(list(conteudos)))))
+    novos = [conteudo for chave, conteudo in conteudos.items() if chave not in existentes]
+    if novos:
+        insert_dialeto = insert_upsert(db)
+        if insert_dialeto is not None:
+            # Outro worker pode ter gravado o mesmo conteúdo entre o SELECT e o INSERT
+            db.execute(insert_dialeto(PayloadSerpro).on_conflict_do_nothing(index_elements=["hash"]), novos)
+        else:
+            db.execute(insert(PayloadSerpro), novos)
+    db.execute(insert(PayloadConsulta), registros)
+    db.commit()
+    return [conteudo["hash"] for conteudo in novos]
+
+
+class ArquivoPayloads:
+    """Arquivo append-only das respostas brutas SERPRO
+    
+    Cada resposta obtida do SERPRO (as servidas pelo cache já foram
+    arquivadas) entra num buffer; a cada `arquivo_lote_max` payloads ou
+    `arquivo_lote_ms` o lote é serializado e comprimido fora do event loop e
+    gravado numa única transação. O conteúdo fica em serpro_payload, uma
+    linha por hash (respostas repetidas não ocupam espaço de novo), e
+    serpro_payload_consulta registra CNPJ, API e data de cada resposta.
+    """
+    
+    def __init__(self):
+        self._pendentes: List[Tuple[str, str, datetime, Any]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._gravacoes: set = set()
+        self.payloads = 0
+        self.conteudos_novos = 0
+        self.bytes_json = 0
+        self.bytes_comprimidos = 0
+        self.erros = 0
+    
+    def registrar(self, cnpj: str, api: str, payload: Dict[str, Any], obtido_em: Optional[datetime] = None):
+        """Agenda o arquivamento de uma resposta (falhas de transporte não são arquivadas)"""
+        if not settings.arquivo_enabled or payload.get("status") == "error":
+            return
+        self._pendentes.append((cnpj, api, obtido_em or datetime.now(), payload))
+        
+        if len(self._pendentes) >= settings.arquivo_lote_max:
+            self._disparar()
+        elif self._timer is None:
+            self._timer = tarefa_sem_perfil(self._aguardar_janela())
+    
+    async def _aguardar_janela(self):
+        await asyncio.sleep(settings.arquivo_lote_ms / 1000)
+        self._timer = None
+        self._disparar()
+    
+    def _disparar(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if not self._pendentes:
+            return
+        lote, self._pendentes = self._pendentes, []
+        tarefa = tarefa_sem_perfil(self._gravar(lote))
+        self._gravacoes.add(tarefa)
+        tarefa.add_done_callback(self._gravacoes.discard)
+    
+    async def _gravar(self, lote: List[Tuple[str, str, datetime, Any]]):
+        try:
+            conteudos, registros = await asyncio.to_thread(preparar_lote, lote, codec_arquivo())
+            async with AsyncSessionLocal() as db:
+                novos = await db.run_sync(gravar_payloads, conteudos, registros)
+        except Exception as e:
+            # O arquivo nunca derruba a consulta: só perde este lote
+            self.erros += len(lote)
+            logger.error(f"🗄️ Erro ao arquivar {len(lote)} payloads SERPRO: {e}")
+            return
+        
+        self.payloads += len(registros)
+        self.conteudos_novos += len(novos)
+        self.bytes_json += sum(conteudos[chave]["tamanho"] for chave in novos)
+        self.bytes_comprimidos += sum(len(conteudos[chave]["conteudo"]) for chave in novos)
+    
+    async def close(self):
+        """Grava o que estiver pendente (shutdown)"""
+        self._disparar()
+        if self._gravacoes:
+            await asyncio.gather(*self._gravacoes, return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Payloads arquivados, deduplicação e compressão (desde o início do processo)"""
+        return {
+            "habilitado": settings.arquivo_enabled,
+            "codec": codec_arquivo(),
+            "payloads": self.payloads,
+            "conteudos_novos": self.conteudos_novos,
+            "deduplicados": self.payloads - self.conteudos_novos,
+            "taxa_compressao": round(self.bytes_json / self.bytes_comprimidos, 2) if self.bytes_comprimidos else 0.0,
+            "pendentes": len(self._pendentes),
+            "erros": self.erros
+        }
+
+
+# Instância global do arquivo
+arquivo_payloads = ArquivoPayloads()
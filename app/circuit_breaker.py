@@ -0,0 +1,110 @@
+import time
+from typing import Any, Dict, Optional
+from loguru import logger
+
+from app.config import settings
+
+
+class CircuitoAbertoError(Exception):
+    """Chamada recusada porque o circuito do endpoint está aberto"""
+
+
+def caminho_endpoint(endpoint: str) -> str:
+    """Caminho do endpoint sem o CNPJ ("/caixa-postal/mensagens/123" -> "/caixa-postal/mensagens")"""
+    return endpoint.rsplit("/", 1)[0] or endpoint
+
+
+class CircuitBreaker:
+    """Circuit breaker de um endpoint SERPRO
+    
+    FECHADO: chamadas normais; após N falhas consecutivas abre.
+    ABERTO: chamadas falham na hora até passar o tempo de espera.
+    SEMI_ABERTO: uma chamada de teste por vez; sucesso fecha, falha reabre.
+    """
+    
+    FECHADO = "FECHADO"
+    ABERTO = "ABERTO"
+    SEMI_ABERTO = "SEMI_ABERTO"
+    
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self.aberto_em: Optional[float] = None
+        self.teste_em_andamento = False
+        self.rejeitadas = 0
+        self.aberturas = 0
+    
+    def verificar(self):
+        """Levanta CircuitoAbertoError se a chamada não deve ser feita"""
+        if self.estado == self.FECHADO:
+            return
+        
+        if self.estado == self.ABERTO:
+            if time.monotonic() - self.aberto_em < settings.circuit_breaker_espera_seconds:
+                self.rejeitadas += 1
+                raise CircuitoAbertoError(f"Circuito aberto para {self.nome}")
+            self.estado = self.SEMI_ABERTO
+            self.teste_em_andamento = False
+            logger.info(f"🔌 Circuito {self.nome}: SEMI_ABERTO, liberando chamada de teste")
+        
+        if self.teste_em_andamento:
+            self.rejeitadas += 1
+            raise CircuitoAbertoError(f"Circuito semiaberto para {self.nome}, teste em andamento")
+        self.teste_em_andamento = True
+    
+    def registrar_sucesso(self):
+        if self.estado != self.FECHADO:
+            logger.success(f"🔌 Circuito {self.nome}: FECHADO")
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self.teste_em_andamento = False
+    
+    def registrar_falha(self):
+        self.falhas_consecutivas += 1
+        self.teste_em_andamento = False
+        if self.estado == self.SEMI_ABERTO or self.falhas_consecutivas >= settings.circuit_breaker_falhas:
+            if self.estado != self.ABERTO:
+                self.aberturas += 1
+                logger.error(
+                    f"🔌 Circuito {self.nome}: ABERTO após {self.falhas_consecutivas} falhas "
+                    f"(espera {settings.circuit_breaker_espera_seconds}s)"
+                )
+            self.estado = self.ABERTO
+            self.aberto_em = time.monotonic()
+    
+    def registrar_cancelamento(self):
+        """Chamada cancelada antes da resposta: libera o teste sem contar falha"""
+        self.teste_em_andamento = False
+    
+    def status(self) -> Dict[str, Any]:
+        restante = None
+        if self.estado == self.ABERTO:
+            restante = max(settings.circuit_breaker_espera_seconds - (time.monotonic() - self.aberto_em), 0)
+        return {
+            "estado": self.estado,
+            "falhas_consecutivas": self.falhas_consecutivas,
+            "aberturas": self.aberturas,
+            "rejeitadas": self.rejeitadas,
+            "reabre_em_segundos": round(restante, 1) if restante is not None else None
+        }
+
+
+class CircuitBreakers:
+    """Um circuit breaker por caminho de endpoint"""
+    
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+    
+    def obter(self, endpoint: str) -> CircuitBreaker:
+        caminho = caminho_endpoint(endpoint)
+        if caminho not in self._breakers:
+            self._breakers[caminho] = CircuitBreaker(caminho)
+        return self._breakers[caminho]
+    
+    def status(self) -> Dict[str, Any]:
+        return {caminho: breaker.status() for caminho, breaker in sorted(self._breakers.items())}
+
+
+# Instância global dos circuit breakers
+circuit_breakers = CircuitBreakers()
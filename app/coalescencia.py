@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from loguru import logger
+
+from app.config import settings
+
+
+class SingleFlight:
+    """Coalescência de chamadas concorrentes pela mesma chave
+    
+    Enquanto uma execução está em andamento, novas chamadas com a mesma chave
+    aguardam o mesmo resultado em vez de executar de novo. Resultados de sucesso
+    continuam valendo por `janela` segundos para quem chegar logo depois.
+    A execução é cancelada se todos que a aguardam forem cancelados (ex.:
+    clientes HTTP que desconectaram).
+    """
+    
+    def __init__(self, nome: str, janela: float):
+        self.nome = nome
+        self.janela = janela
+        self._em_voo: Dict[Hashable, asyncio.Future] = {}
+        self._recentes: Dict[Hashable, Tuple[float, Any]] = {}
+        self._aguardando: Dict[asyncio.Future, int] = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+        self.reaproveitadas = 0
+        self.canceladas = 0
+    
+    def _recente(self, chave: Hashable):
+        entrada = self._recentes.get(chave)
+        if entrada is None:
+            return None
+        if time.monotonic() - entrada[0] > self.janela:
+            del self._recentes[chave]
+            return None
+        return entrada
+    
+    def _limpar_recentes(self):
+        limite = time.monotonic() - self.janela
+        for chave in [c for c, (concluido_em, _) in self._recentes.items() if concluido_em < limite]:
+            del self._recentes[chave]
+    
+    async def executar(
+        self, chave: Hashable, fabrica: Callable[[], Awaitable[Any]], reaproveitar: bool = True
+    ) -> Tuple[Any, bool]:
+        """Executa `fabrica()` uma única vez por chave; retorna (resultado, compartilhado)
+        
+        reaproveitar=False ignora resultados já concluídos na janela, mas ainda
+        aguarda uma execução em andamento com a mesma chave: o que muda a
+        execução (ex.: ignorar o cache) precisa fazer parte da chave.
+        """
+        if reaproveitar:
+            entrada = self._recente(chave)
+            if entrada is not None:
+                self.reaproveitadas += 1
+                logger.debug(f"♻️ {self.nome} {chave}: resultado recente reaproveitado")
+                return entrada[1], True
+        
+        futuro = self._em_voo.get(chave)
+        if futuro is not None:
+            self.coalescidas += 1
+            logger.info(f"🔗 {self.nome} {chave}: aguardando execução em andamento")
+            return await self._aguardar(futuro), True
+        
+        self.execucoes += 1
+        futuro = asyncio.ensure_future(self._executar(chave, fabrica))
+        self._em_voo[chave] = futuro
+        return await self._aguardar(futuro), False
+    
+    async def _aguardar(self, futuro: asyncio.Future) -> Any:
+        """Aguarda a execução compartilhada; ela só é cancelada quando todos que aguardam desistem"""
+        self._aguardando[futuro] = self._aguardando.get(futuro, 0) + 1
+        try:
+            # shield: cancelar quem aguarda não cancela a execução dos demais
+            return await asyncio.shield(futuro)
+        except asyncio.CancelledError:
+            if self._aguardando[futuro] == 1 and not futuro.done():
+                self.canceladas += 1
+                futuro.cancel()
+            raise
+        finally:
+            self._aguardando[futuro] -= 1
+            if not self._aguardando[futuro]:
+                del self._aguardando[futuro]
+    
+    async def _executar(self, chave: Hashable, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            resultado = await fabrica()
+        finally:
+            self._em_voo.pop(chave, None)
+        
+        if self.janela > 0:
+            self._limpar_recentes()
+            self._recentes[chave] = (time.monotonic(), resultado)
+        return resultado
+    
+    def stats(self) -> Dict[str, Any]:
+        """Execuções reais e chamadas economizadas (coalescidas + reaproveitadas)"""
+        self._limpar_recentes()
+        return {
+            "execucoes": self.execucoes,
+            "coalescidas": self.coalescidas,
+            "reaproveitadas": self.reaproveitadas,
+            "canceladas": self.canceladas,
+            "economizadas": self.coalescidas + self.reaproveitadas,
+            "em_andamento": len(self._em_voo),
+            "janela_segundos": self.janela
+        }
+
+
+# Instância global para consultas completas por CNPJ
+consultas_em_voo = SingleFlight("consulta", settings.coalescencia_janela_seconds)
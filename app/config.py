@@ -1,5 +1,6 @@
 from pydantic import BaseSettings
 from pathlib import Path
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -7,13 +8,19 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite:///./bot_ecac.db"
+    sqlite_perfil: str = "padrao"  # "producao": WAL, synchronous=NORMAL, busy_timeout, mmap e cache
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size_mb: int = 256
+    sqlite_cache_size_mb: int = 64
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
     
     # SERPRO Integra Contador
     serpro_consumer_key: str
     serpro_consumer_secret: str
     serpro_base_url: str = "https://gateway.apiserpro.serpro.gov.br/integra-contador/v1"
     serpro_token_url: str = "https://gateway.apiserpro.serpro.gov.br/token"
-    serpro_ambiente: str = "producao"  # producao ou homologacao
+    serpro_ambiente: str = "producao"  # producao, homologacao ou simulado (benchmarks/serpro_simulado.py)
     
     # Certificado Digital
     certificado_path: str = "./certs/certificado.pfx"
@@ -27,12 +34,109 @@ class Settings(BaseSettings):
     
     # Cache e Performance
     token_cache_minutes: int = 55  # Margem de 5 min do token de 1h
-    request_timeout_seconds: int = 30
+    token_refresh_margin_seconds: int = 600  # Renovação proativa antes de expirar
+    token_refresh_retry_seconds: int = 30
+    token_persist: bool = True  # Persistir token no token_cache.json
+    request_timeout_seconds: int = 30  # Por tentativa (cortado ao que resta do prazo da consulta)
     max_retries: int = 3
+    retry_backoff_base_seconds: float = 1.0  # Backoff exponencial com jitter entre tentativas
+    retry_backoff_max_seconds: float = 20.0  # Teto do backoff (Retry-After do SERPRO prevalece)
+    
+    # Consulta paralela (fan-out)
+    api_timeout_seconds: float = 45.0  # Limite por API, incluindo retries
+    consulta_deadline_seconds: float = 60.0  # Limite total da consulta completa
+    
+    # Consulta em lote
+    lote_concorrencia: int = 5
+    lote_max_concorrencia: int = 20
+    lote_batch_size: int = 50  # Registros por transação
+    lote_max_cnpjs: int = 10000
+    
+    # Fila persistente de consultas (tabela consulta_fila)
+    fila_concorrencia: int = 10  # Itens simultâneos por processo
+    fila_max_tentativas: int = 3
+    fila_backoff_seconds: int = 30  # Espera antes de nova tentativa (dobra a cada falha)
+    fila_lease_seconds: int = 300  # Deve ser maior que consulta_deadline_seconds
+    fila_poll_seconds: float = 2.0
+    fila_flush_seconds: float = 2.0
+    
+    # Rate limit e concorrência adaptativa (famílias: pgmei, pgdasd, ccmei, caixa-postal, procuracoes)
+    rate_limit_global_rps: float = 20.0  # 0 = sem limite
+    rate_limit_familia_padrao_rps: float = 5.0
+    rate_limit_familias_rps: Dict[str, float] = {}  # Ex.: {"caixa-postal": 10}
+    concorrencia_max_padrao: int = 10
+    concorrencia_max_familias: Dict[str, int] = {}  # Ex.: {"procuracoes": 2}
+    concorrencia_min: int = 1
+    concorrencia_latencia_alvo_ms: float = 5000.0
+    concorrencia_fator_corte: float = 0.5
+    concorrencia_janela_corte_seconds: float = 2.0
+    
+    # Circuit breaker por endpoint
+    circuit_breaker_falhas: int = 5  # Falhas consecutivas para abrir
+    circuit_breaker_espera_seconds: float = 60.0  # Tempo aberto antes da chamada de teste
+    
+    # Cache de respostas SERPRO por API e CNPJ
+    cache_enabled: bool = True
+    cache_ttl_seconds: Dict[str, int] = {}  # Sobrescreve TTLs padrão, ex.: {"caixa_postal": 600}
+    cache_max_entradas: int = 50000
+    cache_sqlite_path: Optional[str] = None  # Ex.: ./data/serpro_cache.db
+    
+    # Coalescência de consultas simultâneas do mesmo CNPJ
+    coalescencia_janela_seconds: float = 5.0  # Reaproveita o resultado recém-concluído
+    
+    # Gravação em micro-lotes das consultas individuais (upsert único por lote)
+    gravacao_lote_max: int = 50  # Registros por lote
+    gravacao_lote_ms: float = 20.0  # Espera máxima antes de gravar
+    
+    # Arquivo de respostas brutas SERPRO (reconsolidação offline: python -m app.reconsolidar)
+    arquivo_enabled: bool = True
+    arquivo_compressao: str = "zstd"  # "zstd" (pacote zstandard) ou "gzip"
+    arquivo_lote_max: int = 200  # Payloads por gravação
+    arquivo_lote_ms: float = 500.0  # Espera máxima antes de gravar
+    
+    # Agendador de atualização da carteira (idade das seções x risco, com orçamento de chamadas)
+    agendador_enabled: bool = False
+    agendador_orcamento_hora: int = 600  # Chamadas SERPRO por hora
+    agendador_intervalo_seconds: float = 60.0
+    agendador_concorrencia: int = 2
+    agendador_candidatos: int = 500  # Clientes avaliados por ciclo
+    agendador_idade_maxima_horas: Dict[str, float] = {}  # Sobrescreve os padrões, ex.: {"caixa": 6}
+    agendador_lock_file: str = "agendador.lock"  # Só um worker por host executa o agendador
+    agendador_backoff_seconds: float = 300.0  # Espera após a 1ª falha de uma seção (dobra a cada falha)
+    agendador_backoff_max_seconds: float = 21600.0
+    
+    # Pool HTTP (conexões persistentes com o gateway SERPRO)
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry_seconds: float = 30.0
+    http2_enabled: bool = False  # Requer o pacote "h2"
+    
+    # Hedge: segunda chamada idêntica quando a primeira passa do percentil de latência da família
+    hedge_enabled: bool = False
+    hedge_percentil: float = 95.0
+    hedge_orcamento: float = 0.05  # Chamadas extras por chamada (5%: limita a cobrança adicional)
+    hedge_min_amostras: int = 20  # Latências observadas antes de disparar hedges na família
+    hedge_min_ms: float = 200.0  # Espera mínima antes do hedge
+    hedge_janela: int = 200  # Latências recentes usadas no percentil
+    
+    # Perfil por requisição (header X-Perfil ou amostragem; GET /debug/perfis)
+    perfil_enabled: bool = False
+    perfil_amostragem: float = 0.0  # Fração das requisições perfiladas sem o header
+    perfil_lento_ms: float = 5000.0  # Só requisições acima disso vão para o buffer
+    perfil_buffer_max: int = 100
+    perfil_cprofile_amostragem: float = 0.0  # Fração das perfiladas que roda também sob cProfile
+    perfil_cprofile_max: int = 5  # Capturas cProfile mantidas (as mais lentas)
     
     # Logging
     log_level: str = "INFO"
     log_file: str = "./logs/bot_ecac.log"
+    log_modo: str = "fila"  # fila (thread escritor, não bloqueia o event loop) ou direto (sink síncrono do loguru)
+    log_formato: str = "texto"  # texto ou json (uma linha JSON por registro)
+    log_fila_max: int = 10000
+    log_fila_cheia: str = "descartar"  # descartar, descartar_antigas ou bloquear (ERROR nunca é descartado)
+    log_amostragem_tentativas: float = 1.0  # Fração das linhas INFO/DEBUG por tentativa HTTP gravadas
+    log_rotacao_mb: int = 10
+    log_retencao_dias: int = 30
     
     class Config:
         env_file = ".env"
@@ -43,6 +147,12 @@ class Settings(BaseSettings):
 # URLs baseadas no ambiente
 def get_serpro_urls(ambiente: str = "homologacao"):
     """Retorna URLs baseadas no ambiente"""
+    if ambiente == "simulado":
+        # Simulador local (benchmarks/serpro_simulado.py): SERPRO_BASE_URL e SERPRO_TOKEN_URL
+        return {
+            "base_url": settings.serpro_base_url,
+            "token_url": settings.serpro_token_url
+        }
     if ambiente == "homologacao":
         return {
             "base_url": "https://gateway.apiserpro.serpro.gov.br/integra-contador/v1",
@@ -0,0 +1,207 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from app.metricas import consolidacao_segundos
+from app.perfil import span
+
+
+# Seções do registro Haylander (prefixo das colunas *_ultimo_update)
+SECOES = ("pgmei", "pgdasd", "ccmei", "caixa", "procuracoes")
+
+
+def _estado_api(dados: Optional[dict]) -> str:
+    """"ausente" (não consultada), "falhou" (erro, timeout, circuito aberto) ou "ok" """
+    if dados is None:
+        return "ausente"
+    if dados.get("status") == "error":
+        return "falhou"
+    return "ok"
+
+
+def resposta_vazia(dados: Optional[dict]) -> bool:
+    """API sem dados aproveitáveis (ausente, falhou ou vazia): aciona o fallback"""
+    return _estado_api(dados) != "ok" or not dados
+
+
+def _obtido_em(dados_apis: dict, api: str, padrao: datetime) -> datetime:
+    """Data da resposta: a do cache quando veio de lá, senão a da consulta"""
+    return dados_apis.get("_meta", {}).get("obtido_em", {}).get(api) or padrao
+
+
+def calcular_situacao_geral(
+    pgmei_valor: Any, pgmei_tem_divida: Any, pgdasd_count: Any, caixa_nao_lidas: Any
+) -> Tuple[str, Decimal]:
+    """Situação geral e valor total pendente a partir dos valores das seções"""
+    pgmei_valor = float(pgmei_valor or 0)
+    pgdasd_count = pgdasd_count or 0
+    caixa_nao_lidas = caixa_nao_lidas or 0
+    
+    valor_total = pgmei_valor
+    situacao_geral = "OK"
+    
+    if pgmei_tem_divida or pgdasd_count > 0 or caixa_nao_lidas > 0:
+        situacao_geral = "PENDENCIAS"
+    
+    if pgmei_valor > 1000 or pgdasd_count > 3:
+        situacao_geral = "PROBLEMAS"
+    
+    return situacao_geral, Decimal(str(valor_total))
+
+
+def registro_parcial(dados: Dict[str, Any]) -> bool:
+    """Indica se o registro consolidado não traz todas as seções atualizadas"""
+    return any(f"{secao}_ultimo_update" not in dados for secao in SECOES)
+
+
+def mesclar_secoes_desatualizadas(anteriores: Optional[str], dados: Dict[str, Any]) -> str:
+    """Seções desatualizadas depois de gravar `dados` sobre um registro que tinha `anteriores`
+    
+    Uma seção só sai da lista quando foi consultada de novo com sucesso.
+    """
+    pendentes = set(filter(None, (anteriores or "").split(",")))
+    pendentes |= set(filter(None, (dados.get("secoes_desatualizadas") or "").split(",")))
+    return ",".join(secao for secao in SECOES if secao in pendentes and f"{secao}_ultimo_update" not in dados)
+
+
+def status_da_consulta(dados: Dict[str, Any], desatualizadas: str) -> str:
+    """ERROR (nada atualizado), PARCIAL (alguma seção desatualizada) ou SUCCESS"""
+    consultadas = any(f"{secao}_ultimo_update" in dados for secao in SECOES)
+    if not consultadas and desatualizadas:
+        return "ERROR"
+    return "PARCIAL" if desatualizadas else "SUCCESS"
+
+
+def consolidar_dados_serpro(cnpj: str, dados_apis: dict) -> dict:
+    """Consolida dados das APIs SERPRO em estrutura simples
+    
+    Seções cuja API falhou (erro, timeout ou circuito aberto) ficam fora do
+    resultado, mantendo os valores anteriores do registro, e são listadas em
+    "secoes_desatualizadas". Seções não consultadas também ficam de fora.
+    """
+    with consolidacao_segundos.medir(), span("consolidacao", "consolidacao"):
+        return _consolidar(cnpj, dados_apis)
+
+
+def _consolidar(cnpj: str, dados_apis: dict) -> dict:
+    agora = datetime.now()
+    resultado: Dict[str, Any] = {}
+    desatualizadas = []
+    
+    # Extrair dados PGMEI
+    pgmei_data = dados_apis.get("pgmei_divida")
+    pgmei_valor = 0.00
+    pgmei_tem_divida = False
+    estado = _estado_api(pgmei_data)
+    
+    if estado == "ok":
+        if pgmei_data.get("status") != "not_found":
+            # Processar dados de dívida (estrutura pode variar)
+            dividas = pgmei_data.get("dividas", [])
+            if dividas:
+                pgmei_valor = sum(float(d.get("valor", 0)) for d in dividas)
+                pgmei_tem_divida = pgmei_valor > 0
+        resultado.update({
+            "pgmei_divida_valor": Decimal(str(pgmei_valor)),
+            "pgmei_tem_divida": pgmei_tem_divida,
+            "pgmei_ultimo_update": _obtido_em(dados_apis, "pgmei_divida", agora),
+        })
+    elif estado == "falhou":
+        desatualizadas.append("pgmei")
+    
+    # Extrair dados PGDASD
+    pgdasd_data = dados_apis.get("pgdasd_declaracoes")
+    pgdasd_count = 0
+    pgdasd_anos = ""
+    estado = _estado_api(pgdasd_data)
+    
+    if estado == "ok":
+        if pgdasd_data.get("status") != "not_found":
+            declaracoes = pgdasd_data.get("declaracoes_pendentes", [])
+            pgdasd_count = len(declaracoes)
+            anos_list = [str(d.get("ano", "")) for d in declaracoes if d.get("ano")]
+            pgdasd_anos = ",".join(anos_list)
+        resultado.update({
+            "pgdasd_pendentes_count": pgdasd_count,
+            "pgdasd_anos_pendentes": pgdasd_anos,
+            "pgdasd_ultimo_update": _obtido_em(dados_apis, "pgdasd_declaracoes", agora),
+        })
+    elif estado == "falhou":
+        desatualizadas.append("pgdasd")
+    
+    # Extrair dados CCMEI (situação cadastral como fallback dos dados)
+    ccmei_api = "ccmei_dados"
+    ccmei_data = dados_apis.get("ccmei_dados")
+    if resposta_vazia(ccmei_data) and "ccmei_situacao" in dados_apis:
+        ccmei_api = "ccmei_situacao"
+        ccmei_data = dados_apis["ccmei_situacao"]
+    ccmei_situacao = "Não informada"
+    ccmei_abertura = None
+    estado = _estado_api(ccmei_data)
+    
+    if estado == "ok":
+        if ccmei_data.get("status") != "not_found":
+            ccmei_situacao = ccmei_data.get("situacao", "Ativa")
+            abertura_str = ccmei_data.get("data_abertura")
+            if abertura_str:
+                try:
+                    ccmei_abertura = datetime.fromisoformat(abertura_str.replace("Z", "+00:00"))
+                except:
+                    pass
+        resultado.update({
+            "ccmei_situacao": ccmei_situacao,
+            "ccmei_data_abertura": ccmei_abertura,
+            "ccmei_ultimo_update": _obtido_em(dados_apis, ccmei_api, agora),
+        })
+    elif estado == "falhou":
+        desatualizadas.append("ccmei")
+    
+    # Extrair dados Caixa Postal
+    caixa_data = dados_apis.get("caixa_postal")
+    caixa_count = 0
+    caixa_nao_lidas = 0
+    estado = _estado_api(caixa_data)
+    
+    if estado == "ok":
+        if caixa_data.get("status") != "not_found":
+            mensagens = caixa_data.get("mensagens", [])
+            caixa_count = len(mensagens)
+            caixa_nao_lidas = len([m for m in mensagens if not m.get("lida", True)])
+        resultado.update({
+            "caixa_mensagens_count": caixa_count,
+            "caixa_mensagens_nao_lidas": caixa_nao_lidas,
+            "caixa_ultimo_update": _obtido_em(dados_apis, "caixa_postal", agora),
+        })
+    elif estado == "falhou":
+        desatualizadas.append("caixa")
+    
+    # Extrair dados Procurações
+    proc_data = dados_apis.get("procuracoes")
+    proc_ativas = 0
+    estado = _estado_api(proc_data)
+    
+    if estado == "ok":
+        if proc_data.get("status") != "not_found":
+            procuracoes = proc_data.get("procuracoes", [])
+            proc_ativas = len([p for p in procuracoes if p.get("ativa", False)])
+        resultado.update({
+            "procuracoes_ativas": proc_ativas,
+            "procuracoes_ultimo_update": _obtido_em(dados_apis, "procuracoes", agora),
+        })
+    elif estado == "falhou":
+        desatualizadas.append("procuracoes")
+    
+    # Calcular situação geral (recalculada com os valores anteriores em registros parciais)
+    situacao_geral, valor_total = calcular_situacao_geral(
+        pgmei_valor, pgmei_tem_divida, pgdasd_count, caixa_nao_lidas
+    )
+    
+    # Em registros parciais, desatualizadas, status e ultima_consulta são mesclados com o gravado (crud)
+    resultado.update({
+        "situacao_geral": situacao_geral,
+        "valor_total_pendente": valor_total,
+        "secoes_desatualizadas": ",".join(desatualizadas),
+        "ultima_consulta": agora,
+        "status_consulta": status_da_consulta(resultado, ",".join(desatualizadas))
+    })
+    return resultado
\ No newline at end of file
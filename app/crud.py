@@ -0,0 +1,213 @@
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, or_
+from sqlalchemy.orm import Session
+
+from app.database import insert_upsert
+from app.models import Haylander
+from app.consolidacao import (
+    SECOES, calcular_situacao_geral, mesclar_secoes_desatualizadas, registro_parcial, status_da_consulta
+)
+from app.resumo import atualizar_resumo, linhas_resumo
+from app.schemas import FiltrosClientes
+
+
+# Linhas por INSERT (limite de parâmetros do SQLite: ~25 colunas x 500 linhas)
+UPSERT_LINHAS_POR_COMANDO = 500
+
+
+def _recalcular_situacao(cliente: Haylander):
+    """Seções desatualizadas mantêm os valores anteriores: recalcular a situação geral
+    
+    Sem nenhuma seção preenchida (primeira consulta com todas as APIs falhando)
+    não há situação: fica None (SEM_SITUACAO no resumo), não "OK".
+    """
+    if not any(getattr(cliente, f"{secao}_ultimo_update") for secao in SECOES):
+        cliente.situacao_geral = None
+        return
+    cliente.situacao_geral, cliente.valor_total_pendente = calcular_situacao_geral(
+        cliente.pgmei_divida_valor,
+        cliente.pgmei_tem_divida,
+        cliente.pgdasd_pendentes_count,
+        cliente.caixa_mensagens_nao_lidas
+    )
+
+
+def _mesclar_consulta(
+    cliente: Haylander, dados: dict, anterior: Tuple[Optional[str], Optional[datetime]] = (None, None)
+):
+    """Registro parcial: só as seções consultadas de novo com sucesso saem de secoes_desatualizadas
+    
+    ultima_consulta passa a ser a data da seção mais antiga (o cliente está
+    atualizado até ali); enquanto alguma seção nunca foi consultada, mantém o valor anterior.
+    """
+    if "status_consulta" not in dados:
+        return  # Sem dados da consulta (reconsolidação): mantém os gravados
+    desatualizadas_antes, ultima_antes = anterior
+    cliente.secoes_desatualizadas = mesclar_secoes_desatualizadas(desatualizadas_antes, dados)
+    cliente.status_consulta = status_da_consulta(dados, cliente.secoes_desatualizadas)
+    datas = [getattr(cliente, f"{secao}_ultimo_update") for secao in SECOES]
+    cliente.ultima_consulta = min(datas) if all(datas) else ultima_antes
+
+
+def _consultas_anteriores(db: Session, cnpjs: List[str]) -> Dict[str, Tuple[Optional[str], Optional[datetime]]]:
+    """secoes_desatualizadas e ultima_consulta gravados (lidos sob o lock de escrita de linhas_resumo)"""
+    if not cnpjs:
+        return {}
+    linhas = db.query(Haylander.cnpj, Haylander.secoes_desatualizadas, Haylander.ultima_consulta).filter(
+        Haylander.cnpj.in_(cnpjs)
+    )
+    return {cnpj: (desatualizadas, ultima) for cnpj, desatualizadas, ultima in linhas}
+
+
+def salvar_clientes(db: Session, consolidados: Dict[str, dict], commit: bool = True) -> List[Haylander]:
+    """Cria ou atualiza vários registros Haylander em uma única transação
+    
+    Usa INSERT ... ON CONFLICT(cnpj) DO UPDATE ... RETURNING (SQLite e
+    PostgreSQL): um comando por grupo de registros com as mesmas colunas, sem
+    SELECT prévio nem refresh. Com commit=False a gravação entra na transação
+    do chamador. Retorna os registros na ordem de `consolidados`.
+    """
+    if not consolidados:
+        return []
+    
+    insert = insert_upsert(db)
+    if insert is None:
+        return _salvar_clientes_orm(db, consolidados, commit)
+    
+    antes = linhas_resumo(db, consolidados)
+    anteriores = _consultas_anteriores(db, [cnpj for cnpj, dados in consolidados.items() if registro_parcial(dados)])
+    agora = datetime.now()
+    grupos: Dict[Tuple[str, ...], List[dict]] = {}
+    for cnpj, dados in consolidados.items():
+        linha = {**dados, "cnpj": cnpj, "created_at": agora, "updated_at": agora}
+        grupos.setdefault(tuple(sorted(dados)), []).append(linha)
+    
+    por_cnpj: Dict[str, Haylander] = {}
+    for campos, linhas in grupos.items():
+        for inicio in range(0, len(linhas), UPSERT_LINHAS_POR_COMANDO):
+            stmt = insert(Haylander).values(linhas[inicio:inicio + UPSERT_LINHAS_POR_COMANDO])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Haylander.cnpj],
+                set_={campo: stmt.excluded[campo] for campo in (*campos, "updated_at")}
+            ).returning(Haylander)
+            for cliente in db.scalars(stmt, execution_options={"populate_existing": True}):
+                por_cnpj[cliente.cnpj] = cliente
+    
+    clientes = []
+    for cnpj, dados in consolidados.items():
+        cliente: Optional[Haylander] = por_cnpj.get(cnpj)
+        if cliente is not None and registro_parcial(dados):
+            # Atualizado pelo flush do commit, só quando algo muda
+            _recalcular_situacao(cliente)
+            _mesclar_consulta(cliente, dados, anteriores.get(cnpj, (None, None)))
+        clientes.append(cliente)
+    
+    atualizar_resumo(db, antes.values(), clientes)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return clientes
+
+
+def _salvar_clientes_orm(db: Session, consolidados: Dict[str, dict], commit: bool) -> List[Haylander]:
+    """Caminho genérico (bancos sem ON CONFLICT): SELECT em bloco + insert/update pelo ORM"""
+    antes = linhas_resumo(db, consolidados)
+    existentes = {
+        cliente.cnpj: cliente
+        for cliente in db.query(Haylander).filter(Haylander.cnpj.in_(list(consolidados))).all()
+    }
+    
+    clientes = []
+    agora = datetime.now()
+    for cnpj, dados in consolidados.items():
+        cliente = existentes.get(cnpj)
+        anterior = (cliente.secoes_desatualizadas, cliente.ultima_consulta) if cliente else (None, None)
+        if cliente:
+            # Atualizar registro existente
+            for campo, valor in dados.items():
+                setattr(cliente, campo, valor)
+            cliente.updated_at = agora
+        else:
+            # Criar novo registro
+            cliente = Haylander(cnpj=cnpj, created_at=agora, **dados)
+            db.add(cliente)
+        
+        if registro_parcial(dados):
+            _recalcular_situacao(cliente)
+            _mesclar_consulta(cliente, dados, anterior)
+        clientes.append(cliente)
+    
+    atualizar_resumo(db, antes.values(), clientes)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return clientes
+
+
+def remover_cliente(db: Session, cnpj: str) -> bool:
+    """Remove o cliente (descontando-o do resumo); False se não existir"""
+    antes = linhas_resumo(db, [cnpj])
+    if not antes:
+        return False
+    db.query(Haylander).filter(Haylander.cnpj == cnpj).delete(synchronize_session=False)
+    atualizar_resumo(db, antes.values(), [])
+    db.commit()
+    return True
+
+
+def marcar_erro_consulta(db: Session, cnpjs: Iterable[str], commit: bool = True):
+    """Marca status ERROR nos clientes já existentes"""
+    cnpjs = list(cnpjs)
+    if not cnpjs:
+        return
+    
+    db.query(Haylander).filter(Haylander.cnpj.in_(cnpjs)).update(
+        {"status_consulta": "ERROR", "ultima_consulta": datetime.now()},
+        synchronize_session=False
+    )
+    if commit:
+        db.commit()
+
+
+def filtrar_clientes(stmt: Select, filtros: FiltrosClientes) -> Select:
+    """Aplica os filtros da listagem
+    
+    Os de igualdade têm índice composto com id (já na ordem do cursor); os de
+    faixa (valor_min/valor_max, desatualizado_horas) filtram a varredura por id.
+    """
+    if filtros.situacao_geral:
+        stmt = stmt.where(Haylander.situacao_geral == filtros.situacao_geral)
+    if filtros.status_consulta:
+        stmt = stmt.where(Haylander.status_consulta == filtros.status_consulta)
+    if filtros.pgmei_tem_divida is not None:
+        stmt = stmt.where(Haylander.pgmei_tem_divida == filtros.pgmei_tem_divida)
+    if filtros.valor_min is not None:
+        stmt = stmt.where(Haylander.valor_total_pendente >= filtros.valor_min)
+    if filtros.valor_max is not None:
+        stmt = stmt.where(Haylander.valor_total_pendente <= filtros.valor_max)
+    if filtros.desatualizado_horas is not None:
+        limite = datetime.now() - timedelta(hours=filtros.desatualizado_horas)
+        stmt = stmt.where(or_(Haylander.ultima_consulta.is_(None), Haylander.ultima_consulta < limite))
+    return stmt
+
+
+def codificar_cursor(ultimo_id: int) -> str:
+    """Cursor opaco da próxima página (último id entregue)"""
+    return base64.urlsafe_b64encode(f"id:{ultimo_id}".encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> int:
+    """Último id entregue a partir do cursor; ValueError se inválido"""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefixo, ultimo_id = texto.split(":", 1)
+        if prefixo != "id":
+            raise ValueError(prefixo)
+        return int(ultimo_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
\ No newline at end of file
@@ -1,17 +1,141 @@
-from sqlalchemy import create_engine
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
+from app.metricas import db_comando_segundos, db_commit_segundos
+from app.perfil import registrar_span
 
-# Criar engine SQLite
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False}  # Necessário para SQLite
-)
+# Operações SQL com série própria em db_comando_segundos (as demais: "OUTRO")
+OPERACOES_SQL = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA"}
+
+# Driver assíncrono por banco (requer aiosqlite / asyncpg)
+DRIVERS_ASYNC = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _url_async(database_url: str) -> str:
+    """URL do banco com o driver assíncrono ("sqlite:///x.db" -> "sqlite+aiosqlite:///x.db")"""
+    url = make_url(database_url)
+    if url.drivername in DRIVERS_ASYNC:
+        url = url.set(drivername=DRIVERS_ASYNC[url.drivername])
+    return url.render_as_string(hide_password=False)
+
+
+def pragmas_sqlite(perfil: str) -> Dict[str, Any]:
+    """PRAGMAs aplicados em cada conexão SQLite do perfil"""
+    if perfil != "producao":
+        return {}
+    return {
+        "journal_mode": "WAL",  # Leitores não bloqueiam (nem são bloqueados por) o escritor
+        "synchronous": "NORMAL",  # fsync só no checkpoint do WAL
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "mmap_size": settings.sqlite_mmap_size_mb * 1024 * 1024,
+        "cache_size": -settings.sqlite_cache_size_mb * 1024,  # Negativo = KiB
+        "temp_store": "MEMORY",
+    }
+
+
+def opcoes_engine(database_url: str, perfil: str) -> Dict[str, Any]:
+    """Argumentos de create_engine/create_async_engine para a URL e o perfil"""
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
+    
+    opcoes: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}  # Necessário para SQLite
+    if perfil == "producao" and url.database not in (None, "", ":memory:"):
+        opcoes.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow)
+    return opcoes
+
+
+def aplicar_pragmas(sync_engine: Engine, perfil: str):
+    """Executa os PRAGMAs do perfil a cada nova conexão do pool"""
+    pragmas = pragmas_sqlite(perfil)
+    if not pragmas or sync_engine.dialect.name != "sqlite":
+        return
+    
+    @event.listens_for(sync_engine, "connect")
+    def _ao_conectar(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+        cursor.close()
+
+
+def instrumentar_engine(sync_engine: Engine):
+    """Mede cada comando SQL do engine (db_comando_segundos, por operação, e span da requisição perfilada)"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _antes_comando(conn, cursor, statement, parameters, context, executemany):
+        conn.info["inicio_comando"] = time.perf_counter()
+    
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _depois_comando(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info.pop("inicio_comando", None)
+        if inicio is not None:
+            fim = time.perf_counter()
+            operacao = statement.lstrip()[:6].upper()
+            operacao = operacao if operacao in OPERACOES_SQL else "OUTRO"
+            db_comando_segundos.observe(fim - inicio, operacao)
+            registrar_span(operacao, "db", inicio, fim, sql=statement[:200])
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_commit(session):
+    session.info["inicio_commit"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _depois_commit(session):
+    """Tempo do commit, incluindo o flush pendente (db_commit_segundos)"""
+    inicio = session.info.pop("inicio_commit", None)
+    if inicio is not None:
+        db_commit_segundos.observe(time.perf_counter() - inicio)
+
+
+def ler_pragmas(conn) -> Dict[str, Any]:
+    """Valores efetivos dos PRAGMAs do perfil produção (para o /health)"""
+    if conn.dialect.name != "sqlite":
+        return {}
+    return {
+        nome: conn.exec_driver_sql(f"PRAGMA {nome}").scalar()
+        for nome in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size", "temp_store")
+    }
+
+
+def status_banco(db) -> Dict[str, Any]:
+    """Perfil, PRAGMAs efetivos e ocupação do pool (chamar via AsyncSession.run_sync)"""
+    return {
+        "perfil": settings.sqlite_perfil,
+        "pragmas": ler_pragmas(db.connection()),
+        "pool": async_engine.pool.status()
+    }
+
+
+# Engine síncrona (init_db, migrações e código legado)
+engine = create_engine(settings.database_url, **opcoes_engine(settings.database_url, settings.sqlite_perfil))
+aplicar_pragmas(engine, settings.sqlite_perfil)
+instrumentar_engine(engine)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrona: I/O do banco sem bloquear o event loop
+async_engine = create_async_engine(
+    _url_async(settings.database_url), **opcoes_engine(settings.database_url, settings.sqlite_perfil)
+)
+aplicar_pragmas(async_engine.sync_engine, settings.sqlite_perfil)
+instrumentar_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # Base para modelos
 Base = declarative_base()
 
@@ -25,6 +149,69 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Dependency para obter sessão assíncrona do banco"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def insert_upsert(db):
+    """insert() com ON CONFLICT do dialeto da sessão (None se o banco não suportar)"""
+    dialeto = db.get_bind().dialect.name
+    if dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+def reservar_escrita(db: Session):
+    """Lock de escrita antes de ler valores que a própria transação vai reescrever
+    
+    O pysqlite só abre a transação no primeiro INSERT/UPDATE: um SELECT antes
+    dele lê fora dela. No SQLite a transação começa com BEGIN IMMEDIATE (um
+    escritor por vez); nos demais bancos a leitura usa SELECT ... FOR UPDATE.
+    """
+    conexao = db.connection()
+    if conexao.dialect.name != "sqlite":
+        return
+    dbapi = conexao.connection.dbapi_connection
+    dbapi = getattr(dbapi, "_connection", dbapi)  # aiosqlite: a conexão sqlite3 por trás do adaptador
+    if not dbapi.in_transaction:
+        conexao.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+# Índices que saíram dos modelos: só custavam escrita (filtros de faixa não os usam com a paginação por id)
+INDICES_REMOVIDOS = {"haylander": ("ix_haylander_valor_id", "ix_haylander_ultima_consulta_id")}
+
+
+def _migrar_schema():
+    """Adiciona colunas e índices novos em tabelas já existentes (create_all não faz isso)"""
+    inspector = inspect(engine)
+    for tabela in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabela.name):
+            continue
+        
+        existentes = {coluna["name"] for coluna in inspector.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name not in existentes:
+                tipo = coluna.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}"))
+        
+        for indice in tabela.indexes:
+            indice.create(bind=engine, checkfirst=True)
+        
+        indices = {indice["name"] for indice in inspector.get_indexes(tabela.name)}
+        for nome in INDICES_REMOVIDOS.get(tabela.name, ()):
+            if nome in indices:
+                with engine.begin() as conn:
+                    conn.execute(text(f"DROP INDEX {nome}"))
+
+
 def init_db():
     """Inicializar banco de dados - criar tabelas"""
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    _migrar_schema() 
\ No newline at end of file
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List
+
+from sqlalchemy import select
+
+from app.crud import filtrar_clientes
+from app.database import AsyncSessionLocal
+from app.models import Haylander
+from app.schemas import FiltrosClientes, HaylanderResponse
+
+# Linhas lidas por ida ao banco e tamanho mínimo de cada pedaço enviado
+LINHAS_POR_LOTE = 1000
+TAMANHO_PEDACO = 64 * 1024
+
+# Mesmas colunas (e ordem) da resposta de /cliente/{cnpj}
+COLUNAS: List[str] = list(HaylanderResponse.__fields__)
+
+
+def _valor_json(valor: Any) -> Any:
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _linha_ndjson(linha: Dict[str, Any]) -> str:
+    return json.dumps({coluna: _valor_json(linha[coluna]) for coluna in COLUNAS}, ensure_ascii=False) + "\n"
+
+
+async def exportar_clientes(filtros: FiltrosClientes, formato: str, comprimir: bool) -> AsyncIterator[bytes]:
+    """Gera a exportação em pedaços a partir de um cursor no banco (memória constante)
+    
+    formato: "ndjson" (um objeto JSON por linha) ou "csv" (com cabeçalho).
+    comprimir=True aplica gzip em streaming.
+    """
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if comprimir else None
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer) if formato == "csv" else None
+    if escritor:
+        escritor.writerow(COLUNAS)
+    
+    def pedaco(final: bool = False) -> bytes:
+        dados = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if gzip:
+            dados = gzip.compress(dados) + (gzip.flush() if final else b"")
+        return dados
+    
+    colunas = [Haylander.__table__.c[coluna] for coluna in COLUNAS]
+    stmt = filtrar_clientes(select(*colunas), filtros).order_by(Haylander.id)
+    
+    async with AsyncSessionLocal() as db:
+        resultado = await db.stream(stmt.execution_options(yield_per=LINHAS_POR_LOTE))
+        async for linha in resultado.mappings():
+            if escritor:
+                escritor.writerow([_valor_json(linha[coluna]) for coluna in COLUNAS])
+            else:
+                buffer.write(_linha_ndjson(linha))
+            
+            if buffer.tell() >= TAMANHO_PEDACO:
+                dados = pedaco()
+                if dados:
+                    yield dados
+    
+    yield pedaco(final=True)
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.config import settings
+from app.consolidacao import consolidar_dados_serpro
+from app.crud import marcar_erro_consulta, salvar_clientes
+from app.database import AsyncSessionLocal
+from app.models import ConsultaFila, ConsultaLote
+from app.serpro_client import serpro_client, tentativas_por_chamada
+
+
+class FilaWorker:
+    """Consome a fila persistente de consultas (tabela consulta_fila)
+    
+    Cada item é reservado com um lease (owner + expiração) por compare-and-set,
+    então vários processos podem drenar a mesma fila sem chamadas duplicadas ao
+    SERPRO. Itens de um worker que morreu voltam para a fila quando o lease
+    expira. O retry fica no item (tentativas + proxima_tentativa_em), não em
+    sleeps dentro de _make_request.
+    """
+    
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._loop_task: Optional[asyncio.Task] = None
+        self._em_execucao: Dict[asyncio.Task, Tuple[int, str]] = {}
+        self._concluidos: Dict[int, Tuple[str, str, dict, dict]] = {}
+        self._falhas: Dict[int, Tuple[str, str, str]] = {}
+        self._ultima_gravacao = time.monotonic()
+    
+    async def start(self):
+        """Inicia o consumo da fila (retoma itens pendentes de execuções anteriores)"""
+        async with AsyncSessionLocal() as db:
+            pendentes = await db.scalar(
+                select(func.count(ConsultaFila.id)).where(ConsultaFila.status.in_(["PENDENTE", "EXECUTANDO"]))
+            )
+        if pendentes:
+            logger.info(f"📥 Fila de consultas: retomando {pendentes} itens pendentes")
+        
+        self._loop_task = asyncio.ensure_future(self._loop())
+        logger.info(f"📥 Worker da fila iniciado ({self.owner})")
+    
+    async def close(self):
+        """Para o worker, grava o que já foi consultado e devolve os leases"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        
+        interrompidos = list(self._em_execucao.values())
+        for task in list(self._em_execucao):
+            task.cancel()
+        if self._em_execucao:
+            await asyncio.gather(*self._em_execucao, return_exceptions=True)
+        self._em_execucao.clear()
+        
+        await self._gravar()
+        await self._liberar_leases([item_id for item_id, _ in interrompidos])
+    
+    async def _loop(self):
+        while True:
+            try:
+                livres = settings.fila_concorrencia - len(self._em_execucao)
+                reservados = await self._reservar(livres) if livres > 0 else []
+                for item_id, lote_id, cnpj in reservados:
+                    task = asyncio.ensure_future(self._processar(item_id, lote_id, cnpj))
+                    self._em_execucao[task] = (item_id, lote_id)
+                    task.add_done_callback(lambda t: self._em_execucao.pop(t, None))
+                
+                await self._gravar_se_necessario()
+                
+                if self._em_execucao:
+                    await asyncio.wait(
+                        list(self._em_execucao),
+                        timeout=settings.fila_poll_seconds,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                elif not reservados:
+                    await asyncio.sleep(settings.fila_poll_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no worker da fila: {e}")
+                await asyncio.sleep(settings.fila_poll_seconds)
+    
+    async def _reservar(self, limite: int) -> List[Tuple[int, str, str]]:
+        """Reserva até `limite` itens disponíveis via compare-and-set do lease"""
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(self._reservar_itens, limite)
+    
+    def _reservar_itens(self, db: Session, limite: int) -> List[Tuple[int, str, str]]:
+        """Parte síncrona de _reservar (executada via run_sync)"""
+        agora = datetime.now()
+        disponivel = or_(
+            and_(
+                ConsultaFila.status == "PENDENTE",
+                or_(ConsultaFila.proxima_tentativa_em.is_(None), ConsultaFila.proxima_tentativa_em <= agora)
+            ),
+            and_(ConsultaFila.status == "EXECUTANDO", ConsultaFila.lease_expira_em < agora)
+        )
+        candidatos = (
+            db.query(ConsultaFila.id, ConsultaFila.lote_id, ConsultaFila.cnpj,
+                     ConsultaFila.status, ConsultaFila.tentativas)
+            .filter(disponivel)
+            .order_by(ConsultaFila.id)
+            .limit(limite * 4)
+            .all()
+        )
+        if not candidatos:
+            return []
+        
+        lotes = {
+            lote.id: lote
+            for lote in db.query(ConsultaLote).filter(
+                ConsultaLote.id.in_({c.lote_id for c in candidatos})
+            )
+        }
+        por_lote: Dict[str, int] = {}
+        for _, lote_id in self._em_execucao.values():
+            por_lote[lote_id] = por_lote.get(lote_id, 0) + 1
+        
+        reservados = []
+        lotes_afetados: Set[str] = set()
+        for candidato in candidatos:
+            if len(reservados) >= limite:
+                break
+            lote = lotes.get(candidato.lote_id)
+            concorrencia = lote.concorrencia if lote else settings.lote_concorrencia
+            if por_lote.get(candidato.lote_id, 0) >= concorrencia:
+                continue
+            
+            # Compare-and-set: a condição é reavaliada no UPDATE (outro worker pode ter reservado antes)
+            condicao = db.query(ConsultaFila).filter(ConsultaFila.id == candidato.id, disponivel)
+            
+            # Lease expirado após esgotar as tentativas: worker morreu repetidamente neste item
+            if candidato.status == "EXECUTANDO" and candidato.tentativas >= settings.fila_max_tentativas:
+                condicao.update({
+                    "status": "FALHOU",
+                    "ultimo_erro": "Lease expirado após o máximo de tentativas",
+                    "lease_owner": None,
+                    "lease_expira_em": None,
+                    "updated_at": agora
+                }, synchronize_session=False)
+                lotes_afetados.add(candidato.lote_id)
+                continue
+            
+            atualizados = condicao.update({
+                "status": "EXECUTANDO",
+                "lease_owner": self.owner,
+                "lease_expira_em": agora + timedelta(seconds=settings.fila_lease_seconds),
+                "tentativas": ConsultaFila.tentativas + 1,
+                "updated_at": agora
+            }, synchronize_session=False)
+            
+            if atualizados == 1:
+                reservados.append((candidato.id, candidato.lote_id, candidato.cnpj))
+                por_lote[candidato.lote_id] = por_lote.get(candidato.lote_id, 0) + 1
+                if lote and lote.iniciado_em is None:
+                    lote.iniciado_em = agora
+                    lote.status = "EXECUTANDO"
+        # Um commit para o bloco inteiro de reservas
+        db.commit()
+        
+        if lotes_afetados:
+            self._finalizar_lotes(db, lotes_afetados)
+        return reservados
+    
+    async def _processar(self, item_id: int, lote_id: str, cnpj: str):
+        """Consulta um CNPJ; o resultado fica em memória até a próxima gravação em bloco"""
+        try:
+            # Uma tentativa por chamada: o retry é reagendado na fila
+            with tentativas_por_chamada(1):
+                dados_apis = await serpro_client.consultar_todas_apis(cnpj)
+            
+            meta = dados_apis["_meta"]
+            if meta["falhas"] and len(meta["falhas"]) == len(meta["latencias_ms"]) and not meta["cache_hits"]:
+                raise Exception(f"Todas as APIs falharam: {', '.join(meta['falhas'])}")
+            
+            dados = consolidar_dados_serpro(cnpj, dados_apis)
+            resumo = {"situacao_geral": dados["situacao_geral"], "falhas_api": meta["falhas"]}
+            self._concluidos[item_id] = (lote_id, cnpj, dados, resumo)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Fila: CNPJ {cnpj}: {e}")
+            self._falhas[item_id] = (lote_id, cnpj, str(e))
+    
+    async def _gravar_se_necessario(self):
+        """Grava a cada lote_batch_size resultados ou a cada fila_flush_seconds"""
+        pendentes = len(self._concluidos) + len(self._falhas)
+        if not pendentes:
+            return
+        if (
+            pendentes >= settings.lote_batch_size
+            or time.monotonic() - self._ultima_gravacao >= settings.fila_flush_seconds
+            or not self._em_execucao
+        ):
+            await self._gravar()
+    
+    async def _gravar(self):
+        """Grava Haylander e o estado dos itens na mesma transação"""
+        self._ultima_gravacao = time.monotonic()
+        if not self._concluidos and not self._falhas:
+            return
+        
+        concluidos, self._concluidos = self._concluidos, {}
+        falhas, self._falhas = self._falhas, {}
+        
+        # shield: cancelar o loop no shutdown não descarta um bloco já retirado da memória
+        await asyncio.shield(self._salvar_bloco(concluidos, falhas))
+    
+    async def _salvar_bloco(self, concluidos: Dict[int, tuple], falhas: Dict[int, tuple]):
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.run_sync(self._gravar_bloco, concluidos, falhas)
+            except Exception as e:
+                await db.rollback()
+                # Os itens continuam com lease e voltam para a fila quando ele expirar
+                logger.error(f"Erro ao gravar bloco da fila ({len(concluidos)} ok, {len(falhas)} falhas): {e}")
+    
+    def _do_lease(self, db: Session, item_id: int):
+        """Item ainda reservado por este worker (o lease pode ter expirado e passado a outro)"""
+        return db.query(ConsultaFila).filter(
+            ConsultaFila.id == item_id,
+            ConsultaFila.lease_owner == self.owner,
+            ConsultaFila.status == "EXECUTANDO"
+        )
+    
+    def _gravar_bloco(self, db: Session, concluidos: Dict[int, tuple], falhas: Dict[int, tuple]):
+        """Parte síncrona de _gravar (executada via run_sync)
+        
+        Só grava os itens cujo lease ainda é deste worker; os demais já foram
+        (ou serão) gravados por quem os reservou depois.
+        """
+        agora = datetime.now()
+        gravados = 0
+        clientes = {}
+        for item_id, (_, cnpj, dados, resumo) in concluidos.items():
+            atualizados = self._do_lease(db, item_id).update({
+                "status": "CONCLUIDO",
+                "resultado": json.dumps(resumo),
+                "ultimo_erro": None,
+                "lease_owner": None,
+                "lease_expira_em": None,
+                "updated_at": agora
+            }, synchronize_session=False)
+            if atualizados == 1:
+                gravados += 1
+                clientes[cnpj] = dados
+        salvar_clientes(db, clientes, commit=False)
+        
+        tentativas = dict(
+            db.query(ConsultaFila.id, ConsultaFila.tentativas)
+            .filter(ConsultaFila.id.in_(list(falhas)))
+            .all()
+        ) if falhas else {}
+        esgotados = []
+        for item_id, (_, cnpj, erro) in falhas.items():
+            feitas = tentativas.get(item_id, 1) or 1
+            if feitas >= settings.fila_max_tentativas:
+                valores = {"status": "FALHOU"}
+            else:
+                espera = settings.fila_backoff_seconds * 2 ** (feitas - 1)
+                valores = {"status": "PENDENTE", "proxima_tentativa_em": agora + timedelta(seconds=espera)}
+            valores.update({
+                "ultimo_erro": erro,
+                "lease_owner": None,
+                "lease_expira_em": None,
+                "updated_at": agora
+            })
+            if self._do_lease(db, item_id).update(valores, synchronize_session=False) == 1:
+                gravados += 1
+                if valores["status"] == "FALHOU":
+                    esgotados.append(cnpj)
+        marcar_erro_consulta(db, esgotados, commit=False)
+        db.commit()
+        
+        perdidos = len(concluidos) + len(falhas) - gravados
+        if perdidos:
+            logger.warning(f"📥 Fila: {perdidos} itens com lease expirado descartados (reservados por outro worker)")
+        
+        lotes = {lote_id for lote_id, *_ in concluidos.values()}
+        lotes |= {lote_id for lote_id, *_ in falhas.values()}
+        self._finalizar_lotes(db, lotes)
+    
+    def _finalizar_lotes(self, db: Session, lote_ids: Set[str]):
+        """Marca como concluídos os lotes sem itens pendentes ou em execução"""
+        agora = datetime.now()
+        for lote_id in lote_ids:
+            abertos = db.query(ConsultaFila).filter(
+                ConsultaFila.lote_id == lote_id,
+                ConsultaFila.status.in_(["PENDENTE", "EXECUTANDO"])
+            ).count()
+            if abertos == 0:
+                db.query(ConsultaLote).filter(
+                    ConsultaLote.id == lote_id, ConsultaLote.status != "CONCLUIDO"
+                ).update({"status": "CONCLUIDO", "finalizado_em": agora}, synchronize_session=False)
+                logger.success(f"📦 Lote {lote_id} concluído")
+        db.commit()
+    
+    async def _liberar_leases(self, item_ids: List[int]):
+        """Devolve à fila os itens interrompidos no shutdown, sem gastar tentativa"""
+        if not item_ids:
+            return
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ConsultaFila)
+                .where(
+                    ConsultaFila.id.in_(item_ids),
+                    ConsultaFila.lease_owner == self.owner,
+                    ConsultaFila.status == "EXECUTANDO"
+                )
+                .values(
+                    status="PENDENTE",
+                    tentativas=ConsultaFila.tentativas - 1,
+                    lease_owner=None,
+                    lease_expira_em=None,
+                    updated_at=datetime.now()
+                )
+            )
+            await db.commit()
+            logger.info(f"📥 {len(item_ids)} itens devolvidos à fila")
+
+
+# Instância global do worker da fila
+fila_worker = FilaWorker()
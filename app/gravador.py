@@ -0,0 +1,107 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from app.config import settings
+from app.perfil import tarefa_sem_perfil
+from app.consolidacao import mesclar_secoes_desatualizadas, status_da_consulta
+from app.crud import salvar_clientes
+from app.database import AsyncSessionLocal
+from app.models import Haylander
+
+
+class GravadorClientes:
+    """Micro-lotes de gravação das consultas individuais
+    
+    Registros consolidados se acumulam por até `gravacao_lote_ms` (ou até
+    `gravacao_lote_max` registros) e são gravados com um único upsert e um
+    único commit. Cada chamador recebe o registro gravado do seu CNPJ.
+    """
+    
+    def __init__(self):
+        self._pendentes: Dict[str, Tuple[dict, List[asyncio.Future]]] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._gravacoes: set = set()
+        self.lotes = 0
+        self.registros = 0
+        self.tempo_gravacao = 0.0  # Segundos gastos nos upserts
+    
+    async def salvar(self, cnpj: str, dados: dict) -> Haylander:
+        """Agenda a gravação e aguarda o lote em que ela entrou"""
+        futuro = asyncio.get_event_loop().create_future()
+        if cnpj in self._pendentes:
+            # Mesmo CNPJ duas vezes no lote: vale o mais recente (um upsert não altera a linha duas vezes)
+            anterior, futuros = self._pendentes[cnpj]
+            mesclado = {**anterior, **dados}
+            # Seção desatualizada em uma consulta e atualizada na outra não fica marcada
+            mesclado["secoes_desatualizadas"] = mesclar_secoes_desatualizadas(
+                anterior.get("secoes_desatualizadas"), mesclado
+            )
+            mesclado["status_consulta"] = status_da_consulta(mesclado, mesclado["secoes_desatualizadas"])
+            self._pendentes[cnpj] = (mesclado, futuros + [futuro])
+        else:
+            self._pendentes[cnpj] = (dados, [futuro])
+        
+        if len(self._pendentes) >= settings.gravacao_lote_max:
+            self._disparar()
+        elif self._timer is None:
+            self._timer = tarefa_sem_perfil(self._aguardar_janela())
+        return await futuro
+    
+    async def _aguardar_janela(self):
+        await asyncio.sleep(settings.gravacao_lote_ms / 1000)
+        self._timer = None
+        self._disparar()
+    
+    def _disparar(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if not self._pendentes:
+            return
+        lote, self._pendentes = self._pendentes, {}
+        tarefa = tarefa_sem_perfil(self._gravar(lote))
+        self._gravacoes.add(tarefa)
+        tarefa.add_done_callback(self._gravacoes.discard)
+    
+    async def _gravar(self, lote: Dict[str, Tuple[dict, List[asyncio.Future]]]):
+        inicio = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                clientes = await db.run_sync(salvar_clientes, {cnpj: dados for cnpj, (dados, _) in lote.items()})
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de {len(lote)} clientes: {e}")
+            for _, futuros in lote.values():
+                for futuro in futuros:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+            return
+        
+        self.lotes += 1
+        self.registros += len(lote)
+        self.tempo_gravacao += time.perf_counter() - inicio
+        for cliente, (_, futuros) in zip(clientes, lote.values()):
+            for futuro in futuros:
+                if not futuro.done():
+                    futuro.set_result(cliente)
+    
+    async def close(self):
+        """Grava o que estiver pendente (shutdown)"""
+        self._disparar()
+        if self._gravacoes:
+            await asyncio.gather(*self._gravacoes, return_exceptions=True)
+    
+    def stats(self):
+        """Lotes gravados, registros por lote e tempo médio de gravação"""
+        return {
+            "lotes": self.lotes,
+            "registros": self.registros,
+            "media_por_lote": round(self.registros / self.lotes, 2) if self.lotes else 0.0,
+            "media_ms_por_lote": round(1000 * self.tempo_gravacao / self.lotes, 2) if self.lotes else 0.0,
+            "pendentes": len(self._pendentes)
+        }
+
+
+# Instância global do gravador
+gravador_clientes = GravadorClientes()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.perfil import registrar_span
+
+# Crédito acumulado máximo (rajada de hedges depois de um período calmo)
+CREDITO_MAXIMO = 10.0
+
+
+class HedgeRequisicoes:
+    """Requisições "hedged" para os GETs do SERPRO (idempotentes)
+    
+    Se a chamada não responde dentro do percentil HEDGE_PERCENTIL da latência
+    recente da família, uma segunda chamada idêntica é disparada e vale a
+    primeira resposta; a outra é cancelada (o tempo que ela já esperava entra
+    na janela como limite inferior da sua latência). Cada chamada principal
+    rende HEDGE_ORCAMENTO de crédito, começando do zero, e cada hedge gasta 1,
+    então as chamadas extras (cobradas pelo SERPRO) ficam limitadas a essa
+    fração do total.
+    """
+    
+    def __init__(self):
+        self._latencias: Dict[str, Deque[float]] = {}
+        self._gatilhos: Dict[str, float] = {}
+        self._amostras: Dict[str, int] = {}  # Total por família (a janela para de crescer no maxlen)
+        self._credito = 0.0
+        self._stats = {"disparados": 0, "venceu": 0, "perdeu": 0, "sem_orcamento": 0}
+    
+    def _observar(self, familia: str, segundos: float):
+        janela = self._latencias.get(familia)
+        if janela is None:
+            janela = self._latencias[familia] = deque(maxlen=settings.hedge_janela)
+        janela.append(segundos)
+        amostras = self._amostras[familia] = self._amostras.get(familia, 0) + 1
+        # Recalcula o percentil a cada 10 amostras (não a cada chamada)
+        if len(janela) >= settings.hedge_min_amostras and (amostras % 10 == 0 or familia not in self._gatilhos):
+            ordenadas = sorted(janela)
+            indice = min(int(len(ordenadas) * settings.hedge_percentil / 100), len(ordenadas) - 1)
+            self._gatilhos[familia] = max(ordenadas[indice], settings.hedge_min_ms / 1000)
+    
+    def gatilho(self, familia: str) -> Optional[float]:
+        """Espera (segundos) antes do hedge; None enquanto não há amostras suficientes"""
+        return self._gatilhos.get(familia)
+    
+    async def _medir(self, familia: str, chamada: Callable[[], Awaitable[Any]]) -> Any:
+        inicio = time.perf_counter()
+        resposta = await chamada()
+        self._observar(familia, time.perf_counter() - inicio)
+        return resposta
+    
+    async def executar(self, familia: str, chamada: Callable[[], Awaitable[Any]], permitir: bool = True) -> Any:
+        """Executa `chamada()` e, se ela demorar além do gatilho, uma cópia em paralelo"""
+        gatilho = self.gatilho(familia)
+        if not settings.hedge_enabled or not permitir or gatilho is None:
+            return await self._medir(familia, chamada)
+        
+        self._credito = min(self._credito + settings.hedge_orcamento, CREDITO_MAXIMO)
+        inicio_principal = time.perf_counter()
+        principal = asyncio.ensure_future(self._medir(familia, chamada))
+        try:
+            concluidas, _ = await asyncio.wait({principal}, timeout=gatilho)
+        except asyncio.CancelledError:
+            principal.cancel()
+            raise
+        if concluidas:
+            return principal.result()
+        
+        if self._credito < 1:
+            self._stats["sem_orcamento"] += 1
+            return await principal
+        self._credito -= 1
+        self._stats["disparados"] += 1
+        logger.debug(f"🪁 Hedge {familia}: sem resposta em {gatilho * 1000:.0f}ms, disparando segunda chamada")
+        
+        inicio_hedge = time.perf_counter()
+        hedge = asyncio.ensure_future(self._medir(familia, chamada))
+        inicios = {principal: inicio_principal, hedge: inicio_hedge}
+        pendentes = {principal, hedge}
+        erro: Optional[BaseException] = None
+        try:
+            while pendentes:
+                concluidas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                vencedora = None
+                for tarefa in concluidas:
+                    # Vale a primeira resposta; uma falha só conta se a outra também falhar
+                    if tarefa.exception() is None:
+                        vencedora = vencedora or tarefa
+                    else:
+                        erro = tarefa.exception()
+                if vencedora is not None:
+                    resultado = "venceu" if vencedora is hedge else "perdeu"
+                    self._stats[resultado] += 1
+                    agora = time.perf_counter()
+                    registrar_span("hedge", "hedge", inicio_hedge, agora, familia=familia, resultado=resultado)
+                    # A perdedora (cancelada) demoraria ao menos o que já esperou: sem isso o gatilho só desce
+                    for perdedora in pendentes:
+                        self._observar(familia, agora - inicios[perdedora])
+                    return vencedora.result()
+            raise erro
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.hedge_enabled,
+            **self._stats,
+            "credito": round(self._credito, 2),
+            "gatilhos_ms": {familia: round(segundos * 1000, 1) for familia, segundos in self._gatilhos.items()}
+        }
+
+
+# Instância global do hedge de requisições
+hedge_requisicoes = HedgeRequisicoes()
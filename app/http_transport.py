@@ -0,0 +1,142 @@
+import asyncio
+import ssl
+from typing import Any, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from app.config import settings
+
+
+class SerproTransport:
+    """Cliente HTTP compartilhado (pool de conexões) para o gateway SERPRO
+    
+    Um único httpx.AsyncClient por processo, aberto na startup e fechado no
+    shutdown, reaproveitando conexões TCP/TLS entre chamadas (keep-alive).
+    """
+    
+    def __init__(self, ssl_context: ssl.SSLContext):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ssl_context = ssl_context
+        self._antigos: List[httpx.AsyncClient] = []
+        self._fechamentos: set = set()  # Referências às tarefas de _fechar_depois (o loop só guarda fracas)
+        self._stats = {
+            "requisicoes": 0,
+            "conexoes_reaproveitadas": 0,  # pool hit
+            "conexoes_novas": 0,  # pool miss (handshake TCP + TLS)
+            "rebuilds": 0
+        }
+    
+    def _http2_disponivel(self) -> bool:
+        """Verifica se HTTP/2 foi habilitado e se o pacote h2 está instalado"""
+        if not settings.http2_enabled:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("HTTP2_ENABLED=true mas o pacote 'h2' não está instalado, usando HTTP/1.1")
+            return False
+    
+    def _criar_client(self, ssl_context: ssl.SSLContext) -> httpx.AsyncClient:
+        """Cria o AsyncClient com os limites de pool configurados"""
+        limits = httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds
+        )
+        return httpx.AsyncClient(
+            timeout=settings.request_timeout_seconds,
+            verify=ssl_context,
+            limits=limits,
+            http2=self._http2_disponivel()
+        )
+    
+    async def start(self):
+        """Abre o cliente compartilhado (chamado na startup da aplicação)"""
+        if self._client is not None and not self._client.is_closed:
+            return
+        self._client = self._criar_client(self._ssl_context)
+        logger.info(
+            f"🔌 Pool HTTP SERPRO aberto (max={settings.http_max_connections}, "
+            f"keep-alive={settings.http_max_keepalive_connections})"
+        )
+    
+    async def close(self):
+        """Fecha o cliente compartilhado (chamado no shutdown da aplicação)"""
+        for tarefa in self._fechamentos:
+            tarefa.cancel()
+        for antigo in self._antigos:
+            await antigo.aclose()
+        self._antigos.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("🔌 Pool HTTP SERPRO fechado")
+    
+    async def rebuild(self, ssl_context: ssl.SSLContext):
+        """Recria o cliente com um novo contexto SSL (ex.: rotação de certificado)
+        
+        O cliente antigo continua atendendo as requisições em andamento e é
+        fechado depois de request_timeout_seconds.
+        """
+        antigo = self._client
+        self._ssl_context = ssl_context
+        self._client = self._criar_client(ssl_context)
+        self._stats["rebuilds"] += 1
+        logger.info("🔄 Pool HTTP SERPRO recriado com novo contexto SSL")
+        
+        if antigo is not None:
+            self._antigos.append(antigo)
+            tarefa = asyncio.ensure_future(self._fechar_depois(antigo, settings.request_timeout_seconds))
+            self._fechamentos.add(tarefa)
+            tarefa.add_done_callback(self._fechamentos.discard)
+    
+    async def _fechar_depois(self, client: httpx.AsyncClient, atraso: float):
+        """Fecha um cliente antigo após o período de carência"""
+        await asyncio.sleep(atraso)
+        if client in self._antigos:
+            self._antigos.remove(client)
+            await client.aclose()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente atual; abre sob demanda quando usado fora da aplicação (scripts)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._criar_client(self._ssl_context)
+        return self._client
+    
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Executa a requisição no pool, contabilizando hits e misses"""
+        nova_conexao = False
+        
+        async def trace(evento: str, info: Dict[str, Any]):
+            nonlocal nova_conexao
+            if evento == "connection.connect_tcp.started":
+                nova_conexao = True
+        
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+        try:
+            return await self.client.request(method, url, extensions=extensions, **kwargs)
+        finally:
+            self._stats["requisicoes"] += 1
+            if nova_conexao:
+                self._stats["conexoes_novas"] += 1
+            else:
+                self._stats["conexoes_reaproveitadas"] += 1
+    
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+    
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do pool para monitoramento"""
+        total = self._stats["requisicoes"]
+        return {
+            **self._stats,
+            "taxa_reaproveitamento": round(self._stats["conexoes_reaproveitadas"] / total, 3) if total else 0.0,
+            "aberto": self._client is not None and not self._client.is_closed
+        }
@@ -0,0 +1,234 @@
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+FORMATO_TEXTO = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+
+# Linhas por tentativa HTTP (logger.bind(por_tentativa=True)): sujeitas a amostragem
+log_tentativa = logger.bind(por_tentativa=True)
+
+
+def _filtro_amostragem(record) -> bool:
+    """Mantém só a fração configurada das linhas por tentativa abaixo de WARNING"""
+    if record["extra"].get("por_tentativa") and record["level"].no < 30:
+        return random.random() < settings.log_amostragem_tentativas
+    return True
+
+
+def _linha_json(record) -> str:
+    """Registro do loguru como uma linha JSON compacta"""
+    dados: Dict[str, Any] = {
+        "ts": record["time"].isoformat(),
+        "nivel": record["level"].name,
+        "mensagem": record["message"],
+        "modulo": record["name"],
+        "funcao": record["function"],
+        "linha": record["line"],
+    }
+    extra = {chave: valor for chave, valor in record["extra"].items() if chave != "por_tentativa"}
+    if extra:
+        dados["extra"] = extra
+    if record["exception"] is not None:
+        tipo, valor, tb = record["exception"]
+        dados["excecao"] = "".join(traceback.format_exception(tipo, valor, tb))
+    return json.dumps(dados, ensure_ascii=False, default=str) + "\n"
+
+
+class EscritorLogs(threading.Thread):
+    """Grava os logs num thread dedicado, a partir de uma fila limitada
+    
+    O sink do loguru só enfileira a mensagem: o event loop nunca espera o
+    disco nem a rotação. Com a fila cheia vale LOG_FILA_CHEIA: "descartar"
+    (a mensagem nova), "descartar_antigas" (abre espaço tirando a mais antiga)
+    ou "bloquear" (sem perda, mas quem loga espera a vaga). ERROR e acima
+    nunca são descartados. Rotação por tamanho e retenção por idade, como o
+    sink de arquivo do loguru.
+    """
+    
+    def __init__(self, caminho: Path, formato: str, capacidade: int, politica: str):
+        super().__init__(name="escritor-logs", daemon=True)
+        self.caminho = caminho
+        self.formato = formato
+        self.politica = politica
+        self._fila: "queue.Queue[Any]" = queue.Queue(maxsize=capacidade)
+        self._arquivo = None
+        self.enfileiradas = 0
+        self.descartadas = 0
+        self.gravadas = 0
+        self._descartadas_informadas = 0
+    
+    def enfileirar(self, mensagem):
+        """Sink do loguru (chamado no thread de quem loga)"""
+        item = mensagem.record if self.formato == "json" else str(mensagem)
+        if self.politica == "bloquear" or mensagem.record["level"].no >= 40:
+            self._fila.put(item)
+        else:
+            try:
+                self._fila.put_nowait(item)
+            except queue.Full:
+                if self.politica != "descartar_antigas":
+                    self.descartadas += 1
+                    return
+                try:
+                    self._fila.get_nowait()
+                except queue.Empty:
+                    pass
+                self.descartadas += 1
+                try:
+                    self._fila.put_nowait(item)
+                except queue.Full:
+                    return
+        self.enfileiradas += 1
+    
+    def run(self):
+        self._abrir()
+        while True:
+            item = self._fila.get()
+            lote: List[Any] = [item]
+            # Esvazia o que já chegou: uma escrita e um flush por rajada
+            while len(lote) < 1000:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+            fim = None in lote
+            self._gravar([item for item in lote if item is not None])
+            if fim:
+                break
+        self._arquivo.close()
+    
+    def _gravar(self, itens: List[Any]):
+        if self.descartadas > self._descartadas_informadas:
+            perdidas = self.descartadas - self._descartadas_informadas
+            self._descartadas_informadas = self.descartadas
+            aviso = f"{datetime.now():%Y-%m-%d %H:%M:%S} | WARNING | {perdidas} mensagens de log descartadas (fila cheia)\n"
+            if self.formato == "json":
+                aviso = json.dumps({"ts": datetime.now().isoformat(), "nivel": "WARNING",
+                                    "mensagem": f"{perdidas} mensagens de log descartadas (fila cheia)"}) + "\n"
+            itens = [aviso, *itens]
+        
+        texto = "".join(item if isinstance(item, str) else _linha_json(item) for item in itens)
+        try:
+            self._arquivo.write(texto)
+            self._arquivo.flush()
+        except Exception as e:
+            print(f"Erro ao gravar log: {e}", file=sys.stderr)
+            return
+        self.gravadas += len(itens)
+        if self._arquivo.tell() >= settings.log_rotacao_mb * 1024 * 1024:
+            self._rotacionar()
+    
+    def _abrir(self):
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._arquivo = open(self.caminho, "a", encoding="utf-8", buffering=1024 * 1024)
+    
+    def _rotacionar(self):
+        """Renomeia o arquivo atual (mesmo padrão do loguru) e apaga os vencidos"""
+        self._arquivo.close()
+        rotacionado = self.caminho.with_name(
+            f"{self.caminho.stem}.{datetime.now():%Y-%m-%d_%H-%M-%S_%f}{self.caminho.suffix}"
+        )
+        self.caminho.rename(rotacionado)
+        self._abrir()
+        
+        limite = time.time() - timedelta(days=settings.log_retencao_dias).total_seconds()
+        for antigo in self.caminho.parent.glob(f"{self.caminho.stem}.*{self.caminho.suffix}"):
+            try:
+                if antigo.stat().st_mtime < limite:
+                    antigo.unlink()
+            except OSError:
+                pass
+    
+    def encerrar(self, timeout: float = 5.0):
+        """Grava o que estiver na fila e para o thread"""
+        self._fila.put(None)
+        self.join(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fila": self._fila.qsize(),
+            "capacidade": self._fila.maxsize,
+            "enfileiradas": self.enfileiradas,
+            "gravadas": self.gravadas,
+            "descartadas": self.descartadas
+        }
+
+
+_handlers: List[int] = []
+_escritor: Optional[EscritorLogs] = None
+
+
+def configurar_logs():
+    """Adiciona o sink de arquivo do loguru (startup da aplicação)
+    
+    No modo fila o console também deixa de escrever no thread de quem loga.
+    """
+    global _escritor
+    if _handlers:
+        return
+    
+    if settings.log_modo == "direto":
+        # Sink síncrono do loguru: cada linha é gravada por quem loga
+        _handlers.append(logger.add(
+            settings.log_file,
+            level=settings.log_level,
+            rotation=f"{settings.log_rotacao_mb} MB",
+            retention=f"{settings.log_retencao_dias} days",
+            format=FORMATO_TEXTO,
+            serialize=settings.log_formato == "json",
+            filter=_filtro_amostragem
+        ))
+        return
+    
+    _escritor = EscritorLogs(
+        Path(settings.log_file), settings.log_formato, settings.log_fila_max, settings.log_fila_cheia
+    )
+    _escritor.start()
+    _handlers.append(logger.add(
+        _escritor.enfileirar,
+        level=settings.log_level,
+        format=FORMATO_TEXTO,
+        filter=_filtro_amostragem,
+        catch=True
+    ))
+    
+    # O console padrão do loguru (handler 0) grava no stderr por quem loga e sem amostragem:
+    # trocado por um com fila própria do loguru (enqueue) e o mesmo filtro do arquivo
+    try:
+        logger.remove(0)
+    except ValueError:
+        return  # Console já removido por quem chamou (ex.: benchmarks/carga.py)
+    _handlers.append(logger.add(
+        sys.stderr,
+        level=settings.log_level,
+        filter=_filtro_amostragem,
+        enqueue=True,
+        catch=True
+    ))
+
+
+def encerrar_logs():
+    """Remove o sink e grava o que ainda estiver na fila (shutdown)"""
+    global _escritor
+    for handler in _handlers:
+        logger.remove(handler)
+    _handlers.clear()
+    if _escritor is not None:
+        _escritor.encerrar()
+        _escritor = None
+
+
+def stats_logs() -> Dict[str, Any]:
+    """Fila do escritor de logs (vazio no modo direto)"""
+    return _escritor.stats() if _escritor is not None else {}
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.config import settings
+from app.models import ConsultaFila, ConsultaLote
+
+
+def normalizar_cnpjs(cnpjs: List[str]) -> Tuple[List[str], List[str]]:
+    """Limpa formatação, remove duplicados e separa CNPJs inválidos"""
+    validos: List[str] = []
+    invalidos: List[str] = []
+    vistos = set()
+    for cnpj in cnpjs:
+        cnpj_limpo = ''.join(filter(str.isdigit, str(cnpj)))
+        if len(cnpj_limpo) != 14:
+            if str(cnpj).strip():
+                invalidos.append(str(cnpj).strip())
+            continue
+        if cnpj_limpo not in vistos:
+            vistos.add(cnpj_limpo)
+            validos.append(cnpj_limpo)
+    return validos, invalidos
+
+
+def ler_cnpjs_csv(conteudo: bytes) -> List[str]:
+    """Extrai CNPJs de um CSV (coluna "cnpj" ou, sem cabeçalho, a primeira coluna)"""
+    texto = conteudo.decode("utf-8-sig", errors="ignore")
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:2048], delimiters=",;\t")
+    except csv.Error:
+        dialeto = csv.excel
+    
+    linhas = [linha for linha in csv.reader(io.StringIO(texto), dialeto) if linha]
+    if not linhas:
+        return []
+    
+    cabecalho = [coluna.strip().lower() for coluna in linhas[0]]
+    if "cnpj" in cabecalho:
+        indice = cabecalho.index("cnpj")
+        linhas = linhas[1:]
+    else:
+        indice = 0
+    return [linha[indice] for linha in linhas if len(linha) > indice]
+
+
+def criar_lote(
+    db: Session, cnpjs: List[str], concorrencia: Optional[int] = None
+) -> Tuple[ConsultaLote, List[str]]:
+    """Registra o lote e enfileira um item por CNPJ na fila persistente"""
+    validos, invalidos = normalizar_cnpjs(cnpjs)
+    concorrencia = max(1, min(concorrencia or settings.lote_concorrencia, settings.lote_max_concorrencia))
+    
+    agora = datetime.now()
+    lote = ConsultaLote(
+        id=uuid.uuid4().hex,
+        total=len(validos),
+        concorrencia=concorrencia,
+        status="PENDENTE" if validos else "CONCLUIDO",
+        criado_em=agora,
+        finalizado_em=None if validos else agora
+    )
+    db.add(lote)
+    db.flush()
+    db.bulk_insert_mappings(ConsultaFila, [
+        {"lote_id": lote.id, "cnpj": cnpj, "status": "PENDENTE", "tentativas": 0,
+         "proxima_tentativa_em": agora, "created_at": agora}
+        for cnpj in validos
+    ])
+    db.commit()
+    
+    logger.info(f"📦 Lote {lote.id} criado: {len(validos)} CNPJs, concorrência {concorrencia}")
+    return lote, invalidos
+
+
+def progresso_lote(db: Session, lote_id: str, incluir_resultados: bool = True) -> Optional[Dict[str, Any]]:
+    """Progresso, vazão e (opcionalmente) resultado por CNPJ, lidos da fila"""
+    lote = db.query(ConsultaLote).filter(ConsultaLote.id == lote_id).first()
+    if not lote:
+        return None
+    
+    contagem = dict(
+        db.query(ConsultaFila.status, func.count(ConsultaFila.id))
+        .filter(ConsultaFila.lote_id == lote_id)
+        .group_by(ConsultaFila.status)
+        .all()
+    )
+    sucesso = contagem.get("CONCLUIDO", 0)
+    erros = contagem.get("FALHOU", 0)
+    processados = sucesso + erros
+    
+    inicio = lote.iniciado_em or lote.criado_em
+    fim = lote.finalizado_em or datetime.now()
+    duracao = max((fim - inicio).total_seconds(), 0.0) if lote.iniciado_em else 0.0
+    
+    resultados = None
+    if incluir_resultados:
+        resultados = {}
+        itens = (
+            db.query(ConsultaFila)
+            .filter(ConsultaFila.lote_id == lote_id)
+            .order_by(ConsultaFila.id)
+            .yield_per(1000)
+        )
+        for item in itens:
+            resultado = {"status": item.status, "tentativas": item.tentativas}
+            if item.resultado:
+                resultado.update(json.loads(item.resultado))
+            if item.ultimo_erro:
+                resultado["erro"] = item.ultimo_erro
+            resultados[item.cnpj] = resultado
+    
+    return {
+        "job_id": lote.id,
+        "status": lote.status,
+        "total": lote.total,
+        "processados": processados,
+        "sucesso": sucesso,
+        "erros": erros,
+        "pendentes": contagem.get("PENDENTE", 0),
+        "executando": contagem.get("EXECUTANDO", 0),
+        "percentual": round(100 * processados / lote.total, 1) if lote.total else 100.0,
+        "concorrencia": lote.concorrencia,
+        "duracao_segundos": round(duracao, 2),
+        "cnpjs_por_minuto": round(60 * processados / duracao, 2) if duracao > 0 else 0.0,
+        "criado_em": lote.criado_em,
+        "iniciado_em": lote.iniciado_em,
+        "finalizado_em": lote.finalizado_em,
+        "resultados": resultados
+    }
@@ -1,33 +1,48 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+import asyncio
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from typing import List, Optional, Tuple
 
 from app.config import settings
-from app.database import get_db, init_db
+from app.database import get_async_db, init_db, async_engine, status_banco, AsyncSessionLocal
 from app.models import Haylander
 from app.schemas import (
     CNPJRequest, 
     HaylanderResponse, 
     ConsultaResponse, 
-    HealthResponse
+    HealthResponse,
+    ResumoResponse,
+    FiltrosClientes,
+    LoteRequest,
+    LoteCriadoResponse,
+    LoteStatusResponse
 )
 from app.serpro_client import serpro_client
-from app.token_cache import token_cache
+from app.rate_limiter import rate_limiter
+from app.circuit_breaker import circuit_breakers
+from app.response_cache import response_cache
+from app.coalescencia import consultas_em_voo
+from app.consolidacao import SECOES, consolidar_dados_serpro
+from app.gravador import gravador_clientes
+from app.arquivo import arquivo_payloads
+from app.metricas import registro_metricas
+from app.crud import filtrar_clientes, codificar_cursor, decodificar_cursor, remover_cliente
+from app.resumo import garantir_resumo, ler_resumo, reconstruir_resumo
+from app.exportacao import exportar_clientes
+from app.lote import criar_lote, progresso_lote, ler_cnpjs_csv
+from app.fila import fila_worker
+from app.agendador import agendador
+from app.logs import configurar_logs, encerrar_logs, stats_logs
+from app.perfil import MiddlewarePerfil, perfis_requisicao, span
+from app.hedge import hedge_requisicoes
 
 from loguru import logger
 
-# Configurar logging
-logger.add(
-    settings.log_file,
-    level=settings.log_level,
-    rotation="10 MB",
-    retention="30 days",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
-)
-
 # Criar aplicação FastAPI
 app = FastAPI(
     title="Bot e-CAC - SERPRO Integra Contador",
@@ -45,16 +60,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfil por requisição (PERFIL_ENABLED; header X-Perfil ou amostragem)
+app.add_middleware(MiddlewarePerfil)
+
 # Inicializar banco na startup
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """Inicializar aplicação"""
+    configurar_logs()
     logger.info("🚀 Iniciando Bot e-CAC...")
     init_db()
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(garantir_resumo)
     logger.success("✅ Banco de dados inicializado")
+    await serpro_client.start()
+    await fila_worker.start()
+    await agendador.start()
     logger.info("📋 ATENÇÃO: Verifique se a procuração SERPRO está válida!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Finalizar aplicação"""
+    await agendador.close()
+    await fila_worker.close()
+    await gravador_clientes.close()
+    await arquivo_payloads.close()
+    await response_cache.close()
+    await serpro_client.close()
+    await async_engine.dispose()
+    logger.info("👋 Bot e-CAC finalizado")
+    encerrar_logs()
+
+
 @app.get("/", response_model=dict)
 async def root():
     """Endpoint raiz"""
@@ -67,6 +105,7 @@ async def root():
             "docs": "/docs",
             "health": "/health",
             "consultar": "/consultar/{cnpj}",
+            "lote": "/consultar/lote",
             "listar": "/clientes"
         },
         "importante": "⚠️ Verifique se a procuração SERPRO está válida"
@@ -74,174 +113,285 @@ async def root():
 
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Health check da aplicação"""
     try:
-        # Testar conexão com banco usando SQLAlchemy 2.0+ syntax
-        from sqlalchemy import text
-        result = db.execute(text("SELECT 1")).fetchone()
+        # Testar conexão com banco
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result and result[0] == 1:
             db_status = "connected"
         else:
             db_status = "error"
+        banco = await db.run_sync(status_banco)
     except Exception as e:
         logger.error(f"Erro no health check do banco: {e}")
         db_status = "error"
+        banco = None
     
-    # Verificar cache de token
-    cache_status = "ok" if token_cache.get_token() else "empty"
+    # Verificar token em memória
+    cache_status = "ok" if serpro_client.token_manager.status()["valido"] else "empty"
     
     return HealthResponse(
         timestamp=datetime.now(),
         database=db_status,
-        serpro_cache=cache_status
+        banco=banco,
+        serpro_cache=cache_status,
+        http_pool=serpro_client.transport.stats(),
+        serpro_limites=rate_limiter.status(),
+        circuit_breakers=circuit_breakers.status(),
+        response_cache=response_cache.stats(),
+        coalescencia=consultas_em_voo.stats(),
+        gravacao=gravador_clientes.stats(),
+        agendador=agendador.stats(),
+        arquivo=arquivo_payloads.stats(),
+        hedge=hedge_requisicoes.stats()
     )
 
 
-def consolidar_dados_serpro(cnpj: str, dados_apis: dict) -> dict:
-    """Consolida dados das APIs SERPRO em estrutura simples"""
-    
-    # Extrair dados PGMEI
-    pgmei_data = dados_apis.get("pgmei_divida", {})
-    pgmei_valor = 0.00
-    pgmei_tem_divida = False
-    
-    if pgmei_data.get("status") != "error" and pgmei_data.get("status") != "not_found":
-        # Processar dados de dívida (estrutura pode variar)
-        dividas = pgmei_data.get("dividas", [])
-        if dividas:
-            pgmei_valor = sum(float(d.get("valor", 0)) for d in dividas)
-            pgmei_tem_divida = pgmei_valor > 0
-    
-    # Extrair dados PGDASD
-    pgdasd_data = dados_apis.get("pgdasd_declaracoes", {})
-    pgdasd_count = 0
-    pgdasd_anos = ""
-    
-    if pgdasd_data.get("status") != "error" and pgdasd_data.get("status") != "not_found":
-        declaracoes = pgdasd_data.get("declaracoes_pendentes", [])
-        pgdasd_count = len(declaracoes)
-        anos_list = [str(d.get("ano", "")) for d in declaracoes if d.get("ano")]
-        pgdasd_anos = ",".join(anos_list)
-    
-    # Extrair dados CCMEI
-    ccmei_data = dados_apis.get("ccmei_dados", {}) or dados_apis.get("ccmei_situacao", {})
-    ccmei_situacao = "Não informada"
-    ccmei_abertura = None
-    
-    if ccmei_data.get("status") != "error" and ccmei_data.get("status") != "not_found":
-        ccmei_situacao = ccmei_data.get("situacao", "Ativa")
-        abertura_str = ccmei_data.get("data_abertura")
-        if abertura_str:
-            try:
-                ccmei_abertura = datetime.fromisoformat(abertura_str.replace("Z", "+00:00"))
-            except:
-                pass
-    
-    # Extrair dados Caixa Postal
-    caixa_data = dados_apis.get("caixa_postal", {})
-    caixa_count = 0
-    caixa_nao_lidas = 0
-    
-    if caixa_data.get("status") != "error" and caixa_data.get("status") != "not_found":
-        mensagens = caixa_data.get("mensagens", [])
-        caixa_count = len(mensagens)
-        caixa_nao_lidas = len([m for m in mensagens if not m.get("lida", True)])
-    
-    # Extrair dados Procurações
-    proc_data = dados_apis.get("procuracoes", {})
-    proc_ativas = 0
-    
-    if proc_data.get("status") != "error" and proc_data.get("status") != "not_found":
-        procuracoes = proc_data.get("procuracoes", [])
-        proc_ativas = len([p for p in procuracoes if p.get("ativa", False)])
-    
-    # Calcular situação geral
-    valor_total = pgmei_valor
-    situacao_geral = "OK"
-    
-    if pgmei_tem_divida or pgdasd_count > 0 or caixa_nao_lidas > 0:
-        situacao_geral = "PENDENCIAS"
-    
-    if pgmei_valor > 1000 or pgdasd_count > 3:
-        situacao_geral = "PROBLEMAS"
+def _metricas_componentes():
+    """Contadores e estados que os componentes já mantêm, lidos a cada scrape do /metrics"""
+    token = serpro_client.token_manager.status()
+    yield "serpro_token_cache_hits_total", "counter", "Tokens servidos da memoria", [({}, token["cache_hits"])]
+    yield "serpro_token_renovacoes_total", "counter", "Tokens obtidos do SERPRO", [({}, token["renovacoes"])]
+    yield "serpro_token_falhas_total", "counter", "Falhas ao renovar o token", [({}, token["falhas_renovacao"])]
+    yield "serpro_token_invalidacoes_total", "counter", "Tokens descartados apos 401", [({}, token["invalidacoes"])]
     
-    return {
-        "pgmei_divida_valor": Decimal(str(pgmei_valor)),
-        "pgmei_tem_divida": pgmei_tem_divida,
-        "pgmei_ultimo_update": datetime.now(),
-        
-        "pgdasd_pendentes_count": pgdasd_count,
-        "pgdasd_anos_pendentes": pgdasd_anos,
-        "pgdasd_ultimo_update": datetime.now(),
-        
-        "ccmei_situacao": ccmei_situacao,
-        "ccmei_data_abertura": ccmei_abertura,
-        "ccmei_ultimo_update": datetime.now(),
-        
-        "caixa_mensagens_count": caixa_count,
-        "caixa_mensagens_nao_lidas": caixa_nao_lidas,
-        "caixa_ultimo_update": datetime.now(),
-        
-        "procuracoes_ativas": proc_ativas,
-        "procuracoes_ultimo_update": datetime.now(),
-        
-        "situacao_geral": situacao_geral,
-        "valor_total_pendente": Decimal(str(valor_total)),
-        "ultima_consulta": datetime.now(),
-        "status_consulta": "SUCCESS"
-    }
+    cache = response_cache.stats()["por_api"]
+    yield "response_cache_hits_total", "counter", "Respostas servidas do cache", [
+        ({"api": api}, stats["hits"]) for api, stats in cache.items()
+    ]
+    yield "response_cache_misses_total", "counter", "Respostas ausentes ou vencidas no cache", [
+        ({"api": api}, stats["misses"]) for api, stats in cache.items()
+    ]
+    
+    breakers = circuit_breakers.status()
+    yield "circuit_breaker_aberto", "gauge", "1 com o circuito aberto", [
+        ({"caminho": caminho}, int(b["estado"] == "ABERTO")) for caminho, b in breakers.items()
+    ]
+    yield "circuit_breaker_rejeitadas_total", "counter", "Chamadas recusadas com o circuito aberto", [
+        ({"caminho": caminho}, b["rejeitadas"]) for caminho, b in breakers.items()
+    ]
+    
+    familias = rate_limiter.status()["familias"]
+    yield "serpro_concorrencia_limite", "gauge", "Limite adaptativo de chamadas simultaneas", [
+        ({"familia": familia}, f["concorrencia"]["limite"]) for familia, f in familias.items()
+    ]
+    yield "serpro_chamadas_em_voo", "gauge", "Chamadas HTTP ao SERPRO em andamento", [
+        ({"familia": familia}, f["concorrencia"]["em_voo"]) for familia, f in familias.items()
+    ]
+    yield "serpro_chamadas_aguardando", "gauge", "Chamadas aguardando vaga no limitador", [
+        ({"familia": familia}, f["concorrencia"]["aguardando"] + f["rate"]["aguardando"]) for familia, f in familias.items()
+    ]
+    
+    coalescencia = consultas_em_voo.stats()
+    yield "consultas_economizadas_total", "counter", "Consultas atendidas por coalescencia ou reaproveitamento", [
+        ({"motivo": "coalescida"}, coalescencia["coalescidas"]),
+        ({"motivo": "reaproveitada"}, coalescencia["reaproveitadas"])
+    ]
+    yield "gravacao_lotes_total", "counter", "Micro-lotes de upsert gravados", [({}, gravador_clientes.lotes)]
+    yield "gravacao_registros_total", "counter", "Registros gravados em micro-lotes", [({}, gravador_clientes.registros)]
+    
+    hedge = hedge_requisicoes.stats()
+    yield "serpro_hedge_total", "counter", "Segundas chamadas (hedge) por resultado", [
+        ({"resultado": resultado}, hedge[resultado]) for resultado in ("venceu", "perdeu", "sem_orcamento")
+    ]
+    yield "serpro_hedge_gatilho_segundos", "gauge", "Espera antes do hedge (percentil da latencia recente)", [
+        ({"familia": familia}, ms / 1000) for familia, ms in hedge["gatilhos_ms"].items()
+    ]
+    
+    logs = stats_logs()
+    if logs:
+        yield "logs_fila", "gauge", "Mensagens de log aguardando o escritor", [({}, logs["fila"])]
+        yield "logs_descartados_total", "counter", "Mensagens de log descartadas com a fila cheia", [({}, logs["descartadas"])]
+
+
+registro_metricas.coletor(_metricas_componentes)
+
+
+@app.get("/metrics")
+async def metricas():
+    """Métricas do processo no formato texto do Prometheus"""
+    return Response(registro_metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/debug/perfis")
+async def listar_perfis():
+    """Requisições lentas perfiladas (do buffer em memória), da mais lenta para a mais rápida"""
+    return {**perfis_requisicao.stats(), "perfis": perfis_requisicao.listar()}
+
+
+@app.get("/debug/perfis/{perfil_id}")
+async def obter_perfil(perfil_id: str):
+    """Spans de uma requisição perfilada (e a captura cProfile, se houver)"""
+    perfil = perfis_requisicao.obter(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return perfil
+
+
+@app.post("/consultar/lote", response_model=LoteCriadoResponse, status_code=202)
+async def consultar_lote(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Enfileira vários CNPJs para consulta (JSON {"cnpjs": [...]} ou upload CSV)"""
+    
+    concorrencia = None
+    content_type = request.headers.get("content-type", "")
+    
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        arquivo = form.get("arquivo") or form.get("file")
+        if arquivo is None or not hasattr(arquivo, "read"):
+            raise HTTPException(status_code=400, detail="Envie o CSV no campo 'arquivo'")
+        cnpjs = ler_cnpjs_csv(await arquivo.read())
+        if form.get("concorrencia"):
+            # Mesma regra do LoteRequest (inteiro >= 1), com o mesmo status do corpo JSON inválido
+            valor = form["concorrencia"]
+            if not isinstance(valor, str) or not valor.strip().isdigit() or int(valor) < 1:
+                raise HTTPException(status_code=422, detail="Campo 'concorrencia' deve ser um inteiro maior ou igual a 1")
+            concorrencia = int(valor)
+    else:
+        try:
+            lote = LoteRequest.parse_obj(await request.json())
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Corpo inválido: {e}")
+        cnpjs = lote.cnpjs
+        concorrencia = lote.concorrencia
+    
+    if not cnpjs:
+        raise HTTPException(status_code=400, detail="Nenhum CNPJ informado")
+    if len(cnpjs) > settings.lote_max_cnpjs:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo de {settings.lote_max_cnpjs} CNPJs por lote"
+        )
+    
+    lote, invalidos = await db.run_sync(criar_lote, cnpjs, concorrencia)
+    
+    return LoteCriadoResponse(
+        job_id=lote.id,
+        status=lote.status,
+        total=lote.total,
+        invalidos=invalidos
+    )
+
+
+@app.get("/consultar/lote/{job_id}", response_model=LoteStatusResponse)
+async def status_lote(job_id: str, incluir_resultados: bool = True, db: AsyncSession = Depends(get_async_db)):
+    """Progresso, vazão e resultado por CNPJ de um lote"""
+    
+    progresso = await db.run_sync(progresso_lote, job_id, incluir_resultados)
+    if not progresso:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    
+    return LoteStatusResponse(**progresso)
+
+
+async def _buscar_cliente(db: AsyncSession, cnpj: str):
+    """Registro Haylander do CNPJ (None se não existir)"""
+    return (await db.execute(select(Haylander).where(Haylander.cnpj == cnpj))).scalar_one_or_none()
+
+
+def _secoes_pedidas(sections: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Seções de `sections` (separadas por vírgula), validadas; None = todas"""
+    if not sections:
+        return None
+    secoes = tuple(sorted({secao.strip().lower() for secao in sections.split(",") if secao.strip()}))
+    invalidas = [secao for secao in secoes if secao not in SECOES]
+    if invalidas or not secoes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Seções inválidas: {', '.join(invalidas) or sections}. Válidas: {', '.join(SECOES)}"
+        )
+    return secoes
+
+
+async def _consultar_e_salvar(cnpj: str, force: bool, secoes: Optional[Tuple[str, ...]] = None):
+    """Consulta as APIs SERPRO e grava o registro consolidado (no próximo micro-lote de upsert)"""
+    dados_apis = await serpro_client.consultar_todas_apis(cnpj, force=force, secoes=secoes)
+    dados_consolidados = consolidar_dados_serpro(cnpj, dados_apis)
+    with span("gravacao", "gravacao"):
+        cliente = await gravador_clientes.salvar(cnpj, dados_consolidados)
+    return dados_apis, dados_consolidados, cliente
+
+
+async def _concluir_ou_desconectar(request: Request, tarefa: asyncio.Future) -> bool:
+    """Aguarda a tarefa; se o cliente HTTP desconectar antes, cancela e retorna False
+    
+    A consulta não lê o corpo da requisição, então o próximo receive() só
+    retorna com http.disconnect.
+    """
+    async def desconexao():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+    
+    vigia = asyncio.ensure_future(desconexao())
+    try:
+        await asyncio.wait({tarefa, vigia}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        vigia.cancel()
+        concluida = tarefa.done()
+        if not concluida:
+            tarefa.cancel()
+    return concluida
 
 
 @app.post("/consultar/{cnpj}", response_model=ConsultaResponse)
 async def consultar_cliente(
     cnpj: str, 
+    request: Request,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    force: bool = False,
+    sections: Optional[str] = Query(None, description="Seções a atualizar, separadas por vírgula (padrão: todas)"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Consulta completa de um cliente via SERPRO"""
+    """Consulta um cliente via SERPRO (force=true ignora o cache de respostas)
+    
+    Com `sections` (ex.: caixa,pgmei) só as APIs dessas seções são chamadas;
+    as demais seções do registro ficam como estavam.
+    """
     
     # Validar CNPJ
     cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
     if len(cnpj_limpo) != 14:
         raise HTTPException(status_code=400, detail="CNPJ deve ter 14 dígitos")
+    secoes = _secoes_pedidas(sections)
     
     try:
         logger.info(f"🔍 Iniciando consulta para CNPJ: {cnpj_limpo}")
         
-        # Consultar todas as APIs SERPRO
-        dados_apis = await serpro_client.consultar_todas_apis(cnpj_limpo)
+        # Consultar, consolidar e gravar uma única vez por CNPJ e seções, mesmo com chamadas simultâneas.
+        # force entra na chave: uma consulta forçada não pega carona numa que pode vir do cache
+        consulta = asyncio.ensure_future(consultas_em_voo.executar(
+            (cnpj_limpo, secoes, force), lambda: _consultar_e_salvar(cnpj_limpo, force, secoes), reaproveitar=not force
+        ))
+        # Cliente desconectou: a consulta é cancelada (se ninguém mais a aguarda) e as chamadas SERPRO param
+        if not await _concluir_ou_desconectar(request, consulta):
+            logger.warning(f"🔌 Cliente desconectou, consulta cancelada para CNPJ: {cnpj_limpo}")
+            return Response(status_code=499)
+        (dados_apis, dados_consolidados, cliente), compartilhada = consulta.result()
         
-        # Consolidar dados
-        dados_consolidados = consolidar_dados_serpro(cnpj_limpo, dados_apis)
+        logger.success(f"✅ Consulta finalizada para CNPJ: {cnpj_limpo}{' (compartilhada)' if compartilhada else ''}")
         
-        # Buscar ou criar registro na tabela
-        cliente = db.query(Haylander).filter(Haylander.cnpj == cnpj_limpo).first()
-        
-        if cliente:
-            # Atualizar registro existente
-            for campo, valor in dados_consolidados.items():
-                setattr(cliente, campo, valor)
-            cliente.updated_at = datetime.now()
+        status_consulta = dados_consolidados["status_consulta"]
+        desatualizadas = dados_consolidados["secoes_desatualizadas"]
+        if status_consulta == "SUCCESS":
+            message = "✅ Consulta realizada com sucesso"
+        elif status_consulta == "PARCIAL":
+            message = f"⚠️ Consulta parcial - seções desatualizadas: {desatualizadas}"
         else:
-            # Criar novo registro
-            dados_consolidados["cnpj"] = cnpj_limpo
-            dados_consolidados["created_at"] = datetime.now()
-            cliente = Haylander(**dados_consolidados)
-            db.add(cliente)
-        
-        db.commit()
-        db.refresh(cliente)
-        
-        logger.success(f"✅ Consulta finalizada para CNPJ: {cnpj_limpo}")
+            message = "❌ Nenhuma API SERPRO respondeu - dados anteriores mantidos"
         
         return ConsultaResponse(
-            success=True,
-            message="✅ Consulta realizada com sucesso",
+            success=status_consulta != "ERROR",
+            message=message,
             cnpj=cnpj_limpo,
-            dados=HaylanderResponse.from_orm(cliente)
+            dados=HaylanderResponse.from_orm(cliente),
+            errors=[f"{nome}: {dados_apis[nome].get('error')}" for nome in dados_apis["_meta"]["falhas"]] or None,
+            latencias_ms=dados_apis["_meta"]["latencias_ms"],
+            cache_hits=dados_apis["_meta"]["cache_hits"],
+            compartilhada=compartilhada,
+            secoes=list(secoes or SECOES)
         )
-        
+    
     except Exception as e:
         error_msg = str(e)
         
@@ -258,11 +408,12 @@ async def consultar_cliente(
         
         # Tentar salvar erro na base
         try:
-            cliente = db.query(Haylander).filter(Haylander.cnpj == cnpj_limpo).first()
-            if cliente:
-                cliente.status_consulta = "ERROR"
-                cliente.ultima_consulta = datetime.now()
-                db.commit()
+            await db.execute(
+                update(Haylander)
+                .where(Haylander.cnpj == cnpj_limpo)
+                .values(status_consulta="ERROR", ultima_consulta=datetime.now())
+            )
+            await db.commit()
         except:
             pass
         
@@ -275,14 +426,14 @@ async def consultar_cliente(
 
 
 @app.get("/cliente/{cnpj}", response_model=HaylanderResponse)
-async def obter_dados_cliente(cnpj: str, db: Session = Depends(get_db)):
+async def obter_dados_cliente(cnpj: str, db: AsyncSession = Depends(get_async_db)):
     """Obtém dados consolidados de um cliente"""
     
     cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
     if len(cnpj_limpo) != 14:
         raise HTTPException(status_code=400, detail="CNPJ deve ter 14 dígitos")
     
-    cliente = db.query(Haylander).filter(Haylander.cnpj == cnpj_limpo).first()
+    cliente = await _buscar_cliente(db, cnpj_limpo)
     
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -290,31 +441,98 @@ async def obter_dados_cliente(cnpj: str, db: Session = Depends(get_db)):
     return HaylanderResponse.from_orm(cliente)
 
 
+def filtros_clientes(
+    situacao_geral: Optional[str] = None,
+    status_consulta: Optional[str] = None,
+    pgmei_tem_divida: Optional[bool] = None,
+    valor_min: Optional[Decimal] = None,
+    valor_max: Optional[Decimal] = None,
+    desatualizado_horas: Optional[float] = Query(None, ge=0)
+) -> FiltrosClientes:
+    """Filtros da listagem a partir da query string"""
+    return FiltrosClientes(
+        situacao_geral=situacao_geral.upper() if situacao_geral else None,
+        status_consulta=status_consulta.upper() if status_consulta else None,
+        pgmei_tem_divida=pgmei_tem_divida,
+        valor_min=valor_min,
+        valor_max=valor_max,
+        desatualizado_horas=desatualizado_horas
+    )
+
+
 @app.get("/clientes", response_model=List[HaylanderResponse])
 async def listar_clientes(
-    limit: int = 50, 
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000), 
     offset: int = 0, 
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    filtros: FiltrosClientes = Depends(filtros_clientes),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista todos os clientes com paginação"""
+    """Lista clientes em ordem de id, com filtros
     
-    clientes = db.query(Haylander).offset(offset).limit(limit).all()
+    Paginação por cursor: quando há mais resultados, o header X-Proximo-Cursor
+    traz o valor para o parâmetro `cursor` da próxima página. `offset` continua
+    aceito, mas fica lento em páginas profundas.
+    """
+    
+    stmt = filtrar_clientes(select(Haylander), filtros).order_by(Haylander.id).limit(limit + 1)
+    if cursor:
+        try:
+            stmt = stmt.where(Haylander.id > decodificar_cursor(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif offset:
+        stmt = stmt.offset(offset)
+    
+    clientes = (await db.execute(stmt)).scalars().all()
+    if len(clientes) > limit:
+        clientes = clientes[:limit]
+        response.headers["X-Proximo-Cursor"] = codificar_cursor(clientes[-1].id)
     
     return [HaylanderResponse.from_orm(cliente) for cliente in clientes]
 
 
+@app.get("/resumo", response_model=ResumoResponse)
+async def resumo_carteira(db: AsyncSession = Depends(get_async_db)):
+    """Totais da carteira (contadores atualizados a cada gravação)"""
+    return ResumoResponse(**await db.run_sync(ler_resumo))
+
+
+@app.post("/resumo/reconstruir", response_model=ResumoResponse)
+async def reconstruir_resumo_carteira(db: AsyncSession = Depends(get_async_db)):
+    """Recalcula os contadores a partir da tabela inteira (correção de desvios)"""
+    await db.run_sync(reconstruir_resumo)
+    return ResumoResponse(**await db.run_sync(ler_resumo))
+
+
+@app.get("/clientes/export")
+async def exportar(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    filtros: FiltrosClientes = Depends(filtros_clientes)
+):
+    """Exporta os clientes filtrados em streaming (NDJSON ou CSV, gzip opcional)"""
+    
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="clientes.{formato}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(exportar_clientes(filtros, formato, gzip), media_type=media_type, headers=headers)
+
+
 @app.delete("/cliente/{cnpj}")
-async def deletar_cliente(cnpj: str, db: Session = Depends(get_db)):
+async def deletar_cliente(cnpj: str, db: AsyncSession = Depends(get_async_db)):
     """Remove um cliente da base"""
     
     cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
-    cliente = db.query(Haylander).filter(Haylander.cnpj == cnpj_limpo).first()
+    removido = await db.run_sync(remover_cliente, cnpj_limpo)
     
-    if not cliente:
+    if not removido:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    
-    db.delete(cliente)
-    db.commit()
+    # Se o CNPJ voltar à carteira, a primeira consulta não reaproveita respostas de antes da remoção
+    response_cache.invalidar(cnpj_limpo)
     
     return {"message": "Cliente removido com sucesso"}
 
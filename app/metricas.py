@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Amostras de um coletor: (nome, tipo, ajuda, [(rótulos, valor)])
+Amostras = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+BUCKETS_SERPRO = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKETS_DB = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BUCKETS_CPU = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: Tuple[str, ...], extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class _Metrica:
+    tipo = ""
+    
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._lock = threading.Lock()
+    
+    def _cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    """Contador monotônico (sufixo _total), um valor por combinação de rótulos"""
+    tipo = "counter"
+    
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *rotulos: str, valor: float = 1.0):
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0.0) + valor
+    
+    def exportar(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return self._cabecalho() + [
+            f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in valores
+        ]
+
+
+class Medidor(Contador):
+    """Valor que sobe e desce (ex.: consultas em andamento)"""
+    tipo = "gauge"
+    
+    def dec(self, *rotulos: str, valor: float = 1.0):
+        self.inc(*rotulos, valor=-valor)
+    
+    @contextmanager
+    def em_andamento(self, *rotulos: str):
+        self.inc(*rotulos)
+        try:
+            yield
+        finally:
+            self.dec(*rotulos)
+
+
+class Histograma(_Metrica):
+    """Distribuição de durações em segundos (buckets cumulativos, _sum e _count)"""
+    tipo = "histogram"
+    
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), buckets: Iterable[float] = BUCKETS_SERPRO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # [contagem por bucket..., +Inf, soma]
+    
+    def observe(self, segundos: float, *rotulos: str):
+        indice = bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [0.0] * (len(self.buckets) + 2)
+            serie[indice] += 1
+            serie[-1] += segundos
+    
+    @contextmanager
+    def medir(self, *rotulos: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, *rotulos)
+    
+    def exportar(self) -> List[str]:
+        with self._lock:
+            series = [(chave, list(serie)) for chave, serie in self._series.items()]
+        linhas = self._cabecalho()
+        for chave, serie in series:
+            acumulado = 0.0
+            for limite, contagem in zip((*self.buckets, "+Inf"), serie[:-1]):
+                acumulado += contagem
+                le = 'le="+Inf"' if limite == "+Inf" else f'le="{_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {_numero(acumulado)}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(serie[-1])}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {_numero(acumulado)}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Métricas do processo no formato texto do Prometheus (GET /metrics)
+    
+    Instrumentos em memória atualizados no próprio caminho da requisição
+    (um lock e uma soma por observação). Estados que os componentes já
+    mantêm (cache, circuit breakers, token...) entram por coletores,
+    lidos só no scrape. Com vários workers cada processo expõe os seus.
+    """
+    
+    def __init__(self):
+        self._metricas: List[_Metrica] = []
+        self._coletores: List[Callable[[], Iterable[Amostras]]] = []
+    
+    def contador(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+    
+    def medidor(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Medidor:
+        return self._registrar(Medidor(nome, ajuda, rotulos))
+    
+    def histograma(
+        self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), buckets: Iterable[float] = BUCKETS_SERPRO
+    ) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))
+    
+    def _registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+    
+    def coletor(self, funcao: Callable[[], Iterable[Amostras]]):
+        """Registra uma função chamada a cada scrape"""
+        self._coletores.append(funcao)
+    
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        for coletor in self._coletores:
+            for nome, tipo, ajuda, amostras in coletor():
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in amostras:
+                    linhas.append(f"{nome}{_rotulos(tuple(rotulos), tuple(rotulos.values()))} {_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+# Instância global do registro de métricas
+registro_metricas = RegistroMetricas()
+
+# Chamadas HTTP ao SERPRO (cada tentativa), por família de endpoint
+serpro_requisicoes = registro_metricas.contador(
+    "serpro_requisicoes_total", "Chamadas HTTP ao SERPRO por familia e status (erro = falha de transporte)",
+    ("familia", "status")
+)
+serpro_requisicao_segundos = registro_metricas.histograma(
+    "serpro_requisicao_segundos", "Latencia de cada chamada HTTP ao SERPRO (sem a espera do rate limit)",
+    ("familia",)
+)
+serpro_retentativas = registro_metricas.contador(
+    "serpro_retentativas_total", "Novas tentativas de chamadas ao SERPRO", ("familia",)
+)
+serpro_token_segundos = registro_metricas.histograma(
+    "serpro_token_renovacao_segundos", "Duracao das renovacoes do token OAuth2", ("resultado",)
+)
+consultas_em_andamento = registro_metricas.medidor(
+    "serpro_consultas_em_andamento", "Consultas (fan-out de APIs de um CNPJ) em andamento"
+)
+consulta_segundos = registro_metricas.histograma(
+    "serpro_consulta_segundos", "Duracao da consulta de um CNPJ (todas as rodadas do fan-out)"
+)
+consolidacao_segundos = registro_metricas.histograma(
+    "consolidacao_segundos", "Duracao de consolidar_dados_serpro", buckets=BUCKETS_CPU
+)
+db_comando_segundos = registro_metricas.histograma(
+    "db_comando_segundos", "Duracao dos comandos SQL por operacao", ("operacao",), BUCKETS_DB
+)
+db_commit_segundos = registro_metricas.histograma(
+    "db_commit_segundos", "Duracao dos commits de sessao (flush + COMMIT)", buckets=BUCKETS_DB
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, DECIMAL, Boolean, DateTime, Text, ForeignKey, Index, LargeBinary
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -7,6 +7,16 @@ class Haylander(Base):
     """Modelo para dados consolidados dos clientes"""
     
     __tablename__ = "haylander"
+    # Filtros de igualdade da listagem + chave do cursor (id): o filtro percorre o índice já na ordem
+    # da paginação. Filtros de faixa (valor, desatualizado_horas) não aproveitam um (coluna, id):
+    # a paginação por id percorre a chave primária e filtra as linhas
+    __table_args__ = (
+        Index("ix_haylander_situacao_id", "situacao_geral", "id"),
+        Index("ix_haylander_status_id", "status_consulta", "id"),
+        Index("ix_haylander_divida_id", "pgmei_tem_divida", "id"),
+    )
+    # Busca updated_at/created_at gerados pelo banco no próprio flush (registros seguem utilizáveis após o commit)
+    __mapper_args__ = {"eager_defaults": True}
     
     # Identificação
     id = Column(Integer, primary_key=True, index=True)
@@ -41,11 +51,106 @@ class Haylander(Base):
     situacao_geral = Column(String(50))  # "OK", "PENDENCIAS", "PROBLEMAS"
     valor_total_pendente = Column(DECIMAL(15, 2), default=0.00)
     ultima_consulta = Column(DateTime)
-    status_consulta = Column(String(20))  # "SUCCESS", "ERROR"
+    status_consulta = Column(String(20))  # "SUCCESS", "PARCIAL", "ERROR"
+    secoes_desatualizadas = Column(String(100))  # "pgmei,caixa" - APIs que falharam na última consulta
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     def __repr__(self):
-        return f"<Haylander(cnpj={self.cnpj}, razao_social={self.razao_social})>" 
\ No newline at end of file
+        return f"<Haylander(cnpj={self.cnpj}, razao_social={self.razao_social})>" 
+
+
+class ConsultaLote(Base):
+    """Lote de consultas (POST /consultar/lote)"""
+    
+    __tablename__ = "consulta_lote"
+    
+    id = Column(String(32), primary_key=True)
+    total = Column(Integer, default=0)
+    concorrencia = Column(Integer, default=1)
+    status = Column(String(20), default="PENDENTE")  # "PENDENTE", "EXECUTANDO", "CONCLUIDO"
+    criado_em = Column(DateTime, nullable=False)
+    iniciado_em = Column(DateTime)
+    finalizado_em = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<ConsultaLote(id={self.id}, status={self.status})>"
+
+
+class ConsultaFila(Base):
+    """Fila persistente de consultas com lease por worker"""
+    
+    __tablename__ = "consulta_fila"
+    __table_args__ = (
+        Index("ix_consulta_fila_status_proxima", "status", "proxima_tentativa_em"),
+        Index("ix_consulta_fila_lote_status", "lote_id", "status"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    lote_id = Column(String(32), ForeignKey("consulta_lote.id"), nullable=False)
+    cnpj = Column(String(14), nullable=False)
+    
+    # Estado: "PENDENTE", "EXECUTANDO", "CONCLUIDO", "FALHOU"
+    status = Column(String(20), default="PENDENTE", nullable=False)
+    tentativas = Column(Integer, default=0)
+    proxima_tentativa_em = Column(DateTime)
+    ultimo_erro = Column(Text)
+    resultado = Column(Text)  # JSON com resumo do resultado
+    
+    # Lease do worker que está processando o item
+    lease_owner = Column(String(100))
+    lease_expira_em = Column(DateTime)
+    
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<ConsultaFila(cnpj={self.cnpj}, status={self.status})>"
+
+
+class ResumoContador(Base):
+    """Contadores agregados da carteira (GET /resumo), atualizados a cada gravação de Haylander"""
+    
+    __tablename__ = "resumo_contador"
+    
+    chave = Column(String(50), primary_key=True)  # "clientes", "situacao:OK", "valor_total_pendente"...
+    valor = Column(DECIMAL(18, 2), nullable=False, default=0)
+    updated_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<ResumoContador(chave={self.chave}, valor={self.valor})>"
+
+
+class PayloadSerpro(Base):
+    """Resposta bruta de uma API SERPRO, comprimida e deduplicada pelo hash do conteúdo"""
+    
+    __tablename__ = "serpro_payload"
+    
+    hash = Column(String(64), primary_key=True)  # sha256 do JSON canônico
+    codec = Column(String(10), nullable=False)  # "zstd", "gzip" ou "json" (pequenos demais para comprimir)
+    conteudo = Column(LargeBinary, nullable=False)
+    tamanho = Column(Integer)  # Bytes do JSON sem compressão
+    created_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<PayloadSerpro(hash={self.hash[:12]}, codec={self.codec})>"
+
+
+class PayloadConsulta(Base):
+    """Arquivo append-only: payload devolvido por cada API para o CNPJ e quando"""
+    
+    __tablename__ = "serpro_payload_consulta"
+    __table_args__ = (
+        Index("ix_payload_consulta_cnpj_api_obtido", "cnpj", "api", "obtido_em"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String(14), nullable=False)
+    api = Column(String(30), nullable=False)
+    hash = Column(String(64), ForeignKey("serpro_payload.hash"), nullable=False)
+    obtido_em = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<PayloadConsulta(cnpj={self.cnpj}, api={self.api}, obtido_em={self.obtido_em})>"
@@ -0,0 +1,241 @@
+import asyncio
+import cProfile
+import contextvars
+import io
+import pstats
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+# Spans por requisição (o excedente só é contado)
+MAX_SPANS = 2000
+
+
+class PerfilRequisicao:
+    """Spans de uma requisição perfilada: (nome, categoria, início ms, duração ms, atributos)"""
+    
+    def __init__(self, metodo: str, caminho: str, forcado: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.metodo = metodo
+        self.caminho = caminho
+        self.forcado = forcado
+        self.criado_em = datetime.now()
+        self.inicio = time.perf_counter()
+        self.duracao_ms = 0.0
+        self.status: Optional[int] = None
+        self.spans: List[tuple] = []
+        self.spans_descartados = 0
+        self.cprofile: Optional[str] = None
+        self.finalizado = False
+        self._token = None
+        self._profiler: Optional[cProfile.Profile] = None
+    
+    def registrar(self, nome: str, categoria: str, inicio: float, fim: float, atributos: Dict[str, Any]):
+        if self.finalizado:
+            return
+        if len(self.spans) >= MAX_SPANS:
+            self.spans_descartados += 1
+            return
+        self.spans.append((
+            nome, categoria, round((inicio - self.inicio) * 1000, 2), round((fim - inicio) * 1000, 2), atributos
+        ))
+    
+    def por_categoria(self) -> Dict[str, Dict[str, float]]:
+        """Tempo somado por categoria (spans concorrentes se sobrepõem: a soma pode passar da duração)"""
+        resumo: Dict[str, Dict[str, float]] = {}
+        for _, categoria, _, duracao, _ in self.spans:
+            item = resumo.setdefault(categoria, {"spans": 0, "total_ms": 0.0, "maior_ms": 0.0})
+            item["spans"] += 1
+            item["total_ms"] = round(item["total_ms"] + duracao, 2)
+            item["maior_ms"] = max(item["maior_ms"], duracao)
+        return resumo
+    
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "metodo": self.metodo,
+            "caminho": self.caminho,
+            "status": self.status,
+            "criado_em": self.criado_em,
+            "duracao_ms": self.duracao_ms,
+            "forcado": self.forcado,
+            "cprofile": self.cprofile is not None,
+            "por_categoria": self.por_categoria()
+        }
+    
+    def detalhe(self) -> Dict[str, Any]:
+        return {
+            **self.resumo(),
+            "spans": [
+                {"nome": nome, "categoria": categoria, "inicio_ms": inicio, "duracao_ms": duracao, **atributos}
+                for nome, categoria, inicio, duracao, atributos in sorted(self.spans, key=lambda span: span[2])
+            ],
+            "spans_descartados": self.spans_descartados,
+            "cprofile": self.cprofile
+        }
+
+
+_perfil_atual: ContextVar[Optional[PerfilRequisicao]] = ContextVar("perfil_atual", default=None)
+
+
+@contextmanager
+def span(nome: str, categoria: str, **atributos):
+    """Mede o bloco como um span da requisição perfilada (sem custo fora dela)
+    
+    Produz o dicionário de atributos, que o bloco pode completar (ex.: status).
+    """
+    perfil = _perfil_atual.get()
+    if perfil is None:
+        yield atributos
+        return
+    inicio = time.perf_counter()
+    try:
+        yield atributos
+    finally:
+        perfil.registrar(nome, categoria, inicio, time.perf_counter(), atributos)
+
+
+def registrar_span(nome: str, categoria: str, inicio: float, fim: float, **atributos):
+    """Span já medido (listeners do SQLAlchemy)"""
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.registrar(nome, categoria, inicio, fim, atributos)
+
+
+def tarefa_sem_perfil(coro) -> asyncio.Task:
+    """Tarefa compartilhada entre requisições (micro-lotes): não herda o perfil de quem a criou"""
+    contexto = contextvars.copy_context()
+    contexto.run(_perfil_atual.set, None)
+    return asyncio.get_event_loop().create_task(coro, context=contexto)
+
+
+class PerfisRequisicao:
+    """Buffer circular das requisições lentas perfiladas (GET /debug/perfis)
+    
+    Perfila as requisições com o header X-Perfil (1 ou "cprofile") e uma
+    amostra de PERFIL_AMOSTRAGEM das demais; guarda as que passam de
+    PERFIL_LENTO_MS (e todas as pedidas por header). Uma fração delas roda
+    também sob cProfile, uma por vez: o cProfile vê todo o event loop, então
+    a captura inclui o que as requisições concorrentes fizeram no período.
+    Só as PERFIL_CPROFILE_MAX capturas mais lentas do buffer são mantidas.
+    """
+    
+    def __init__(self):
+        self._buffer: Deque[PerfilRequisicao] = deque(maxlen=settings.perfil_buffer_max)
+        self._cprofile_ativo = False
+        self.perfiladas = 0
+        self.guardadas = 0
+    
+    def iniciar(self, metodo: str, caminho: str, pedido: str) -> Optional[PerfilRequisicao]:
+        """Decide se a requisição é perfilada e, se for, ativa o perfil no contexto atual"""
+        if not pedido and random.random() >= settings.perfil_amostragem:
+            return None
+        self.perfiladas += 1
+        perfil = PerfilRequisicao(metodo, caminho, forcado=bool(pedido))
+        perfil._token = _perfil_atual.set(perfil)
+        
+        quer_cprofile = pedido == "cprofile" or random.random() < settings.perfil_cprofile_amostragem
+        if quer_cprofile and not self._cprofile_ativo:
+            self._cprofile_ativo = True
+            perfil._profiler = cProfile.Profile()
+            perfil._profiler.enable()
+        return perfil
+    
+    def finalizar(self, perfil: PerfilRequisicao, status: Optional[int]):
+        perfil.duracao_ms = round((time.perf_counter() - perfil.inicio) * 1000, 1)
+        perfil.status = status
+        perfil.finalizado = True
+        _perfil_atual.reset(perfil._token)
+        
+        profiler, perfil._token, perfil._profiler = perfil._profiler, None, None
+        if profiler is not None:
+            profiler.disable()
+            self._cprofile_ativo = False
+        
+        if not perfil.forcado and perfil.duracao_ms < settings.perfil_lento_ms:
+            return
+        if profiler is not None and self._manter_cprofile(perfil):
+            saida = io.StringIO()
+            pstats.Stats(profiler, stream=saida).sort_stats("cumulative").print_stats(40)
+            perfil.cprofile = saida.getvalue()
+        
+        self._buffer.append(perfil)
+        self.guardadas += 1
+        logger.info(
+            f"🔬 Perfil {perfil.id}: {perfil.metodo} {perfil.caminho} em {perfil.duracao_ms}ms "
+            f"({len(perfil.spans)} spans)"
+        )
+    
+    def _manter_cprofile(self, perfil: PerfilRequisicao) -> bool:
+        """Abre espaço descartando a captura mais rápida, se esta for mais lenta"""
+        capturas = [p for p in self._buffer if p.cprofile is not None]
+        if len(capturas) < settings.perfil_cprofile_max:
+            return True
+        mais_rapida = min(capturas, key=lambda p: p.duracao_ms)
+        if mais_rapida.duracao_ms >= perfil.duracao_ms:
+            return False
+        mais_rapida.cprofile = None
+        return True
+    
+    def listar(self) -> List[Dict[str, Any]]:
+        """Perfis guardados, do mais lento para o mais rápido"""
+        return [p.resumo() for p in sorted(self._buffer, key=lambda p: p.duracao_ms, reverse=True)]
+    
+    def obter(self, perfil_id: str) -> Optional[Dict[str, Any]]:
+        for perfil in self._buffer:
+            if perfil.id == perfil_id:
+                return perfil.detalhe()
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.perfil_enabled,
+            "perfiladas": self.perfiladas,
+            "guardadas": self.guardadas,
+            "no_buffer": len(self._buffer)
+        }
+
+
+class MiddlewarePerfil:
+    """Middleware ASGI: perfila a requisição e devolve o id no header X-Perfil-Id"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.perfil_enabled:
+            await self.app(scope, receive, send)
+            return
+        
+        pedido = dict(scope["headers"]).get(b"x-perfil", b"").decode("latin-1").strip().lower()
+        perfil = perfis_requisicao.iniciar(scope["method"], scope["path"], pedido)
+        if perfil is None:
+            await self.app(scope, receive, send)
+            return
+        
+        status = None
+        
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                mensagem = {**mensagem, "headers": [*mensagem.get("headers", []), (b"x-perfil-id", perfil.id.encode())]}
+            await send(mensagem)
+        
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            perfis_requisicao.finalizar(perfil, status)
+
+
+# Instância global dos perfis de requisição
+perfis_requisicao = PerfisRequisicao()
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from loguru import logger
+
+from app.config import settings
+
+
+def familia_endpoint(endpoint: str) -> str:
+    """Família do endpoint SERPRO ("/caixa-postal/mensagens/..." -> "caixa-postal")"""
+    return endpoint.strip("/").split("/", 1)[0] or "outros"
+
+
+class TokenBucket:
+    """Token bucket assíncrono: `taxa` chamadas por segundo com rajada de `capacidade`"""
+    
+    def __init__(self, taxa: float, capacidade: Optional[float] = None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(taxa, 1.0)
+        self.tokens = self.capacidade
+        self.aguardando = 0
+        self._ultimo = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+    
+    def _repor(self):
+        agora = time.monotonic()
+        self.tokens = min(self.capacidade, self.tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+    
+    async def adquirir(self):
+        """Aguarda (em ordem de chegada) até haver um token disponível"""
+        if self.taxa <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        
+        self.aguardando += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._repor()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await asyncio.sleep((1 - self.tokens) / self.taxa)
+        finally:
+            self.aguardando -= 1
+    
+    def status(self) -> Dict[str, Any]:
+        if self.taxa > 0:
+            self._repor()
+        return {
+            "taxa_rps": self.taxa,
+            "tokens": round(self.tokens, 2),
+            "aguardando": self.aguardando
+        }
+
+
+class ConcorrenciaAdaptativa:
+    """Limite de concorrência AIMD
+    
+    Sucesso abaixo da latência alvo aumenta o limite em 1/limite (≈ +1 por
+    rodada); 429, 5xx, timeout ou latência acima do alvo cortam o limite pela
+    metade, no máximo uma vez por janela.
+    """
+    
+    def __init__(self, nome: str, maximo: int, minimo: int, latencia_alvo_ms: float):
+        self.nome = nome
+        self.maximo = max(maximo, 1)
+        self.minimo = max(min(minimo, self.maximo), 1)
+        self.latencia_alvo_ms = latencia_alvo_ms
+        self.limite = float(self.maximo)
+        self.em_voo = 0
+        self.aguardando = 0
+        self.cortes = 0
+        self._ultimo_corte = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+    
+    @property
+    def _condicao(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+    
+    async def adquirir(self):
+        async with self._condicao:
+            self.aguardando += 1
+            try:
+                await self._condicao.wait_for(lambda: self.em_voo < int(self.limite))
+            finally:
+                self.aguardando -= 1
+            self.em_voo += 1
+    
+    async def liberar(self, latencia_ms: float, sobrecarga: bool, ajustar: bool = True):
+        """Devolve a vaga; ajustar=False (chamada cancelada) não muda o limite"""
+        async with self._condicao:
+            self.em_voo -= 1
+            if ajustar:
+                self._ajustar(latencia_ms, sobrecarga)
+            self._condicao.notify_all()
+    
+    def _ajustar(self, latencia_ms: float, sobrecarga: bool):
+        if sobrecarga or latencia_ms > self.latencia_alvo_ms:
+            agora = time.monotonic()
+            if agora - self._ultimo_corte >= settings.concorrencia_janela_corte_seconds:
+                self._ultimo_corte = agora
+                self.limite = max(float(self.minimo), self.limite * settings.concorrencia_fator_corte)
+                self.cortes += 1
+                logger.warning(
+                    f"📉 {self.nome}: limite de concorrência reduzido para {int(self.limite)} "
+                    f"({'sobrecarga' if sobrecarga else f'latência {latencia_ms:.0f}ms'})"
+                )
+        else:
+            self.limite = min(float(self.maximo), self.limite + 1.0 / self.limite)
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "limite": int(self.limite),
+            "maximo": self.maximo,
+            "em_voo": self.em_voo,
+            "aguardando": self.aguardando,
+            "cortes": self.cortes
+        }
+
+
+class _Slot:
+    """Vaga obtida no limitador; registrar() informa o resultado da chamada"""
+    
+    def __init__(self):
+        self.status_code: Optional[int] = None
+        self.descartado = False
+    
+    def registrar(self, status_code: int):
+        self.status_code = status_code
+    
+    def descartar(self):
+        """A chamada não foi feita (ex.: prazo esgotado na espera): libera sem ajustar o limite"""
+        self.descartado = True
+
+
+class SerproRateLimiter:
+    """Rate limit global + por família e concorrência adaptativa por família"""
+    
+    def __init__(self):
+        self._global = TokenBucket(settings.rate_limit_global_rps)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._concorrencia: Dict[str, ConcorrenciaAdaptativa] = {}
+    
+    def _bucket(self, familia: str) -> TokenBucket:
+        if familia not in self._buckets:
+            taxa = settings.rate_limit_familias_rps.get(familia, settings.rate_limit_familia_padrao_rps)
+            self._buckets[familia] = TokenBucket(taxa)
+        return self._buckets[familia]
+    
+    def _controle(self, familia: str) -> ConcorrenciaAdaptativa:
+        if familia not in self._concorrencia:
+            maximo = settings.concorrencia_max_familias.get(familia, settings.concorrencia_max_padrao)
+            self._concorrencia[familia] = ConcorrenciaAdaptativa(
+                familia, maximo, settings.concorrencia_min, settings.concorrencia_latencia_alvo_ms
+            )
+        return self._concorrencia[familia]
+    
+    @asynccontextmanager
+    async def slot(self, familia: str):
+        """Aguarda vaga de concorrência e tokens (família e global) antes da chamada"""
+        controle = self._controle(familia)
+        await controle.adquirir()
+        slot = _Slot()
+        inicio = time.perf_counter()
+        try:
+            await self._bucket(familia).adquirir()
+            await self._global.adquirir()
+            inicio = time.perf_counter()
+            yield slot
+        except asyncio.CancelledError:
+            # Cancelada (hedge perdedor, cliente desconectou): não é evidência de saúde nem de sobrecarga
+            await controle.liberar(0.0, sobrecarga=False, ajustar=False)
+            raise
+        except Exception:
+            # Timeout ou erro de conexão contam como sobrecarga
+            await controle.liberar((time.perf_counter() - inicio) * 1000, sobrecarga=True)
+            raise
+        else:
+            codigo = slot.status_code
+            sobrecarga = codigo is not None and (codigo == 429 or codigo >= 500)
+            await controle.liberar((time.perf_counter() - inicio) * 1000, sobrecarga, ajustar=not slot.descartado)
+    
+    def status(self) -> Dict[str, Any]:
+        """Limites atuais e profundidade das filas para monitoramento"""
+        familias = set(self._buckets) | set(self._concorrencia)
+        return {
+            "global": self._global.status(),
+            "familias": {
+                familia: {
+                    "rate": self._bucket(familia).status(),
+                    "concorrencia": self._controle(familia).status()
+                }
+                for familia in sorted(familias)
+            }
+        }
+
+
+# Instância global do limitador
+rate_limiter = SerproRateLimiter()
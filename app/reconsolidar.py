@@ -0,0 +1,156 @@
+"""Reconsolidação offline a partir do arquivo de payloads SERPRO
+
+Uso (na raiz do projeto, com o .env configurado):
+    python -m app.reconsolidar --processos 4
+    python -m app.reconsolidar --cnpj 12345678000199 --simular
+
+Reaplica consolidar_dados_serpro à resposta mais recente de cada API
+arquivada para cada CNPJ da carteira, sem nenhuma chamada ao SERPRO. Descompressão e
+consolidação rodam em paralelo (multiprocessing); a gravação usa o mesmo
+upsert em lote das consultas (atualizando o resumo da carteira). Com
+--simular nada é gravado: só informa quantos clientes mudariam de situação.
+Só atualiza clientes existentes: CNPJs removidos da carteira (DELETE
+/cliente/{cnpj}) continuam no arquivo, mas não são recriados.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from app.arquivo import carregar_payload
+from app.consolidacao import consolidar_dados_serpro
+from app.crud import salvar_clientes
+from app.database import SessionLocal, init_db, reservar_escrita
+from app.models import Haylander, PayloadConsulta, PayloadSerpro
+
+# Campos que descrevem a consulta, não os dados: a reconsolidação mantém os da última consulta real
+CAMPOS_DA_CONSULTA = ("ultima_consulta", "status_consulta", "secoes_desatualizadas")
+
+# (cnpj, [(api, obtido_em, codec, conteudo)])
+Bloco = List[Tuple[str, List[Tuple[str, datetime, str, bytes]]]]
+
+
+def consolidar_bloco(bloco: Bloco) -> Dict[str, dict]:
+    """Executado nos processos: descomprime os payloads e consolida cada CNPJ"""
+    consolidados = {}
+    for cnpj, respostas in bloco:
+        dados_apis = {"_meta": {"obtido_em": {}}}
+        for api, obtido_em, codec, conteudo in respostas:
+            dados_apis[api] = carregar_payload(codec, conteudo)
+            dados_apis["_meta"]["obtido_em"][api] = obtido_em
+        dados = consolidar_dados_serpro(cnpj, dados_apis)
+        for campo in CAMPOS_DA_CONSULTA:
+            dados.pop(campo, None)
+        consolidados[cnpj] = dados
+    return consolidados
+
+
+def _blocos(db: Session, cnpjs: Optional[List[str]], tamanho: int) -> Iterator[Bloco]:
+    """Payload mais recente de cada API por CNPJ da carteira, em blocos de `tamanho` CNPJs"""
+    stmt = select(PayloadConsulta.cnpj).distinct().join(Haylander, Haylander.cnpj == PayloadConsulta.cnpj)
+    if cnpjs:
+        stmt = stmt.where(PayloadConsulta.cnpj.in_(cnpjs))
+    cnpjs = list(db.scalars(stmt.order_by(PayloadConsulta.cnpj)))
+    
+    for inicio in range(0, len(cnpjs), tamanho):
+        grupo = cnpjs[inicio:inicio + tamanho]
+        ultimos = (
+            select(PayloadConsulta.cnpj, PayloadConsulta.api, func.max(PayloadConsulta.obtido_em).label("obtido_em"))
+            .where(PayloadConsulta.cnpj.in_(grupo))
+            .group_by(PayloadConsulta.cnpj, PayloadConsulta.api)
+            .subquery()
+        )
+        stmt = (
+            select(PayloadConsulta.cnpj, PayloadConsulta.api, PayloadConsulta.obtido_em,
+                   PayloadSerpro.codec, PayloadSerpro.conteudo)
+            .join(ultimos, and_(
+                PayloadConsulta.cnpj == ultimos.c.cnpj,
+                PayloadConsulta.api == ultimos.c.api,
+                PayloadConsulta.obtido_em == ultimos.c.obtido_em
+            ))
+            .join(PayloadSerpro, PayloadSerpro.hash == PayloadConsulta.hash)
+            .order_by(PayloadConsulta.cnpj)
+        )
+        linhas = db.execute(stmt).all()
+        yield [
+            (cnpj, [(api, obtido_em, codec, conteudo) for _, api, obtido_em, codec, conteudo in respostas])
+            for cnpj, respostas in groupby(linhas, key=lambda linha: linha.cnpj)
+        ]
+
+
+def _gravar(db: Session, consolidados: Dict[str, dict], simular: bool) -> int:
+    """Grava o bloco (ou só simula) e retorna quantos clientes mudaram de situação geral
+    
+    Só atualiza: clientes removidos depois da listagem dos blocos ficam de fora
+    (lidos já com o lock de escrita, ninguém os remove até o commit).
+    """
+    reservar_escrita(db)
+    antes = dict(db.execute(
+        select(Haylander.cnpj, Haylander.situacao_geral).where(Haylander.cnpj.in_(list(consolidados)))
+    ).all())
+    consolidados = {cnpj: dados for cnpj, dados in consolidados.items() if cnpj in antes}
+    clientes = salvar_clientes(db, consolidados, commit=False)
+    alterados = sum(1 for cliente in clientes if antes.get(cliente.cnpj) != cliente.situacao_geral)
+    if simular:
+        db.rollback()
+    else:
+        db.commit()
+    return alterados
+
+
+def reconsolidar(
+    processos: int, tamanho_bloco: int = 200, cnpjs: Optional[List[str]] = None, simular: bool = False
+) -> Dict[str, float]:
+    """Reconsolida os CNPJs arquivados (todos ou só `cnpjs`)"""
+    inicio = time.perf_counter()
+    clientes = alterados = 0
+    with SessionLocal() as db, ProcessPoolExecutor(max_workers=processos) as executor:
+        # Poucos blocos em andamento: a memória não cresce com o tamanho do arquivo
+        em_andamento = deque()
+        for bloco in _blocos(db, cnpjs, tamanho_bloco):
+            em_andamento.append(executor.submit(consolidar_bloco, bloco))
+            if len(em_andamento) >= 2 * processos:
+                consolidados = em_andamento.popleft().result()
+                clientes += len(consolidados)
+                alterados += _gravar(db, consolidados, simular)
+        while em_andamento:
+            consolidados = em_andamento.popleft().result()
+            clientes += len(consolidados)
+            alterados += _gravar(db, consolidados, simular)
+    
+    duracao = time.perf_counter() - inicio
+    return {
+        "clientes": clientes,
+        "situacao_alterada": alterados,
+        "duracao_segundos": round(duracao, 2),
+        "clientes_por_segundo": round(clientes / duracao, 1) if duracao else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--bloco", type=int, default=200, help="CNPJs por tarefa")
+    parser.add_argument("--cnpj", action="append", help="Só este CNPJ (pode repetir)")
+    parser.add_argument("--simular", action="store_true", help="Não grava; só conta as mudanças de situação")
+    args = parser.parse_args()
+    
+    init_db()
+    cnpjs = [''.join(filter(str.isdigit, cnpj)) for cnpj in args.cnpj] if args.cnpj else None
+    r = reconsolidar(args.processos, args.bloco, cnpjs, args.simular)
+    print(
+        f"{'(simulação) ' if args.simular else ''}{r['clientes']} clientes reconsolidados em "
+        f"{r['duracao_segundos']}s ({r['clientes_por_segundo']}/s), "
+        f"{r['situacao_alterada']} com situação geral alterada"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from loguru import logger
+
+from app.config import settings
+from app.perfil import tarefa_sem_perfil
+
+
+# TTL padrão por API (segundos): caixa postal muda com frequência, cadastro e procurações raramente
+TTL_PADRAO = {
+    "pgmei_divida": 6 * 3600,
+    "pgdasd_declaracoes": 12 * 3600,
+    "ccmei_dados": 7 * 86400,
+    "ccmei_situacao": 7 * 86400,
+    "caixa_postal": 15 * 60,
+    "procuracoes": 7 * 86400,
+}
+
+# Espera máxima (segundos) antes de gravar no SQLite as entradas pendentes
+JANELA_GRAVACAO = 0.5
+
+
+def resposta_cacheavel(dados: Dict[str, Any]) -> bool:
+    """Só respostas 200 entram no cache (erro, 404 e 403 não)"""
+    return dados.get("status") not in ("error", "not_found", "forbidden")
+
+
+class ResponseCache:
+    """Cache de respostas SERPRO por API e CNPJ
+    
+    LRU em memória com TTL por API; opcionalmente persistido em SQLite para
+    sobreviver a reinícios (CACHE_SQLITE_PATH). O SQLite só é lido no
+    aquecimento, ao abrir; as gravações ficam pendentes e são gravadas em
+    lote fora do event loop (a última por chave vale).
+    """
+    
+    def __init__(self):
+        self._entradas: "OrderedDict[Tuple[str, str], Tuple[datetime, Dict[str, Any]]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # Uma gravação no SQLite por vez
+        # (api, cnpj) -> entrada a gravar, ou None para apagar
+        self._pendentes: Dict[Tuple[str, str], Optional[Tuple[datetime, Dict[str, Any]]]] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._gravacoes: set = set()
+        self.erros_gravacao = 0
+        
+        if settings.cache_sqlite_path:
+            self._abrir_sqlite(settings.cache_sqlite_path)
+    
+    def _abrir_sqlite(self, caminho: str):
+        try:
+            Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(caminho, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS serpro_cache ("
+                " api TEXT NOT NULL, cnpj TEXT NOT NULL, obtido_em TEXT NOT NULL, payload TEXT NOT NULL,"
+                " PRIMARY KEY (api, cnpj))"
+            )
+            # Descartar entradas além do maior TTL
+            limite = datetime.now() - timedelta(seconds=max(self._ttls().values()))
+            self._conn.execute("DELETE FROM serpro_cache WHERE obtido_em < ?", (limite.isoformat(),))
+            self._conn.commit()
+            self._aquecer()
+            logger.info(
+                f"🗄️ Cache de respostas SERPRO persistido em {caminho} ({len(self._entradas)} entradas carregadas)"
+            )
+        except Exception as e:
+            logger.error(f"Erro ao abrir cache SQLite {caminho}: {e}")
+            self._conn = None
+    
+    def _aquecer(self):
+        """Carrega no LRU as entradas mais recentes do SQLite (as mais novas ficam no fim)"""
+        linhas = self._conn.execute(
+            "SELECT api, cnpj, obtido_em, payload FROM serpro_cache ORDER BY obtido_em DESC LIMIT ?",
+            (settings.cache_max_entradas,)
+        ).fetchall()
+        for api, cnpj, obtido_em, payload in reversed(linhas):
+            self._entradas[(api, cnpj)] = (datetime.fromisoformat(obtido_em), json.loads(payload))
+    
+    def _ttls(self) -> Dict[str, int]:
+        return {**TTL_PADRAO, **settings.cache_ttl_seconds}
+    
+    def ttl(self, api: str) -> int:
+        return self._ttls().get(api, 0)
+    
+    def _contar(self, api: str, chave: str):
+        self._stats.setdefault(api, {"hits": 0, "misses": 0})[chave] += 1
+    
+    def get(self, api: str, cnpj: str) -> Optional[Tuple[datetime, Dict[str, Any]]]:
+        """Resposta ainda fresca (obtida_em, payload) ou None"""
+        ttl = self.ttl(api)
+        if not settings.cache_enabled or ttl <= 0:
+            return None
+        
+        limite = datetime.now() - timedelta(seconds=ttl)
+        chave = (api, cnpj)
+        entrada = self._entradas.get(chave)
+        if entrada is None or entrada[0] < limite:
+            self._contar(api, "misses")
+            return None
+        
+        self._entradas.move_to_end(chave)
+        self._contar(api, "hits")
+        return entrada
+    
+    def put(self, api: str, cnpj: str, payload: Dict[str, Any], obtido_em: Optional[datetime] = None):
+        """Guarda a resposta se for cacheável"""
+        if not settings.cache_enabled or self.ttl(api) <= 0 or not resposta_cacheavel(payload):
+            return
+        
+        entrada = (obtido_em or datetime.now(), payload)
+        chave = (api, cnpj)
+        self._guardar_memoria(chave, entrada)
+        self._agendar_gravacao({chave: entrada})
+    
+    def _guardar_memoria(self, chave: Tuple[str, str], entrada: Tuple[datetime, Dict[str, Any]]):
+        self._entradas[chave] = entrada
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > settings.cache_max_entradas:
+            self._entradas.popitem(last=False)
+    
+    def invalidar(self, cnpj: str, api: Optional[str] = None):
+        """Remove as entradas de um CNPJ (todas as APIs ou só uma)"""
+        for chave in [c for c in self._entradas if c[1] == cnpj and (api is None or c[0] == api)]:
+            self._entradas.pop(chave, None)
+        apis = [api] if api is not None else list(self._ttls())
+        self._agendar_gravacao({(nome, cnpj): None for nome in apis})
+    
+    def _agendar_gravacao(self, alteracoes: Dict[Tuple[str, str], Optional[Tuple[datetime, Dict[str, Any]]]]):
+        if self._conn is None:
+            return
+        self._pendentes.update(alteracoes)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Fora do event loop (scripts): grava na hora
+            self._gravar_lote(self._retirar_pendentes())
+            return
+        if self._timer is None:
+            self._timer = tarefa_sem_perfil(self._aguardar_janela())
+    
+    def _retirar_pendentes(self) -> Dict[Tuple[str, str], Optional[Tuple[datetime, Dict[str, Any]]]]:
+        lote, self._pendentes = self._pendentes, {}
+        return lote
+    
+    async def _aguardar_janela(self):
+        await asyncio.sleep(JANELA_GRAVACAO)
+        self._timer = None
+        self._disparar()
+    
+    def _disparar(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if not self._pendentes:
+            return
+        tarefa = tarefa_sem_perfil(asyncio.to_thread(self._gravar_lote, self._retirar_pendentes()))
+        self._gravacoes.add(tarefa)
+        tarefa.add_done_callback(self._gravacoes.discard)
+    
+    def _gravar_lote(self, lote: Dict[Tuple[str, str], Optional[Tuple[datetime, Dict[str, Any]]]]):
+        """Grava e apaga as entradas do lote numa única transação (thread de I/O)"""
+        gravar = [
+            (api, cnpj, entrada[0].isoformat(), json.dumps(entrada[1]))
+            for (api, cnpj), entrada in lote.items() if entrada is not None
+        ]
+        apagar = [chave for chave, entrada in lote.items() if entrada is None]
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO serpro_cache (api, cnpj, obtido_em, payload) VALUES (?, ?, ?, ?)", gravar
+                    )
+                    self._conn.executemany("DELETE FROM serpro_cache WHERE api = ? AND cnpj = ?", apagar)
+            except Exception as e:
+                # O cache em memória continua valendo: só a persistência deste lote se perde
+                self.erros_gravacao += len(lote)
+                logger.warning(f"Erro ao persistir {len(lote)} entradas do cache: {e}")
+    
+    async def close(self):
+        """Grava o que estiver pendente (shutdown)"""
+        self._disparar()
+        if self._gravacoes:
+            await asyncio.gather(*self._gravacoes, return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hits e misses por API (cada hit é uma chamada SERPRO economizada)"""
+        hits = sum(s["hits"] for s in self._stats.values())
+        misses = sum(s["misses"] for s in self._stats.values())
+        return {
+            "habilitado": settings.cache_enabled,
+            "entradas": len(self._entradas),
+            "persistente": self._conn is not None,
+            "pendentes_gravacao": len(self._pendentes),
+            "erros_gravacao": self.erros_gravacao,
+            "hits": hits,
+            "misses": misses,
+            "taxa_acerto": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "por_api": self._stats
+        }
+
+
+# Instância global do cache de respostas
+response_cache = ResponseCache()
@@ -0,0 +1,146 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.database import insert_upsert, reservar_escrita
+from app.models import Haylander, ResumoContador
+
+# Colunas de Haylander que entram no resumo
+COLUNAS_RESUMO = (
+    "situacao_geral",
+    "valor_total_pendente",
+    "caixa_mensagens_nao_lidas",
+    "procuracoes_ativas",
+    "procuracoes_ultimo_update",
+)
+
+
+def contribuicao(cliente: Optional[Any]) -> Dict[str, Decimal]:
+    """Quanto um registro (objeto ou mapping com COLUNAS_RESUMO) soma em cada contador"""
+    if cliente is None:
+        return {}
+    valor = (lambda coluna: cliente[coluna]) if isinstance(cliente, dict) else (lambda coluna: getattr(cliente, coluna))
+    
+    contadores = {
+        "clientes": Decimal(1),
+        f"situacao:{valor('situacao_geral') or 'SEM_SITUACAO'}": Decimal(1),
+        "valor_total_pendente": Decimal(str(valor("valor_total_pendente") or 0)),
+    }
+    if (valor("caixa_mensagens_nao_lidas") or 0) > 0:
+        contadores["caixa_nao_lidas"] = Decimal(1)
+    # Procurações já consultadas e sem nenhuma ativa: precisam ser renovadas
+    if valor("procuracoes_ultimo_update") is not None and not valor("procuracoes_ativas"):
+        contadores["procuracoes_expiradas"] = Decimal(1)
+    return contadores
+
+
+def linhas_resumo(db: Session, cnpjs: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Valores atuais das colunas do resumo (antes de uma gravação)
+    
+    Lidos na transação da gravação, com lock de escrita: ninguém altera as
+    linhas entre esta leitura e o commit, então o delta aplicado no resumo
+    corresponde exatamente à gravação.
+    """
+    reservar_escrita(db)
+    colunas = [getattr(Haylander, coluna) for coluna in COLUNAS_RESUMO]
+    linhas = db.execute(
+        select(Haylander.cnpj, *colunas).where(Haylander.cnpj.in_(list(cnpjs))).with_for_update()
+    ).mappings()
+    return {linha["cnpj"]: dict(linha) for linha in linhas}
+
+
+def atualizar_resumo(db: Session, antes: Iterable[Optional[Any]], depois: Iterable[Optional[Any]]):
+    """Aplica a diferença (depois - antes) nos contadores, na transação do chamador
+    
+    Cada contador é somado no próprio banco (valor = valor + delta), então
+    gravações simultâneas não se sobrescrevem.
+    """
+    deltas: Dict[str, Decimal] = {}
+    for registro in antes:
+        for chave, valor in contribuicao(registro).items():
+            deltas[chave] = deltas.get(chave, Decimal(0)) - valor
+    for registro in depois:
+        for chave, valor in contribuicao(registro).items():
+            deltas[chave] = deltas.get(chave, Decimal(0)) + valor
+    deltas = {chave: valor for chave, valor in deltas.items() if valor}
+    if not deltas:
+        return
+    
+    agora = datetime.now()
+    insert = insert_upsert(db)
+    for chave, delta in sorted(deltas.items()):
+        if insert is not None:
+            stmt = insert(ResumoContador).values(chave=chave, valor=delta, updated_at=agora)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[ResumoContador.chave],
+                set_={"valor": ResumoContador.valor + stmt.excluded.valor, "updated_at": agora}
+            ))
+        else:
+            alterados = db.execute(
+                update(ResumoContador)
+                .where(ResumoContador.chave == chave)
+                .values(valor=ResumoContador.valor + delta, updated_at=agora)
+            ).rowcount
+            if not alterados:
+                db.add(ResumoContador(chave=chave, valor=delta, updated_at=agora))
+
+
+def reconstruir_resumo(db: Session) -> int:
+    """Recalcula todos os contadores a partir da tabela haylander (fallback / correção de desvios)"""
+    agora = datetime.now()
+    contadores: Dict[str, Decimal] = {}
+    
+    totais = db.execute(select(
+        func.count(Haylander.id),
+        func.coalesce(func.sum(Haylander.valor_total_pendente), 0),
+        func.coalesce(func.sum(case((Haylander.caixa_mensagens_nao_lidas > 0, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(
+            Haylander.procuracoes_ultimo_update.is_not(None),
+            func.coalesce(Haylander.procuracoes_ativas, 0) == 0
+        ), 1), else_=0)), 0),
+    )).one()
+    contadores["clientes"] = Decimal(totais[0])
+    contadores["valor_total_pendente"] = Decimal(str(totais[1]))
+    contadores["caixa_nao_lidas"] = Decimal(totais[2])
+    contadores["procuracoes_expiradas"] = Decimal(totais[3])
+    
+    por_situacao = db.execute(
+        select(func.coalesce(Haylander.situacao_geral, "SEM_SITUACAO"), func.count(Haylander.id))
+        .group_by(func.coalesce(Haylander.situacao_geral, "SEM_SITUACAO"))
+    ).all()
+    for situacao, total in por_situacao:
+        contadores[f"situacao:{situacao}"] = Decimal(total)
+    
+    db.query(ResumoContador).delete(synchronize_session=False)
+    db.add_all([ResumoContador(chave=chave, valor=valor, updated_at=agora) for chave, valor in contadores.items()])
+    db.commit()
+    logger.info(f"📊 Resumo da carteira reconstruído ({int(contadores['clientes'])} clientes)")
+    return int(contadores["clientes"])
+
+
+def garantir_resumo(db: Session):
+    """Reconstrói os contadores se ainda não existirem (primeira execução com dados antigos)"""
+    if db.query(ResumoContador.chave).first() is None:
+        reconstruir_resumo(db)
+
+
+def ler_resumo(db: Session) -> Dict[str, Any]:
+    """Resumo a partir dos contadores (poucas linhas, independente do tamanho da carteira)"""
+    contadores = db.query(ResumoContador).all()
+    valores = {contador.chave: contador.valor for contador in contadores}
+    return {
+        "total_clientes": int(valores.get("clientes", 0)),
+        "por_situacao": {
+            chave.split(":", 1)[1]: int(valor)
+            for chave, valor in sorted(valores.items())
+            if chave.startswith("situacao:") and valor
+        },
+        "valor_total_pendente": valores.get("valor_total_pendente", Decimal(0)),
+        "com_mensagens_nao_lidas": int(valores.get("caixa_nao_lidas", 0)),
+        "procuracoes_expiradas": int(valores.get("procuracoes_expiradas", 0)),
+        "atualizado_em": max((c.updated_at for c in contadores if c.updated_at), default=None),
+    }
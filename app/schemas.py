@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 from decimal import Decimal
 
@@ -60,6 +60,7 @@ class HaylanderResponse(BaseModel):
     valor_total_pendente: Optional[Decimal] = 0.00
     ultima_consulta: Optional[datetime] = None
     status_consulta: Optional[str] = None
+    secoes_desatualizadas: Optional[str] = None
     
     # Timestamps
     created_at: datetime
@@ -69,6 +70,16 @@ class HaylanderResponse(BaseModel):
         orm_mode = True
 
 
+class FiltrosClientes(BaseModel):
+    """Filtros da listagem de clientes"""
+    situacao_geral: Optional[str] = None
+    status_consulta: Optional[str] = None
+    pgmei_tem_divida: Optional[bool] = None
+    valor_min: Optional[Decimal] = None
+    valor_max: Optional[Decimal] = None
+    desatualizado_horas: Optional[float] = None  # Última consulta há mais de N horas (ou nunca consultado)
+
+
 class ConsultaResponse(BaseModel):
     """Resposta da consulta completa"""
     success: bool
@@ -76,8 +87,56 @@ class ConsultaResponse(BaseModel):
     cnpj: str
     dados: Optional[HaylanderResponse] = None
     errors: Optional[List[str]] = None
+    latencias_ms: Optional[Dict[str, float]] = None
+    cache_hits: Optional[List[str]] = None
+    compartilhada: Optional[bool] = None
+    secoes: Optional[List[str]] = None
+    
+    
+class LoteRequest(BaseModel):
+    """Request para consulta em lote"""
+    cnpjs: List[str] = Field(..., min_items=1, description="Lista de CNPJs (com ou sem formatação)")
+    concorrencia: Optional[int] = Field(None, ge=1, description="Consultas simultâneas no lote")
+
+
+class LoteCriadoResponse(BaseModel):
+    """Resposta da criação de um lote"""
+    job_id: str
+    status: str
+    total: int
+    invalidos: List[str] = []
+
+
+class LoteStatusResponse(BaseModel):
+    """Progresso de um lote de consultas"""
+    job_id: str
+    status: str
+    total: int
+    processados: int
+    sucesso: int
+    erros: int
+    pendentes: int = 0
+    executando: int = 0
+    percentual: float
+    concorrencia: int
+    duracao_segundos: float
+    cnpjs_por_minuto: float
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    finalizado_em: Optional[datetime] = None
+    resultados: Optional[Dict[str, Dict[str, Any]]] = None
     
     
+class ResumoResponse(BaseModel):
+    """Totais da carteira"""
+    total_clientes: int
+    por_situacao: Dict[str, int]
+    valor_total_pendente: Decimal
+    com_mensagens_nao_lidas: int
+    procuracoes_expiradas: int
+    atualizado_em: Optional[datetime] = None
+
+
 class SerproTokenResponse(BaseModel):
     """Resposta do token OAuth SERPRO"""
     access_token: str
@@ -98,4 +157,14 @@ class HealthResponse(BaseModel):
     timestamp: datetime
     version: str = "1.0.0"
     database: str = "connected"
-    serpro_cache: str = "ok" 
\ No newline at end of file
+    banco: Optional[Dict[str, Any]] = None
+    serpro_cache: str = "ok"
+    circuit_breakers: Optional[Dict[str, Any]] = None
+    response_cache: Optional[Dict[str, Any]] = None
+    coalescencia: Optional[Dict[str, Any]] = None
+    gravacao: Optional[Dict[str, Any]] = None
+    agendador: Optional[Dict[str, Any]] = None
+    arquivo: Optional[Dict[str, Any]] = None
+    hedge: Optional[Dict[str, Any]] = None
+    http_pool: Optional[Dict[str, Any]] = None
+    serpro_limites: Optional[Dict[str, Any]] = None 
\ No newline at end of file
@@ -1,14 +1,134 @@
 import httpx
 import asyncio
 import base64
+import random
 import ssl
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Awaitable, Callable, Iterable, List, Tuple
 from loguru import logger
 
 from app.config import settings, get_serpro_urls
 from app.token_cache import token_cache
+from app.token_manager import TokenManager
+from app.http_transport import SerproTransport
+from app.rate_limiter import rate_limiter, familia_endpoint
+from app.circuit_breaker import circuit_breakers, CircuitoAbertoError
+from app.response_cache import response_cache
+from app.arquivo import arquivo_payloads
+from app.metricas import (
+    consulta_segundos, consultas_em_andamento, serpro_requisicao_segundos, serpro_requisicoes, serpro_retentativas
+)
+from app.consolidacao import resposta_vazia
+from app.logs import log_tentativa
+from app.perfil import registrar_span, span
+from app.hedge import hedge_requisicoes
+
+
+# API principal de cada seção do registro Haylander
+SECAO_API = {
+    "pgmei": "pgmei_divida",
+    "pgdasd": "pgdasd_declaracoes",
+    "ccmei": "ccmei_dados",
+    "caixa": "caixa_postal",
+    "procuracoes": "procuracoes",
+}
+
+# Fallbacks: só consultados quando a API principal não traz dados
+FALLBACK_API = {"ccmei_dados": "ccmei_situacao"}
+
+
+# Tentativas por chamada no contexto atual (None = settings.max_retries).
+# A fila persistente usa 1 e guarda o estado de retry no próprio item.
+_max_tentativas: ContextVar[Optional[int]] = ContextVar("max_tentativas", default=None)
+
+
+@contextmanager
+def tentativas_por_chamada(tentativas: int):
+    """Limita as tentativas de _make_request nas chamadas feitas dentro do bloco"""
+    token = _max_tentativas.set(tentativas)
+    try:
+        yield
+    finally:
+        _max_tentativas.reset(token)
+
+
+# Prazo (time.monotonic) das chamadas no contexto atual: timeout e backoff de
+# cada tentativa são cortados ao que resta dele
+_prazo: ContextVar[Optional[float]] = ContextVar("prazo_consulta", default=None)
+
+
+class ContadorChamadas:
+    """Chamadas HTTP cobradas pelo SERPRO (tentativas, hedges e fallbacks)"""
+    
+    def __init__(self):
+        self.total = 0
+
+
+# Contador do contexto atual: as tarefas filhas (fan-out, hedge) copiam o
+# contexto e somam no mesmo objeto
+_contador_chamadas: ContextVar[Optional[ContadorChamadas]] = ContextVar("contador_chamadas", default=None)
+
+
+@contextmanager
+def contar_chamadas():
+    """Conta as chamadas ao SERPRO feitas dentro do bloco"""
+    contador = ContadorChamadas()
+    token = _contador_chamadas.set(contador)
+    try:
+        yield contador
+    finally:
+        _contador_chamadas.reset(token)
+
+
+class PrazoEsgotadoError(Exception):
+    """Não resta tempo, no prazo da consulta, para mais uma tentativa"""
+
+
+@contextmanager
+def prazo_consulta(segundos: float):
+    """Limita a `segundos` as chamadas feitas dentro do bloco (vale o prazo mais curto)"""
+    prazo = time.monotonic() + segundos
+    atual = _prazo.get()
+    token = _prazo.set(prazo if atual is None else min(atual, prazo))
+    try:
+        yield
+    finally:
+        _prazo.reset(token)
+
+
+def tempo_restante() -> Optional[float]:
+    """Segundos até o prazo do contexto atual (None = sem prazo)"""
+    prazo = _prazo.get()
+    return None if prazo is None else prazo - time.monotonic()
+
+
+def _retry_after(valor: Optional[str]) -> Optional[float]:
+    """Header Retry-After em segundos (número ou data HTTP)"""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def espera_retentativa(tentativa: int, response: Optional[httpx.Response] = None) -> float:
+    """Retry-After da resposta ou backoff exponencial com jitter total"""
+    if response is not None:
+        retry_after = _retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            return retry_after
+    teto = min(settings.retry_backoff_max_seconds, settings.retry_backoff_base_seconds * 2 ** tentativa)
+    return random.uniform(0, teto)
 
 
 class SerproClient:
@@ -27,6 +147,30 @@ class SerproClient:
         # SSL Context para certificado
         self.ssl_context = self._setup_ssl()
         
+        # Pool HTTP compartilhado (aberto em start(), fechado em close())
+        self.transport = SerproTransport(self.ssl_context)
+        
+        # Token OAuth2 em memória (token_cache.json só como persistência)
+        self.token_manager = TokenManager(
+            self._fetch_oauth_token,
+            persistencia=token_cache if settings.token_persist else None
+        )
+    
+    async def start(self):
+        """Abre o pool HTTP compartilhado e inicia a renovação de token"""
+        await self.transport.start()
+        await self.token_manager.start()
+    
+    async def close(self):
+        """Para a renovação de token e fecha o pool HTTP compartilhado"""
+        await self.token_manager.close()
+        await self.transport.close()
+    
+    async def reload_ssl(self):
+        """Recarrega o certificado e recria o pool HTTP com o novo contexto SSL"""
+        self.ssl_context = self._setup_ssl()
+        await self.transport.rebuild(self.ssl_context)
+    
     def _setup_ssl(self) -> ssl.SSLContext:
         """Configura contexto SSL com certificado digital"""
         try:
@@ -47,21 +191,20 @@ class SerproClient:
             else:
                 logger.warning("Certificado não encontrado, usando SSL padrão")
                 return ssl.create_default_context()
-                
+        
         except Exception as e:
             logger.error(f"Erro ao configurar SSL: {e}")
             return ssl.create_default_context()
     
     async def _get_oauth_token(self) -> str:
-        """Obtém token OAuth2 do SERPRO"""
+        """Obtém token OAuth2 do SERPRO (memória, com renovação única)"""
+        return await self.token_manager.get_token()
+    
+    async def _fetch_oauth_token(self) -> Tuple[str, int]:
+        """Solicita novo token OAuth2 ao SERPRO"""
         try:
             logger.info("Obtendo novo token OAuth2...")
             
-            # Verificar cache primeiro
-            cached_token = token_cache.get_token()
-            if cached_token:
-                return cached_token
-            
             # Preparar credenciais
             credentials = base64.b64encode(
                 f"{self.consumer_key}:{self.consumer_secret}".encode()
@@ -75,41 +218,93 @@ class SerproClient:
             
             data = "grant_type=client_credentials"
             
-            async with httpx.AsyncClient(
-                timeout=settings.request_timeout_seconds,
-                verify=self.ssl_context
-            ) as client:
-                response = await client.post(
-                    self.token_url,
-                    headers=headers,
-                    content=data
-                )
+            response = await self.transport.post(
+                self.token_url,
+                headers=headers,
+                content=data
+            )
+            
+            if response.status_code == 200:
+                token_data = response.json()
+                access_token = token_data["access_token"]
+                expires_in = token_data.get("expires_in", 3600)
                 
-                if response.status_code == 200:
-                    token_data = response.json()
-                    access_token = token_data["access_token"]
-                    expires_in = token_data.get("expires_in", 3600)
-                    
-                    # Salvar no cache
-                    token_cache.save_token(access_token, expires_in)
-                    
-                    logger.success("Token OAuth2 obtido com sucesso")
-                    return access_token
-                else:
-                    logger.error(f"Erro ao obter token: {response.status_code} - {response.text}")
-                    raise Exception(f"Erro OAuth2: {response.status_code}")
-                    
+                logger.success("Token OAuth2 obtido com sucesso")
+                return access_token, expires_in
+            else:
+                logger.error(f"Erro ao obter token: {response.status_code} - {response.text}")
+                raise Exception(f"Erro OAuth2: {response.status_code}")
+        
         except Exception as e:
             logger.error(f"Erro ao obter token OAuth2: {e}")
             raise
     
+    async def _chamar(self, familia: str, url: str, headers: Dict[str, str]) -> httpx.Response:
+        """Uma chamada HTTP cobrada: passa pelo rate limit e alimenta as métricas"""
+        restante = tempo_restante()
+        if restante is not None and restante <= 0:
+            raise PrazoEsgotadoError("Prazo da consulta esgotado antes da chamada")
+        
+        inicio = time.perf_counter()
+        response = None
+        try:
+            async with rate_limiter.slot(familia) as slot:
+                registrar_span("rate limit", "limite", inicio, time.perf_counter(), familia=familia)
+                # Timeout da tentativa cortado ao que resta do prazo (contado depois da espera do limite)
+                restante = tempo_restante()
+                if restante is not None and restante <= 0:
+                    slot.descartar()
+                else:
+                    timeout = settings.request_timeout_seconds if restante is None else min(
+                        settings.request_timeout_seconds, restante
+                    )
+                    contador = _contador_chamadas.get()
+                    if contador is not None:
+                        contador.total += 1
+                    inicio = time.perf_counter()
+                    response = await self.transport.get(url, headers=headers, timeout=timeout)
+                    slot.registrar(response.status_code)
+        except Exception:
+            serpro_requisicoes.inc(familia, "erro")
+            raise
+        # Prazo esgotado na espera do limite: nenhuma chamada feita, nada a registrar no limite ou no circuito
+        if response is None:
+            raise PrazoEsgotadoError("Prazo da consulta esgotado aguardando o rate limit")
+        serpro_requisicao_segundos.observe(time.perf_counter() - inicio, familia)
+        serpro_requisicoes.inc(familia, str(response.status_code))
+        return response
+    
+    async def _aguardar_retentativa(self, tentativa: int, response: Optional[httpx.Response] = None):
+        """Espera antes da próxima tentativa, sem passar do prazo da consulta"""
+        espera = espera_retentativa(tentativa, response)
+        restante = tempo_restante()
+        if restante is not None and espera >= restante:
+            raise PrazoEsgotadoError(
+                f"Espera de {espera:.1f}s para nova tentativa excede o prazo restante ({max(restante, 0):.1f}s)"
+            )
+        with span("backoff", "backoff", segundos=round(espera, 3)):
+            await asyncio.sleep(espera)
+    
     async def _make_request(self, endpoint: str) -> Dict[str, Any]:
         """Faz requisição para API do SERPRO"""
-        max_retries = settings.max_retries
+        max_retries = _max_tentativas.get() or settings.max_retries
+        familia = familia_endpoint(endpoint)
+        breaker = circuit_breakers.obter(endpoint)
         
         for attempt in range(max_retries):
+            if attempt:
+                serpro_retentativas.inc(familia)
             try:
-                token = await self._get_oauth_token()
+                restante = tempo_restante()
+                if restante is not None and restante <= 0:
+                    raise PrazoEsgotadoError(f"Prazo da consulta esgotado antes da tentativa {attempt + 1}")
+                
+                with span("token", "token"):
+                    token = await self._get_oauth_token()
+                
+                # Circuito aberto: falha na hora, sem gastar chamada nem esperar backoff
+                breaker.verificar()
+                
                 url = f"{self.base_url}{endpoint}"
                 
                 headers = {
@@ -119,40 +314,65 @@ class SerproClient:
                     "X-CPF-Procurador": self.cpf_procurador
                 }
                 
-                logger.info(f"Tentativa {attempt + 1}: GET {url}")
+                log_tentativa.info(f"Tentativa {attempt + 1}: GET {url}")
+                
+                # Cada tentativa é uma chamada cobrada: passa pelo rate limit
+                try:
+                    with span(f"{endpoint} #{attempt + 1}", "tentativa", familia=familia) as atributos:
+                        # Hedge só com o circuito fechado (no semiaberto vale uma única chamada de teste)
+                        response = await hedge_requisicoes.executar(
+                            familia, lambda: self._chamar(familia, url, headers),
+                            permitir=breaker.estado == breaker.FECHADO
+                        )
+                        atributos["status"] = response.status_code
+                except asyncio.CancelledError:
+                    breaker.registrar_cancelamento()
+                    raise
+                except PrazoEsgotadoError:
+                    # Prazo local, não falha do SERPRO: libera o teste do semiaberto sem contar falha
+                    breaker.registrar_cancelamento()
+                    raise
+                except Exception:
+                    breaker.registrar_falha()
+                    raise
+                
+                if response.status_code == 429 or response.status_code >= 500:
+                    breaker.registrar_falha()
+                else:
+                    breaker.registrar_sucesso()
                 
-                async with httpx.AsyncClient(
-                    timeout=settings.request_timeout_seconds,
-                    verify=self.ssl_context
-                ) as client:
-                    response = await client.get(url, headers=headers)
-                    
-                    if response.status_code == 200:
-                        logger.success(f"Consulta bem-sucedida: {endpoint}")
-                        return response.json()
-                    elif response.status_code == 404:
-                        logger.warning(f"📋 API não encontrada: {endpoint} - Verifique se tem acesso ou se a procuração está válida")
-                        return {"status": "not_found", "error": "API não encontrada ou sem acesso", "data": None}
-                    elif response.status_code == 403:
-                        logger.error(f"🚫 ACESSO NEGADO: {endpoint} - Procuração pode estar EXPIRADA!")
-                        return {"status": "forbidden", "error": "Acesso negado - Procuração expirada", "data": None}
-                    elif response.status_code == 401:
-                        logger.warning("Token inválido, limpando cache...")
-                        token_cache.clear()
-                        if attempt < max_retries - 1:
-                            continue
-                        raise Exception("Erro de autenticação")
-                    else:
-                        logger.error(f"Erro API: {response.status_code} - {response.text}")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                            continue
-                        raise Exception(f"Erro API: {response.status_code}")
-                        
+                if response.status_code == 200:
+                    log_tentativa.success(f"Consulta bem-sucedida: {endpoint}")
+                    return response.json()
+                elif response.status_code == 404:
+                    logger.warning(f"📋 API não encontrada: {endpoint} - Verifique se tem acesso ou se a procuração está válida")
+                    return {"status": "not_found", "error": "API não encontrada ou sem acesso", "data": None}
+                elif response.status_code == 403:
+                    logger.error(f"🚫 ACESSO NEGADO: {endpoint} - Procuração pode estar EXPIRADA!")
+                    return {"status": "forbidden", "error": "Acesso negado - Procuração expirada", "data": None}
+                elif response.status_code == 401:
+                    logger.warning("Token inválido, limpando cache...")
+                    self.token_manager.invalidate(token)
+                    if attempt < max_retries - 1:
+                        continue
+                    raise Exception("Erro de autenticação")
+                else:
+                    logger.error(f"Erro API: {response.status_code} - {response.text}")
+                    if attempt < max_retries - 1:
+                        await self._aguardar_retentativa(attempt, response)  # Retry-After ou backoff com jitter
+                        continue
+                    raise Exception(f"Erro API: {response.status_code}")
+            
+            except CircuitoAbertoError as e:
+                logger.warning(f"⚡ {e}: {endpoint}")
+                raise
+            except PrazoEsgotadoError as e:
+                logger.error(f"⏱️ {e}: {endpoint}")
+                raise
             except Exception as e:
                 if attempt < max_retries - 1:
                     logger.warning(f"Tentativa {attempt + 1} falhou: {e}, tentando novamente...")
-                    await asyncio.sleep(2 ** attempt)
+                    await self._aguardar_retentativa(attempt)
                 else:
                     logger.error(f"Todas as tentativas falharam para {endpoint}: {e}")
                     raise
@@ -184,30 +404,181 @@ class SerproClient:
         """Consulta procurações ativas"""
         return await self._make_request(f"/procuracoes/{cnpj}")
     
-    async def consultar_todas_apis(self, cnpj: str) -> Dict[str, Dict[str, Any]]:
-        """Consulta todas as APIs em paralelo"""
-        logger.info(f"Iniciando consulta completa para CNPJ: {cnpj}")
+    async def _executar_chamada(
+        self, nome: str, chamada: Awaitable[Dict[str, Any]], timeout: float
+    ) -> Tuple[Dict[str, Any], float]:
+        """Executa uma chamada com timeout próprio e mede a latência"""
+        inicio = time.perf_counter()
+        try:
+            # O prazo vale para a tarefa criada pelo wait_for (ela copia o contexto)
+            with span(nome, "api"), prazo_consulta(timeout):
+                resultado = await asyncio.wait_for(chamada, timeout=timeout)
+            log_tentativa.info(f"✅ {nome}: OK")
+        except asyncio.TimeoutError:
+            logger.error(f"⏱️ {nome}: timeout após {timeout}s")
+            resultado = {"status": "error", "error": f"Timeout após {timeout}s"}
+        except Exception as e:
+            logger.error(f"❌ {nome}: {e}")
+            resultado = {"status": "error", "error": str(e)}
+        return resultado, (time.perf_counter() - inicio) * 1000
+    
+    async def _fan_out(
+        self,
+        chamadas: Dict[str, Awaitable[Dict[str, Any]]],
+        timeout_por_chamada: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Dispara as chamadas concorrentemente e devolve resultados parciais
         
-        # Executar todas as consultas em paralelo
+        Cada chamada tem seu próprio timeout; o deadline (ou o que resta do
+        prazo da consulta) limita a rodada inteira. Chamadas que falham ou estouram o prazo viram
+        {"status": "error"} sem derrubar as demais. As latências por API
+        ficam em resultados["_meta"].
+        """
+        timeout_por_chamada = timeout_por_chamada or settings.api_timeout_seconds
+        deadline = deadline or settings.consulta_deadline_seconds
+        restante = tempo_restante()
+        if restante is not None:
+            deadline = max(min(deadline, restante), 0.0)
+        
+        inicio = time.perf_counter()
         tasks = {
-            "pgmei_divida": self.consultar_pgmei_divida_ativa(cnpj),
-            "pgdasd_declaracoes": self.consultar_pgdasd_declaracoes(cnpj),
-            "ccmei_dados": self.consultar_ccmei_dados(cnpj),
-            "ccmei_situacao": self.consultar_ccmei_situacao_cadastral(cnpj),
-            "caixa_postal": self.consultar_caixa_postal(cnpj),
-            "procuracoes": self.consultar_procuracoes(cnpj)
+            nome: asyncio.ensure_future(self._executar_chamada(nome, chamada, timeout_por_chamada))
+            for nome, chamada in chamadas.items()
         }
         
-        resultados = {}
-        for nome, task in tasks.items():
+        resultados: Dict[str, Dict[str, Any]] = {}
+        latencias: Dict[str, float] = {}
+        if tasks:
             try:
-                resultados[nome] = await task
-                logger.info(f"✅ {nome}: OK")
-            except Exception as e:
-                logger.error(f"❌ {nome}: {e}")
-                resultados[nome] = {"status": "error", "error": str(e)}
+                await asyncio.wait(tasks.values(), timeout=deadline)
+            except asyncio.CancelledError:
+                # Consulta cancelada (ex.: cliente desconectou): não deixa chamadas órfãs
+                for task in tasks.values():
+                    task.cancel()
+                raise
+        
+        for nome, task in tasks.items():
+            if task.done():
+                resultados[nome], latencias[nome] = task.result()
+            else:
+                task.cancel()
+                logger.error(f"⏱️ {nome}: cancelada pelo deadline de {deadline}s")
+                resultados[nome] = {"status": "error", "error": f"Deadline de {deadline}s excedido"}
+                latencias[nome] = deadline * 1000
+        
+        falhas = [nome for nome, r in resultados.items() if r.get("status") == "error"]
+        resultados["_meta"] = {
+            "latencias_ms": {nome: round(ms, 1) for nome, ms in latencias.items()},
+            "duracao_total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "falhas": falhas
+        }
+        return resultados
+    
+    def _metodos_api(self) -> Dict[str, Callable[[str], Awaitable[Dict[str, Any]]]]:
+        return {
+            "pgmei_divida": self.consultar_pgmei_divida_ativa,
+            "pgdasd_declaracoes": self.consultar_pgdasd_declaracoes,
+            "ccmei_dados": self.consultar_ccmei_dados,
+            "ccmei_situacao": self.consultar_ccmei_situacao_cadastral,
+            "caixa_postal": self.consultar_caixa_postal,
+            "procuracoes": self.consultar_procuracoes
+        }
+    
+    async def _consultar_rodada(
+        self, cnpj: str, nomes: List[str], force: bool, deadline: Optional[float] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Uma rodada do plano: respostas frescas do cache + fan-out das demais"""
+        metodos = self._metodos_api()
+        consultas = {nome: metodos[nome] for nome in nomes}
+        
+        cacheados = {}
+        if not force:
+            for nome in list(consultas):
+                entrada = response_cache.get(nome, cnpj)
+                if entrada:
+                    cacheados[nome] = entrada
+                    del consultas[nome]
+        
+        # Executar as consultas restantes em paralelo
+        resultados = await self._fan_out(
+            {nome: metodo(cnpj) for nome, metodo in consultas.items()}, deadline=deadline
+        )
+        
+        consultado_em = datetime.now()
+        for nome in consultas:
+            response_cache.put(nome, cnpj, resultados[nome], consultado_em)
+            arquivo_payloads.registrar(cnpj, nome, resultados[nome], consultado_em)
+        for nome, (_, payload) in cacheados.items():
+            resultados[nome] = payload
+        
+        meta = resultados["_meta"]
+        meta["cache_hits"] = list(cacheados)
+        meta["obtido_em"] = {nome: obtido_em for nome, (obtido_em, _) in cacheados.items()}
+        return resultados
+    
+    async def _consultar_plano(
+        self, cnpj: str, force: bool, apis: Optional[Iterable[str]], secoes: Optional[Iterable[str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """APIs principais numa rodada; fallbacks das vazias numa segunda, no prazo restante"""
+        if apis is not None:
+            primarias = list(apis)
+        else:
+            primarias = [SECAO_API[secao] for secao in (secoes or SECAO_API)]
+        resultados = await self._consultar_rodada(cnpj, primarias, force)
+        meta = resultados["_meta"]
+        
+        fallbacks = [
+            FALLBACK_API[nome] for nome in primarias
+            if nome in FALLBACK_API and FALLBACK_API[nome] not in primarias and resposta_vazia(resultados.get(nome))
+        ]
+        restante = tempo_restante()
+        if fallbacks and restante > 0:
+            extra = await self._consultar_rodada(cnpj, fallbacks, force, deadline=restante)
+            meta_extra = extra.pop("_meta")
+            resultados.update(extra)
+            meta["latencias_ms"].update(meta_extra["latencias_ms"])
+            meta["falhas"] += meta_extra["falhas"]
+            meta["cache_hits"] += meta_extra["cache_hits"]
+            meta["obtido_em"].update(meta_extra["obtido_em"])
+            meta["duracao_total_ms"] = round(meta["duracao_total_ms"] + meta_extra["duracao_total_ms"], 1)
+        meta["fallbacks"] = fallbacks
+        return resultados
+    
+    async def consultar_todas_apis(
+        self,
+        cnpj: str,
+        force: bool = False,
+        apis: Optional[Iterable[str]] = None,
+        secoes: Optional[Iterable[str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Consulta em paralelo as APIs do plano de chamadas
+        
+        Sem `secoes` nem `apis`, consulta a API principal de todas as seções;
+        `secoes` restringe às seções pedidas e `apis` escolhe as APIs
+        diretamente. Fallbacks (situação cadastral do CCMEI) só são chamados
+        numa segunda rodada, quando a API principal não trouxe dados.
+        
+        APIs com resposta ainda fresca no cache não são chamadas (force=True ignora
+        o cache). As respostas vindas do cache e a data em que foram obtidas ficam
+        em resultados["_meta"]["cache_hits"] e ["obtido_em"].
+        """
+        logger.info(f"Iniciando consulta completa para CNPJ: {cnpj}")
+        with consultas_em_andamento.em_andamento(), consulta_segundos.medir(), \
+                prazo_consulta(settings.consulta_deadline_seconds):
+            resultados = await self._consultar_plano(cnpj, force, apis, secoes)
         
-        logger.success(f"Consulta completa finalizada para CNPJ: {cnpj}")
+        meta = resultados["_meta"]
+        if meta["latencias_ms"]:
+            mais_lenta = max(meta["latencias_ms"], key=meta["latencias_ms"].get)
+            detalhe = f"mais lenta: {mais_lenta} {meta['latencias_ms'][mais_lenta]}ms, "
+        else:
+            detalhe = ""
+        logger.success(
+            f"Consulta completa finalizada para CNPJ: {cnpj} em {meta['duracao_total_ms']}ms "
+            f"({detalhe}falhas: {len(meta['falhas'])}, cache: {len(meta['cache_hits'])}, "
+            f"fallbacks: {len(meta['fallbacks'])})"
+        )
         return resultados
 
 
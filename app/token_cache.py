@@ -1,72 +1,187 @@
 import json
+import os
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 from loguru import logger
 
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+
+class _FileLock:
+    """Lock consultivo (flock) em arquivo, compartilhado entre processos do host"""
+    
+    def __init__(self, path: Path, exclusive: bool = True):
+        self.path = path
+        self.exclusive = exclusive
+        self._fd: Optional[int] = None
+    
+    def acquire(self) -> "_FileLock":
+        if fcntl is None:
+            return self
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+        return self
+    
+    def try_acquire(self) -> bool:
+        """Tenta adquirir sem bloquear; False se outro processo já segura o lock"""
+        if fcntl is None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._fd, (fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        except OSError:
+            os.close(self._fd)
+            self._fd = None
+            return False
+        return True
+    
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
 
 class TokenCache:
-    """Cache simples para tokens OAuth em arquivo local"""
+    """Cache simples para tokens OAuth em arquivo local
+    
+    O arquivo é compartilhado entre os workers do uvicorn no mesmo host:
+    gravações são atômicas (arquivo temporário + os.replace) e protegidas por
+    lock consultivo, e lock_renovacao() garante que só um worker por vez
+    busque um novo token no SERPRO.
+    """
     
     def __init__(self, cache_file: str = "token_cache.json"):
         self.cache_file = Path(cache_file)
+    
+    @property
+    def _lock_file(self) -> Path:
+        return self.cache_file.with_name(self.cache_file.name + ".lock")
+    
+    @property
+    def _refresh_lock_file(self) -> Path:
+        return self.cache_file.with_name(self.cache_file.name + ".refresh.lock")
+    
+    @contextmanager
+    def _lock(self, exclusive: bool):
+        lock = _FileLock(self._lock_file, exclusive=exclusive).acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+    
+    def lock_renovacao(self) -> _FileLock:
+        """Adquire (bloqueando) o lock de renovação entre workers
+        
+        Quem segura o lock deve reler o cache antes de buscar um novo token:
+        outro worker pode ter acabado de renová-lo.
+        """
+        return _FileLock(self._refresh_lock_file, exclusive=True).acquire()
+    
+    def _read(self) -> Optional[dict]:
+        """Lê o arquivo de cache sob lock compartilhado"""
+        with self._lock(exclusive=False):
+            if not self.cache_file.exists():
+                return None
+            return json.loads(self.cache_file.read_text(encoding="utf-8"))
+    
+    def load(self) -> Optional[Tuple[str, datetime]]:
+        """Recupera token e expiração do arquivo, sem validar"""
+        try:
+            data = self._read()
+            if not data:
+                return None
+            return data["token"], datetime.fromisoformat(data["expires_at"])
         
+        except Exception as e:
+            logger.warning(f"Erro ao ler cache de token: {e}")
+            return None
+    
     def get_token(self) -> Optional[str]:
         """Recupera token do cache se ainda válido"""
         try:
-            if not self.cache_file.exists():
+            data = self._read()
+            if not data:
                 return None
             
-            data = json.loads(self.cache_file.read_text(encoding="utf-8"))
-            
             # Verificar se ainda é válido (margem de 5 minutos)
+            # O arquivo não é removido: outro worker pode estar renovando
             expires_at = datetime.fromisoformat(data["expires_at"])
             if datetime.now() + timedelta(minutes=5) >= expires_at:
-                logger.info("Token expirado no cache, removendo...")
-                self._clear_cache()
+                logger.info("Token expirado no cache")
                 return None
-                
+            
             logger.info("Token válido encontrado no cache")
             return data["token"]
-            
+        
         except Exception as e:
             logger.warning(f"Erro ao ler cache de token: {e}")
-            self._clear_cache()
             return None
     
     def save_token(self, token: str, expires_in: int):
-        """Salva token no cache com expiração"""
+        """Salva token no cache com expiração (substituição atômica)"""
         try:
             expires_at = datetime.now() + timedelta(seconds=expires_in)
             
             data = {
                 "token": token,
                 "expires_at": expires_at.isoformat(),
-                "created_at": datetime.now().isoformat()
+                "created_at": datetime.now().isoformat(),
+                "pid": os.getpid()
             }
             
             # Criar diretório se não existir
             self.cache_file.parent.mkdir(parents=True, exist_ok=True)
             
-            self.cache_file.write_text(json.dumps(data, indent=2), encoding="utf-8")
+            with self._lock(exclusive=True):
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=str(self.cache_file.parent), prefix=self.cache_file.name, suffix=".tmp"
+                )
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+                        json.dump(data, tmp, indent=2)
+                        tmp.flush()
+                        os.fsync(tmp.fileno())
+                    os.replace(tmp_path, self.cache_file)
+                except Exception:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                    raise
             logger.info(f"Token salvo no cache, expira em: {expires_at}")
-            
+        
         except Exception as e:
             logger.error(f"Erro ao salvar token no cache: {e}")
     
-    def _clear_cache(self):
-        """Remove arquivo de cache"""
+    def _clear_cache(self, token: Optional[str] = None):
+        """Remove arquivo de cache (apenas se ainda contiver o token informado)"""
         try:
-            if self.cache_file.exists():
+            with self._lock(exclusive=True):
+                if not self.cache_file.exists():
+                    return
+                if token is not None:
+                    try:
+                        data = json.loads(self.cache_file.read_text(encoding="utf-8"))
+                        if data.get("token") != token:
+                            return  # Outro worker já gravou um token novo
+                    except ValueError:
+                        pass
                 self.cache_file.unlink()
                 logger.info("Cache de token limpo")
         except Exception as e:
             logger.error(f"Erro ao limpar cache: {e}")
     
-    def clear(self):
+    def clear(self, token: Optional[str] = None):
         """Método público para limpar cache"""
-        self._clear_cache()
+        self._clear_cache(token)
 
 
 # Instância global do cache
-token_cache = TokenCache() 
\ No newline at end of file
+token_cache = TokenCache()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from loguru import logger
+
+from app.config import settings
+from app.metricas import serpro_token_segundos
+from app.token_cache import TokenCache
+
+
+# Mesma margem usada pelo TokenCache para considerar o token expirado
+MARGEM_EXPIRACAO = timedelta(minutes=5)
+
+# Fração máxima da validade do token usada como margem (tokens de vida curta)
+FRACAO_MAXIMA_MARGEM = 0.2
+
+# Espera mínima do loop de renovação enquanto há token (evita loop apertado)
+ESPERA_MINIMA_RENOVACAO = 5.0
+
+
+class TokenManager:
+    """Gerenciador do token OAuth2 em memória
+    
+    - O token fica em memória; o TokenCache (arquivo) é só persistência opcional
+    - Apenas uma renovação por vez (single-flight): quem chega durante a
+      renovação aguarda o mesmo resultado
+    - Uma tarefa em background renova o token antes da margem de expiração
+    """
+    
+    def __init__(
+        self,
+        fetcher: Callable[[], Awaitable[Tuple[str, int]]],
+        persistencia: Optional[TokenCache] = None
+    ):
+        self._fetcher = fetcher
+        self._persistencia = persistencia
+        self._token: Optional[str] = None
+        self._expires_at: Optional[datetime] = None
+        self._validade: Optional[float] = None  # Segundos de vida do token (expires_in)
+        self._renovacao: Optional[asyncio.Future] = None
+        self._tarefa_background: Optional[asyncio.Task] = None
+        self._stats = {
+            "cache_hits": 0, "renovacoes": 0, "falhas_renovacao": 0,
+            "invalidacoes": 0, "renovacoes_compartilhadas": 0
+        }
+    
+    def _token_valido(self) -> bool:
+        """Token em memória ainda fora da margem de expiração"""
+        return (
+            self._token is not None
+            and self._expires_at is not None
+            and datetime.now() + self._margem(MARGEM_EXPIRACAO) < self._expires_at
+        )
+    
+    def _margem(self, margem: timedelta) -> timedelta:
+        """Margem limitada a uma fração da validade: com expires_in curto o token ainda é usado"""
+        if self._validade is None:
+            return margem
+        return min(margem, timedelta(seconds=self._validade * FRACAO_MAXIMA_MARGEM))
+    
+    def _carregar_persistido(self):
+        """Carrega o token do TokenCache para a memória, se for mais novo"""
+        if self._persistencia is None:
+            return
+        dados = self._persistencia.load()
+        if dados and (self._expires_at is None or dados[1] > self._expires_at):
+            self._token, self._expires_at = dados
+            if self._validade is None:
+                # O arquivo não guarda o expires_in: o que resta é o limite inferior da validade
+                self._validade = max((self._expires_at - datetime.now()).total_seconds(), 0)
+    
+    async def get_token(self) -> str:
+        """Retorna o token válido, renovando (uma única vez) se necessário"""
+        if self._token_valido():
+            self._stats["cache_hits"] += 1
+            return self._token
+        
+        # Outro processo pode ter renovado e persistido o token
+        self._carregar_persistido()
+        if self._token_valido():
+            self._stats["cache_hits"] += 1
+            return self._token
+        
+        return await self.refresh()
+    
+    async def refresh(self) -> str:
+        """Renova o token; chamadas concorrentes compartilham a mesma renovação"""
+        if self._renovacao is None or self._renovacao.done():
+            self._renovacao = asyncio.ensure_future(self._renovar())
+        # shield: o cancelamento de um aguardante não cancela a renovação dos demais
+        return await asyncio.shield(self._renovacao)
+    
+    async def _renovar(self) -> str:
+        """Busca um novo token no SERPRO e atualiza memória e persistência"""
+        if self._persistencia is None:
+            return await self._buscar_token()
+        
+        # Lock entre workers: só um processo do host busca token por vez
+        loop = asyncio.get_event_loop()
+        lock = await loop.run_in_executor(None, self._persistencia.lock_renovacao)
+        try:
+            # Outro worker pode ter renovado enquanto aguardávamos o lock
+            self._carregar_persistido()
+            if self._token_valido() and self._segundos_ate_renovar() > 0:
+                self._stats["renovacoes_compartilhadas"] += 1
+                logger.info("🔑 Token renovado por outro worker, reaproveitando")
+                return self._token
+            return await self._buscar_token()
+        finally:
+            lock.release()
+    
+    async def _buscar_token(self) -> str:
+        """Solicita o token ao SERPRO via fetcher"""
+        inicio = time.perf_counter()
+        try:
+            token, expires_in = await self._fetcher()
+        except Exception:
+            self._stats["falhas_renovacao"] += 1
+            serpro_token_segundos.observe(time.perf_counter() - inicio, "erro")
+            raise
+        serpro_token_segundos.observe(time.perf_counter() - inicio, "ok")
+        
+        self._token = token
+        self._expires_at = datetime.now() + timedelta(seconds=expires_in)
+        self._validade = expires_in
+        self._stats["renovacoes"] += 1
+        
+        if self._persistencia is not None:
+            self._persistencia.save_token(token, expires_in)
+        
+        logger.info(f"🔑 Token renovado, expira em: {self._expires_at}")
+        return token
+    
+    def invalidate(self, token: Optional[str] = None):
+        """Descarta o token (ex.: resposta 401)
+        
+        Se o token informado já foi substituído por outra renovação, nada é feito,
+        evitando que várias respostas 401 simultâneas disparem várias renovações.
+        """
+        if token is not None and token != self._token:
+            return
+        self._token = None
+        self._expires_at = None
+        self._stats["invalidacoes"] += 1
+        if self._persistencia is not None:
+            # Só remove do arquivo se outro worker ainda não gravou um token novo
+            self._persistencia.clear(token)
+    
+    def _segundos_ate_renovar(self) -> float:
+        """Tempo até a renovação proativa (antes da margem de expiração)"""
+        if self._expires_at is None:
+            return 0
+        renovar_em = self._expires_at - self._margem(timedelta(seconds=settings.token_refresh_margin_seconds))
+        return max((renovar_em - datetime.now()).total_seconds(), 0)
+    
+    async def _loop_renovacao(self):
+        """Renova o token em background para nenhuma requisição esperar pelo OAuth"""
+        while True:
+            try:
+                espera = self._segundos_ate_renovar()
+                if self._expires_at is not None:
+                    espera = max(espera, ESPERA_MINIMA_RENOVACAO)
+                await asyncio.sleep(espera)
+                # Outro worker pode ter renovado antes de nós
+                self._carregar_persistido()
+                if self._segundos_ate_renovar() > 0:
+                    continue
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro na renovação proativa do token: {e}")
+                await asyncio.sleep(settings.token_refresh_retry_seconds)
+    
+    async def start(self):
+        """Carrega o token persistido e inicia a renovação em background"""
+        self._carregar_persistido()
+        if self._tarefa_background is None or self._tarefa_background.done():
+            self._tarefa_background = asyncio.ensure_future(self._loop_renovacao())
+            logger.info("🔑 Renovação proativa de token iniciada")
+    
+    async def close(self):
+        """Para a renovação em background"""
+        if self._tarefa_background is not None:
+            self._tarefa_background.cancel()
+            try:
+                await self._tarefa_background
+            except asyncio.CancelledError:
+                pass
+            self._tarefa_background = None
+    
+    def status(self) -> Dict[str, Any]:
+        """Estado do token para monitoramento"""
+        return {
+            "valido": self._token_valido(),
+            "expira_em": self._expires_at.isoformat() if self._expires_at else None,
+            "renovacao_em_andamento": self._renovacao is not None and not self._renovacao.done(),
+            **self._stats
+        }
@@ -0,0 +1,248 @@
+"""Teste de carga do POST /consultar contra o simulador SERPRO
+
+Uso (na raiz do projeto; não usa o .env nem o SERPRO real):
+    python -m benchmarks.carga --concorrencias 1,8,32 --segundos 20
+    python -m benchmarks.carga --cenario erros --comparar benchmarks/resultados/base.json
+
+Sobe o simulador (benchmarks/serpro_simulado.py) em outro processo, aponta a
+aplicação para ele (SERPRO_AMBIENTE=simulado, banco SQLite temporário) e
+dispara POST /consultar/{cnpj}?force=true com N clientes simultâneos por
+nível de concorrência. Relata latência p50/p95/p99, consultas por segundo,
+chamadas SERPRO por consulta e tempo de gravação no banco. O resultado vai
+para benchmarks/resultados/ em JSON; --comparar aponta regressões em relação
+a uma execução anterior (código de saída 1).
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.serpro_simulado import ConfigSimulador, LatenciaSimulada, servir
+
+DIRETORIO_RESULTADOS = Path(__file__).parent / "resultados"
+
+# Cenários prontos do simulador
+CENARIOS = {
+    "normal": ConfigSimulador(),
+    "lento": ConfigSimulador(latencia=LatenciaSimulada(mediana_ms=800, p95_ms=4000)),
+    "erros": ConfigSimulador(taxa_500=0.02, taxa_429=0.02, taxa_403=0.01, taxa_401=0.01, taxa_404=0.02),
+    "payload_grande": ConfigSimulador(payload_kb=64),
+}
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _iniciar_simulador(config: ConfigSimulador, porta: int) -> multiprocessing.Process:
+    """Simulador em outro processo (não disputa o event loop medido) e espera ficar pronto"""
+    processo = multiprocessing.Process(target=servir, args=(config, porta), daemon=True)
+    processo.start()
+    limite = time.monotonic() + 15
+    while time.monotonic() < limite:
+        try:
+            httpx.get(f"http://127.0.0.1:{porta}/_simulador/stats", timeout=1)
+            return processo
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    processo.terminate()
+    raise RuntimeError("Simulador SERPRO não respondeu")
+
+
+def _configurar_ambiente(porta: int, diretorio: str, args: argparse.Namespace):
+    """Configuração da aplicação (antes de importar app.*: Settings lê o ambiente na importação)"""
+    os.environ.update({
+        "SERPRO_CONSUMER_KEY": "benchmark",
+        "SERPRO_CONSUMER_SECRET": "benchmark",
+        "CERTIFICADO_SENHA": "benchmark",
+        "CPF_PROCURADOR": "00000000000",
+        "SERPRO_AMBIENTE": "simulado",
+        "SERPRO_BASE_URL": f"http://127.0.0.1:{porta}",
+        "SERPRO_TOKEN_URL": f"http://127.0.0.1:{porta}/token",
+        "DATABASE_URL": f"sqlite:///{os.path.join(diretorio, 'carga.db')}",
+        "SQLITE_PERFIL": args.sqlite_perfil,
+        "LOG_FILE": os.path.join(diretorio, "carga.log"),
+        "LOG_LEVEL": "WARNING",
+        "TOKEN_PERSIST": "false",
+        "CACHE_ENABLED": "true" if args.cache else "false",
+        "AGENDADOR_ENABLED": "false",
+    })
+    if not args.rate_limit:
+        # Mede a aplicação, não o limite configurado para o SERPRO real
+        os.environ.update({"RATE_LIMIT_GLOBAL_RPS": "0", "RATE_LIMIT_FAMILIA_PADRAO_RPS": "0"})
+
+
+def _percentil(valores: List[float], p: int) -> float:
+    if len(valores) < 2:
+        return round(valores[0], 1) if valores else 0.0
+    return round(statistics.quantiles(valores, n=100)[p - 1], 1)
+
+
+async def _nivel(
+    cliente: httpx.AsyncClient, simulador: httpx.AsyncClient, cnpjs: List[str], concorrencia: int, segundos: float
+) -> Dict[str, Any]:
+    """Um nível de concorrência: `concorrencia` clientes em laço fechado por `segundos`"""
+    from app.gravador import gravador_clientes
+    
+    await simulador.post("/_simulador/reset")
+    lotes, tempo_gravacao = gravador_clientes.lotes, gravador_clientes.tempo_gravacao
+    latencias: List[float] = []
+    erros = 0
+    fim = time.perf_counter() + segundos
+    
+    async def usuario():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.post(f"/consultar/{random.choice(cnpjs)}", params={"force": "true"})
+                if not resposta.json().get("success"):
+                    erros += 1
+            except Exception:
+                erros += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+    
+    inicio = time.perf_counter()
+    await asyncio.gather(*[usuario() for _ in range(concorrencia)])
+    duracao = time.perf_counter() - inicio
+    
+    chamadas = (await simulador.get("/_simulador/stats")).json()
+    lotes_nivel = gravador_clientes.lotes - lotes
+    return {
+        "concorrencia": concorrencia,
+        "consultas": len(latencias),
+        "erros": erros,
+        "consultas_por_s": round(len(latencias) / duracao, 2),
+        "p50_ms": _percentil(latencias, 50),
+        "p95_ms": _percentil(latencias, 95),
+        "p99_ms": _percentil(latencias, 99),
+        "chamadas_serpro_por_consulta": round(chamadas["chamadas"] / len(latencias), 2) if latencias else 0.0,
+        "chamadas_por_status": chamadas["por_api"],
+        "gravacao_ms_por_lote": round(1000 * (gravador_clientes.tempo_gravacao - tempo_gravacao) / lotes_nivel, 2)
+        if lotes_nivel else 0.0,
+        "lotes_gravados": lotes_nivel,
+    }
+
+
+async def _executar(args: argparse.Namespace, porta: int) -> List[Dict[str, Any]]:
+    from loguru import logger
+    logger.remove()  # Só o arquivo de log da aplicação: o console fica com o relatório
+    from app.main import app, shutdown_event, startup_event
+    
+    cnpjs = [f"{i:08d}0001{i % 100:02d}" for i in range(1, args.cnpjs + 1)]
+    await startup_event()
+    try:
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente, \
+                httpx.AsyncClient(base_url=f"http://127.0.0.1:{porta}") as simulador:
+            # Aquecimento: token OAuth, pool HTTP e tabelas
+            await cliente.post(f"/consultar/{cnpjs[0]}", params={"force": "true"})
+            niveis = []
+            for concorrencia in args.concorrencias:
+                nivel = await _nivel(cliente, simulador, cnpjs, concorrencia, args.segundos)
+                niveis.append(nivel)
+                _imprimir_nivel(nivel)
+            return niveis
+    finally:
+        await shutdown_event()
+
+
+def _imprimir_nivel(nivel: Dict[str, Any]):
+    print(
+        f"{nivel['concorrencia']:>5} {nivel['consultas_por_s']:>11} {nivel['p50_ms']:>9} {nivel['p95_ms']:>9} "
+        f"{nivel['p99_ms']:>9} {nivel['chamadas_serpro_por_consulta']:>13} {nivel['gravacao_ms_por_lote']:>13} "
+        f"{nivel['erros']:>6}"
+    )
+
+
+def comparar(atual: Dict[str, Any], base: Dict[str, Any], tolerancia: float) -> List[str]:
+    """Regressões de p95 e vazão por nível de concorrência em relação à execução base"""
+    regressoes = []
+    base_por_nivel = {nivel["concorrencia"]: nivel for nivel in base["niveis"]}
+    print(f"\nComparação com {base['data']} (cenário {base['cenario']}):")
+    for nivel in atual["niveis"]:
+        anterior = base_por_nivel.get(nivel["concorrencia"])
+        if anterior is None:
+            continue
+        variacao_p95 = nivel["p95_ms"] / anterior["p95_ms"] - 1 if anterior["p95_ms"] else 0.0
+        variacao_vazao = nivel["consultas_por_s"] / anterior["consultas_por_s"] - 1 if anterior["consultas_por_s"] else 0.0
+        alerta = ""
+        if variacao_p95 > tolerancia or variacao_vazao < -tolerancia:
+            alerta = "  ⚠️ regressão"
+            regressoes.append(f"concorrência {nivel['concorrencia']}")
+        print(
+            f"  concorrência {nivel['concorrencia']:>3}: p95 {anterior['p95_ms']} -> {nivel['p95_ms']}ms "
+            f"({variacao_p95:+.1%}), vazão {anterior['consultas_por_s']} -> {nivel['consultas_por_s']}/s "
+            f"({variacao_vazao:+.1%}){alerta}"
+        )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concorrencias", default="1,8,32", help="Níveis de concorrência, separados por vírgula")
+    parser.add_argument("--segundos", type=float, default=15.0, help="Duração de cada nível")
+    parser.add_argument("--cnpjs", type=int, default=1000, help="CNPJs distintos sorteados")
+    parser.add_argument("--cenario", choices=sorted(CENARIOS), default="normal")
+    parser.add_argument("--config", help="JSON com a ConfigSimulador (substitui o cenário)")
+    parser.add_argument("--cache", action="store_true", help="Mantém o cache de respostas habilitado")
+    parser.add_argument("--rate-limit", action="store_true", help="Mantém os limites de taxa padrão")
+    parser.add_argument("--sqlite-perfil", default="padrao", choices=["padrao", "producao"])
+    parser.add_argument("--saida", help="Arquivo do resultado (padrão: benchmarks/resultados/carga-<data>.json)")
+    parser.add_argument("--comparar", help="Resultado anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="Piora aceita no p95 e na vazão")
+    args = parser.parse_args()
+    args.concorrencias = [int(c) for c in args.concorrencias.split(",")]
+    
+    config = ConfigSimulador.parse_file(args.config) if args.config else CENARIOS[args.cenario]
+    porta = _porta_livre()
+    simulador = _iniciar_simulador(config, porta)
+    diretorio = tempfile.mkdtemp(prefix="bench_carga_")
+    _configurar_ambiente(porta, diretorio, args)
+    
+    print(f"{'conc.':>5} {'consultas/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'serpro/cons.':>13} {'gravação ms':>13} {'erros':>6}")
+    try:
+        niveis = asyncio.run(_executar(args, porta))
+    finally:
+        simulador.terminate()
+    
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "cenario": "config" if args.config else args.cenario,
+        "config_simulador": json.loads(config.json()),
+        "parametros": {
+            "segundos": args.segundos,
+            "cnpjs": args.cnpjs,
+            "cache": args.cache,
+            "rate_limit": args.rate_limit,
+            "sqlite_perfil": args.sqlite_perfil,
+        },
+        "niveis": niveis,
+    }
+    saida = Path(args.saida) if args.saida else DIRETORIO_RESULTADOS / f"carga-{datetime.now():%Y%m%d-%H%M%S}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print(f"\nResultado salvo em {saida}")
+    
+    if args.comparar:
+        base = json.loads(Path(args.comparar).read_text())
+        if comparar(resultado, base, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Simulador local do gateway SERPRO (token + as seis APIs do SerproClient)
+
+Uso (na raiz do projeto):
+    python -m benchmarks.serpro_simulado --porta 8900 --mediana-ms 300 --p95-ms 1500 --taxa-429 0.02
+
+Responde como o Integra Contador, sem cobrança nem procuração: latência
+sorteada por API (fixa, uniforme ou lognormal), injeção de 500/429/403/401/404
+e payloads com o tamanho configurado. Os dados de cada CNPJ são
+determinísticos (mesmo CNPJ, mesma resposta). Contagem de chamadas por API e
+status em GET /_simulador/stats (POST /_simulador/reset zera).
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Endpoint de cada API do SerproClient
+ROTAS_API = {
+    "pgmei_divida": "/pgmei/divida-ativa/{cnpj}",
+    "pgdasd_declaracoes": "/pgdasd/declaracoes/{cnpj}",
+    "ccmei_dados": "/ccmei/dados/{cnpj}",
+    "ccmei_situacao": "/ccmei/situacao-cadastral/{cnpj}",
+    "caixa_postal": "/caixa-postal/mensagens/{cnpj}",
+    "procuracoes": "/procuracoes/{cnpj}",
+}
+
+
+class LatenciaSimulada(BaseModel):
+    """Distribuição da latência: "fixa" (mediana), "uniforme" (min..max) ou "lognormal" (mediana, p95)"""
+    distribuicao: str = "lognormal"
+    mediana_ms: float = 300.0
+    p95_ms: float = 1200.0
+    min_ms: float = 50.0
+    max_ms: float = 1000.0
+    
+    def sortear(self, rng: random.Random) -> float:
+        """Latência em segundos"""
+        if self.distribuicao == "fixa":
+            return self.mediana_ms / 1000
+        if self.distribuicao == "uniforme":
+            return rng.uniform(self.min_ms, self.max_ms) / 1000
+        sigma = math.log(max(self.p95_ms, self.mediana_ms) / self.mediana_ms) / 1.645
+        return rng.lognormvariate(math.log(self.mediana_ms), sigma) / 1000
+
+
+class ConfigSimulador(BaseModel):
+    """Comportamento do simulador (taxas de erro são probabilidades por chamada)"""
+    latencia: LatenciaSimulada = LatenciaSimulada()
+    latencia_por_api: Dict[str, LatenciaSimulada] = {}  # Ex.: {"caixa_postal": {...}}
+    latencia_token_ms: float = 100.0
+    taxa_500: float = 0.0
+    taxa_429: float = 0.0
+    taxa_403: float = 0.0
+    taxa_401: float = 0.0
+    taxa_404: float = 0.0
+    retry_after_seconds: int = 1  # Header Retry-After das respostas 429
+    payload_kb: float = 2.0  # Tamanho aproximado de cada resposta 200
+    token_expires_in: int = 3600
+    seed: Optional[int] = None
+
+
+def _dados_api(api: str, cnpj: str, payload_kb: float) -> Dict[str, Any]:
+    """Resposta 200 determinística por (API, CNPJ), no formato lido pela consolidação"""
+    rng = random.Random(f"{api}:{cnpj}")
+    if api == "pgmei_divida":
+        dados = {"dividas": [
+            {"periodo": f"2023{mes:02d}", "valor": round(rng.uniform(50, 800), 2)}
+            for mes in range(1, rng.choice([0, 0, 1, 3, 6]) + 1)
+        ]}
+    elif api == "pgdasd_declaracoes":
+        dados = {"declaracoes_pendentes": [{"ano": ano} for ano in range(2020, 2020 + rng.choice([0, 0, 0, 1, 2]))]}
+    elif api == "ccmei_dados":
+        dados = {"situacao": rng.choice(["Ativa", "Ativa", "Ativa", "Baixada"]), "data_abertura": "2019-03-15T00:00:00Z"}
+    elif api == "ccmei_situacao":
+        dados = {"situacao": "Ativa"}
+    elif api == "caixa_postal":
+        dados = {"mensagens": [{"id": i, "lida": rng.random() < 0.7} for i in range(rng.randint(0, 8))]}
+    else:
+        dados = {"procuracoes": [{"procurador": "00000000000", "ativa": rng.random() < 0.9}]}
+    
+    # Completa até o tamanho configurado (histórico, como nas respostas reais)
+    falta = int(payload_kb * 1024) - len(json.dumps(dados))
+    if falta > 0:
+        dados["historico"] = [
+            {"evento": f"registro {i}", "detalhe": "x" * 40} for i in range(falta // 70 + 1)
+        ]
+    return dados
+
+
+def criar_simulador(config: ConfigSimulador) -> FastAPI:
+    """App FastAPI que imita o gateway SERPRO"""
+    app = FastAPI(title="Simulador SERPRO")
+    rng = random.Random(config.seed)
+    chamadas: Counter = Counter()  # (api, status)
+    
+    def responder(api: str, status: int, corpo: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        chamadas[(api, status)] += 1
+        return JSONResponse(corpo, status_code=status, headers=headers)
+    
+    @app.post("/token")
+    async def token():
+        await asyncio.sleep(config.latencia_token_ms / 1000)
+        chamadas[("token", 200)] += 1
+        return {
+            "access_token": f"simulado-{rng.getrandbits(64):016x}",
+            "token_type": "Bearer",
+            "expires_in": config.token_expires_in
+        }
+    
+    def registrar_api(api: str, rota: str):
+        latencia = config.latencia_por_api.get(api, config.latencia)
+        
+        async def consultar(cnpj: str, request: Request):
+            await asyncio.sleep(latencia.sortear(rng))
+            if not request.headers.get("authorization", "").startswith("Bearer "):
+                return responder(api, 401, {"mensagem": "Token ausente"})
+            
+            sorteio = rng.random()
+            for status, taxa in ((500, config.taxa_500), (429, config.taxa_429), (403, config.taxa_403),
+                                 (401, config.taxa_401), (404, config.taxa_404)):
+                if sorteio < taxa:
+                    headers = {"Retry-After": str(config.retry_after_seconds)} if status == 429 else None
+                    return responder(api, status, {"mensagem": f"Erro simulado {status}"}, headers)
+                sorteio -= taxa
+            return responder(api, 200, _dados_api(api, cnpj, config.payload_kb))
+        
+        app.add_api_route(rota, consultar, methods=["GET"], name=api)
+    
+    for api, rota in ROTAS_API.items():
+        registrar_api(api, rota)
+    
+    @app.get("/_simulador/stats")
+    async def stats():
+        por_api: Dict[str, Dict[str, int]] = {}
+        for (api, status), total in chamadas.items():
+            por_api.setdefault(api, {})[str(status)] = total
+        return {
+            "chamadas": sum(total for (api, _), total in chamadas.items() if api != "token"),
+            "tokens": sum(total for (api, _), total in chamadas.items() if api == "token"),
+            "por_api": por_api
+        }
+    
+    @app.post("/_simulador/reset")
+    async def reset():
+        chamadas.clear()
+        return {"ok": True}
+    
+    return app
+
+
+def servir(config: ConfigSimulador, porta: int, host: str = "127.0.0.1"):
+    """Executa o simulador (bloqueante; usado também como alvo de multiprocessing)"""
+    import uvicorn
+    uvicorn.run(criar_simulador(config), host=host, port=porta, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=8900)
+    parser.add_argument("--distribuicao", choices=["fixa", "uniforme", "lognormal"], default="lognormal")
+    parser.add_argument("--mediana-ms", type=float, default=300.0)
+    parser.add_argument("--p95-ms", type=float, default=1200.0)
+    parser.add_argument("--taxa-500", type=float, default=0.0)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-403", type=float, default=0.0)
+    parser.add_argument("--taxa-401", type=float, default=0.0)
+    parser.add_argument("--taxa-404", type=float, default=0.0)
+    parser.add_argument("--payload-kb", type=float, default=2.0)
+    parser.add_argument("--config", help="JSON com a ConfigSimulador completa (sobrepõe as opções acima)")
+    args = parser.parse_args()
+    
+    if args.config:
+        config = ConfigSimulador.parse_file(args.config)
+    else:
+        config = ConfigSimulador(
+            latencia=LatenciaSimulada(distribuicao=args.distribuicao, mediana_ms=args.mediana_ms, p95_ms=args.p95_ms),
+            taxa_500=args.taxa_500, taxa_429=args.taxa_429, taxa_403=args.taxa_403,
+            taxa_401=args.taxa_401, taxa_404=args.taxa_404, payload_kb=args.payload_kb
+        )
+    print(
+        f"Simulador SERPRO em http://127.0.0.1:{args.porta} - na aplicação: SERPRO_AMBIENTE=simulado "
+        f"SERPRO_BASE_URL=http://127.0.0.1:{args.porta} SERPRO_TOKEN_URL=http://127.0.0.1:{args.porta}/token"
+    )
+    servir(config, args.porta)
+
+
+if __name__ == "__main__":
+    main()
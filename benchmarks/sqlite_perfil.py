@@ -0,0 +1,116 @@
+"""Benchmark de leitura/gravação SQLite: perfil "padrao" x "producao"
+
+Uso (na raiz do projeto, com o .env configurado):
+    python -m benchmarks.sqlite_perfil --segundos 10 --leitores 8 --escritores 2
+
+Cada perfil roda num banco temporário próprio: escritores fazem upserts de um
+registro por transação (como as consultas individuais) enquanto leitores
+buscam clientes por CNPJ, pelo engine assíncrono da aplicação.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import salvar_clientes
+from app.database import Base, _url_async, aplicar_pragmas, opcoes_engine
+from app.models import Haylander
+
+
+def _registro() -> dict:
+    return {
+        "pgmei_divida_valor": random.randint(0, 5000),
+        "pgmei_tem_divida": True,
+        "pgmei_ultimo_update": datetime.now(),
+        "situacao_geral": "PENDENCIAS",
+        "status_consulta": "SUCCESS",
+        "ultima_consulta": datetime.now(),
+    }
+
+
+async def _rodar(perfil: str, registros: int, segundos: float, leitores: int, escritores: int) -> dict:
+    caminho = os.path.join(tempfile.mkdtemp(prefix="bench_sqlite_"), "bench.db")
+    url = f"sqlite:///{caminho}"
+    
+    engine = create_engine(url, **opcoes_engine(url, perfil))
+    aplicar_pragmas(engine, perfil)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        salvar_clientes(db, {f"{i:014d}": _registro() for i in range(registros)})
+    engine.dispose()
+    
+    async_engine = create_async_engine(_url_async(url), **opcoes_engine(url, perfil))
+    aplicar_pragmas(async_engine.sync_engine, perfil)
+    Sessao = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+    
+    fim = time.perf_counter() + segundos
+    latencias_leitura, latencias_escrita = [], []
+    erros = 0
+    
+    async def leitor():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            cnpj = f"{random.randrange(registros):014d}"
+            inicio = time.perf_counter()
+            try:
+                async with Sessao() as db:
+                    (await db.execute(select(Haylander).where(Haylander.cnpj == cnpj))).scalar_one()
+                latencias_leitura.append(time.perf_counter() - inicio)
+            except Exception:
+                erros += 1
+    
+    async def escritor():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            i = random.randrange(registros * 2)
+            inicio = time.perf_counter()
+            try:
+                async with Sessao() as db:
+                    await db.run_sync(salvar_clientes, {f"{i:014d}": _registro()})
+                latencias_escrita.append(time.perf_counter() - inicio)
+            except Exception:
+                erros += 1
+    
+    await asyncio.gather(*[leitor() for _ in range(leitores)], *[escritor() for _ in range(escritores)])
+    await async_engine.dispose()
+    
+    def p95(valores):
+        return round(1000 * statistics.quantiles(valores, n=20)[-1], 2) if len(valores) > 1 else 0.0
+    
+    return {
+        "perfil": perfil,
+        "leituras_por_s": round(len(latencias_leitura) / segundos, 1),
+        "gravacoes_por_s": round(len(latencias_escrita) / segundos, 1),
+        "leitura_p95_ms": p95(latencias_leitura),
+        "gravacao_p95_ms": p95(latencias_escrita),
+        "erros": erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registros", type=int, default=5000)
+    parser.add_argument("--segundos", type=float, default=10.0)
+    parser.add_argument("--leitores", type=int, default=8)
+    parser.add_argument("--escritores", type=int, default=2)
+    args = parser.parse_args()
+    
+    print(f"{'perfil':<10} {'leituras/s':>11} {'gravações/s':>12} {'leitura p95':>12} {'gravação p95':>13} {'erros':>6}")
+    for perfil in ("padrao", "producao"):
+        r = asyncio.run(_rodar(perfil, args.registros, args.segundos, args.leitores, args.escritores))
+        print(
+            f"{r['perfil']:<10} {r['leituras_por_s']:>11} {r['gravacoes_por_s']:>12} "
+            f"{r['leitura_p95_ms']:>10}ms {r['gravacao_p95_ms']:>11}ms {r['erros']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()